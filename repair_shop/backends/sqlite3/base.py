@@ -0,0 +1,32 @@
+"""Бэкенд SQLite с выбором режима BEGIN для transaction.atomic().
+
+Повторяет параметр OPTIONS['transaction_mode'] из Django 5.1. По
+умолчанию транзакция DEFERRED: блокировка на запись берется только на
+первом изменении. Если до него транзакция успела прочитать данные, а
+базу тем временем изменил другой писатель, SQLite сразу отвечает
+«database is locked», не дожидаясь busy_timeout. BEGIN IMMEDIATE
+берет блокировку в начале транзакции, и ожидание подчиняется
+busy_timeout.
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+TRANSACTION_MODES = ('DEFERRED', 'EXCLUSIVE', 'IMMEDIATE')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        mode = kwargs.pop('transaction_mode', None)
+        if mode is not None and mode.upper() not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(
+                f'transaction_mode должен быть одним из {TRANSACTION_MODES}'
+            )
+        self.transaction_mode = mode and mode.upper()
+        return kwargs
+
+    def _start_transaction_under_autocommit(self):
+        if self.transaction_mode is None:
+            super()._start_transaction_under_autocommit()
+        else:
+            self.cursor().execute(f'BEGIN {self.transaction_mode}')
@@ -1,8 +1,17 @@
 from django.contrib import admin
+from django.utils import timezone
 
 from .models import (
-    ApplianceType, Workshop, Customer, RepairStatus, RepairOrder
+    ApplianceType, Workshop, Customer, RepairStatus, RepairOrder,
+    Notification, StatusEvent
 )
+from .admin_tools import (
+    ApproximateCountPaginator, CachedRelatedFieldListFilter, StaffListFilter
+)
+from .references import references
+from .search import build_match_query, matching_orders
+from .status_log import change_status
+from .utils import phone_search_key
 
 
 @admin.register(ApplianceType)
@@ -26,6 +35,15 @@ class CustomerAdmin(admin.ModelAdmin):
     search_fields = ('name', 'phone', 'email')
     list_filter = ('created_at',)
 
+    def get_search_results(self, request, queryset, search_term):
+        """Полный номер телефона ищется по индексу, а не через LIKE"""
+        phone = phone_search_key(search_term)
+        if phone is None:
+            return super().get_search_results(
+                request, queryset, search_term
+            )
+        return queryset.filter(phone_normalized=phone), False
+
 
 @admin.register(RepairStatus)
 class RepairStatusAdmin(admin.ModelAdmin):
@@ -41,14 +59,23 @@ class RepairOrderAdmin(admin.ModelAdmin):
         'status', 'master', 'workshop', 'final_cost', 'created_at'
     )
     list_filter = (
-        'status', 'appliance_type', 'workshop', 'master',
+        ('status', CachedRelatedFieldListFilter),
+        ('appliance_type', CachedRelatedFieldListFilter),
+        ('workshop', CachedRelatedFieldListFilter),
+        ('master', StaffListFilter),
         'is_published', 'created_at'
     )
+    list_select_related = (
+        'customer', 'appliance_type', 'status', 'master', 'workshop'
+    )
+    autocomplete_fields = ('customer', 'master')
+    paginator = ApproximateCountPaginator
+    show_full_result_count = False
     search_fields = (
         'customer__name', 'customer__phone', 'appliance_brand',
         'appliance_model', 'description'
     )
-    readonly_fields = ('created_at',)
+    readonly_fields = ('created_at', 'tracking_code')
     fieldsets = (
         ('Основная информация', {
             'fields': ('customer', 'appliance_type', 'appliance_brand', 'appliance_model')
@@ -66,6 +93,103 @@ class RepairOrderAdmin(admin.ModelAdmin):
             'fields': ('created_at', 'accepted_at', 'completed_at')
         }),
         ('Настройки', {
-            'fields': ('is_published',)
+            'fields': ('is_published', 'tracking_code')
         }),
     )
+
+    def get_actions(self, request):
+        # Массовая смена статуса - действие на каждый статус, чтобы
+        # не строить промежуточную страницу выбора
+        actions = super().get_actions(request)
+        if not self.has_change_permission(request):
+            return actions
+        statuses = sorted(
+            references().statuses.values(),
+            key=lambda status: (status.order, status.pk)
+        )
+        for status in statuses:
+            name = f'set_status_{status.pk}'
+            actions[name] = (
+                self.status_action(status), name,
+                f'Перевести в статус «{status.name}»'
+            )
+        return actions
+
+    @staticmethod
+    def status_action(status):
+        def action(modeladmin, request, queryset):
+            changed = change_status(queryset, status)
+            modeladmin.message_user(
+                request, f'Заказов переведено в «{status.name}»: {changed}'
+            )
+        return action
+
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск через индекс FTS5 вместо LIKE по связанным таблицам"""
+        if not build_match_query(search_term):
+            return super().get_search_results(
+                request, queryset, search_term
+            )
+        return queryset.filter(pk__in=matching_orders(search_term)), False
+
+
+@admin.register(Notification)
+class NotificationAdmin(admin.ModelAdmin):
+    list_display = (
+        'id', 'order', 'channel', 'recipient', 'state', 'attempts',
+        'created_at', 'sent_at'
+    )
+    list_filter = ('state', 'channel')
+    # __str__ заказа показывает клиента
+    list_select_related = ('order__customer',)
+    search_fields = ('recipient', 'key')
+    raw_id_fields = ('order',)
+    paginator = ApproximateCountPaginator
+    show_full_result_count = False
+    actions = ('retry_now',)
+    readonly_fields = (
+        'order', 'channel', 'recipient', 'subject', 'body', 'key', 'state',
+        'attempts', 'available_at', 'claimed_by', 'claimed_until',
+        'last_error', 'created_at', 'sent_at'
+    )
+
+    def has_add_permission(self, request):
+        # Уведомления создаются только сменой статуса заказа
+        return False
+
+    @admin.action(description='Отправить повторно')
+    def retry_now(self, request, queryset):
+        updated = queryset.exclude(state=Notification.SENT).update(
+            state=Notification.PENDING, attempts=0,
+            available_at=timezone.now(), claimed_until=None
+        )
+        self.message_user(
+            request, f'Уведомлений в очереди на отправку: {updated}'
+        )
+
+
+@admin.register(StatusEvent)
+class StatusEventAdmin(admin.ModelAdmin):
+    list_display = (
+        'order', 'previous_status', 'status', 'previous_duration',
+        'workshop', 'master', 'created_at'
+    )
+    list_filter = (
+        ('status', CachedRelatedFieldListFilter),
+        ('workshop', CachedRelatedFieldListFilter),
+    )
+    # __str__ заказа показывает клиента
+    list_select_related = (
+        'order__customer', 'previous_status', 'status', 'workshop', 'master'
+    )
+    raw_id_fields = ('order',)
+    paginator = ApproximateCountPaginator
+    show_full_result_count = False
+    readonly_fields = (
+        'order', 'previous_status', 'status', 'previous_duration',
+        'workshop', 'master', 'appliance_type', 'created_at'
+    )
+
+    def has_add_permission(self, request):
+        # Журнал пишется только сменой статуса заказа
+        return False
@@ -0,0 +1,219 @@
+"""JSON API только для чтения: заказы и справочники.
+
+Списки строятся из values_list, без создания экземпляров моделей.
+Параметр ?fields=a,b,c ограничивает и набор ключей ответа, и колонки
+в SELECT. Список заказов пагинируется тем же курсором, что HTML-страницы.
+"""
+from operator import itemgetter
+
+from django.db.models import Case, F, When
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+
+from .conditional import conditional_orders
+from .models import ApplianceType, RepairStatus, Workshop
+from .pagination import ORDERS_PER_PAGE, InvalidCursor, page_window, paginate
+from .views import published_orders
+
+MAX_PER_PAGE = 100
+
+# Название поля в ответе и то, что для него выбирается из базы
+ORDER_FIELDS = {
+    'id': 'pk',
+    'created_at': 'created_at',
+    'completed_at': 'completed_at',
+    'appliance_brand': 'appliance_brand',
+    'appliance_model': 'appliance_model',
+    'description': 'description',
+    'estimated_cost': 'estimated_cost',
+    'final_cost': 'final_cost',
+    'customer_name': 'customer__name',
+    'customer_phone': 'customer__phone',
+    'appliance_type': 'appliance_type__slug',
+    'appliance_type_title': 'appliance_type__title',
+    # Скрытую мастерскую HTML-страницы не показывают, API тоже
+    'workshop_id': Case(
+        When(workshop__is_published=True, then=F('workshop_id'))
+    ),
+    'workshop_name': Case(
+        When(workshop__is_published=True, then=F('workshop__name'))
+    ),
+    'status': 'status__name',
+}
+APPLIANCE_TYPE_FIELDS = {
+    'id': 'pk',
+    'title': 'title',
+    'slug': 'slug',
+    'description': 'description',
+}
+WORKSHOP_FIELDS = {
+    'id': 'pk',
+    'name': 'name',
+    'address': 'address',
+    'phone': 'phone',
+}
+STATUS_FIELDS = {
+    'id': 'pk',
+    'name': 'name',
+    'description': 'description',
+    'order': 'order',
+}
+
+
+class ApiError(Exception):
+    """Ошибка запроса, которая отдается клиенту как JSON"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def json_response(data, status=200):
+    return JsonResponse(
+        data, status=status, json_dumps_params={'ensure_ascii': False}
+    )
+
+
+def api_view(view):
+    """GET-представление API: ApiError превращается в JSON-ответ"""
+    @require_GET
+    def inner(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except ApiError as error:
+            return json_response({'error': str(error)}, error.status)
+    inner.__name__ = view.__name__
+    inner.__doc__ = view.__doc__
+    return inner
+
+
+def requested_fields(request, available):
+    """Поля из ?fields= в порядке запроса или все поля ресурса"""
+    raw = request.GET.get('fields')
+    if not raw:
+        return list(available)
+    names = list(dict.fromkeys(
+        name.strip() for name in raw.split(',') if name.strip()
+    ))
+    unknown = [name for name in names if name not in available]
+    if unknown or not names:
+        raise ApiError(
+            f'Неизвестные поля: {", ".join(unknown)}. '
+            f'Доступны: {", ".join(available)}'
+        )
+    return names
+
+
+def select(queryset, names, available, *extra):
+    """values_list по полям ответа; extra добавляются в конец строки"""
+    return queryset.values_list(
+        *(available[name] for name in names), *extra
+    )
+
+
+def as_dicts(rows, names):
+    return [dict(zip(names, row)) for row in rows]
+
+
+def filtered_orders(request):
+    """Опубликованные заказы с фильтрами HTML-страниц"""
+    orders = published_orders()
+    appliance_type = request.GET.get('appliance_type')
+    if appliance_type:
+        orders = orders.filter(appliance_type__slug=appliance_type)
+    workshop = request.GET.get('workshop')
+    if workshop:
+        if not workshop.isdigit():
+            raise ApiError('workshop: ожидается id мастерской')
+        orders = orders.filter(
+            workshop_id=workshop, workshop__is_published=True
+        )
+    return orders
+
+
+def page_size(request):
+    value = request.GET.get('limit', '')
+    if not value:
+        return ORDERS_PER_PAGE
+    if not value.isdigit() or not 1 <= int(value) <= MAX_PER_PAGE:
+        raise ApiError(f'limit: число от 1 до {MAX_PER_PAGE}')
+    return int(value)
+
+
+def orders_window(request):
+    """Строки будущей страницы для ETag; при ошибке - пустая выборка"""
+    try:
+        return page_window(
+            filtered_orders(request), request.GET.get('cursor'),
+            page_size(request)
+        )[1]
+    except (ApiError, InvalidCursor):
+        return published_orders().none()
+
+
+def page_link(request, cursor):
+    if cursor is None:
+        return None
+    query = request.GET.copy()
+    query['cursor'] = cursor
+    return f'{request.path}?{query.urlencode()}'
+
+
+@api_view
+@conditional_orders(orders_window)
+def order_list(request):
+    """Список опубликованных заказов, новые сверху"""
+    names = requested_fields(request, ORDER_FIELDS)
+    rows = select(
+        filtered_orders(request), names, ORDER_FIELDS, 'created_at', 'pk'
+    )
+    try:
+        page = paginate(
+            rows, request.GET.get('cursor'), page_size(request),
+            position=itemgetter(-2, -1)
+        )
+    except InvalidCursor:
+        raise ApiError('Некорректный курсор страницы')
+    return json_response({
+        'results': as_dicts(page, names),
+        'next': page_link(request, page.next_cursor),
+        'previous': page_link(request, page.previous_cursor),
+    })
+
+
+@api_view
+@conditional_orders(
+    lambda request, order_id: published_orders().filter(pk=order_id)
+)
+def order_detail(request, order_id):
+    """Один опубликованный заказ"""
+    names = requested_fields(request, ORDER_FIELDS)
+    row = select(
+        published_orders().filter(pk=order_id), names, ORDER_FIELDS
+    ).first()
+    if row is None:
+        raise ApiError('Заказ не найден', status=404)
+    return json_response(dict(zip(names, row)))
+
+
+def reference_list(queryset, available):
+    @api_view
+    def view(request):
+        names = requested_fields(request, available)
+        return json_response({
+            'results': as_dicts(select(queryset, names, available), names)
+        })
+    return view
+
+
+appliance_type_list = reference_list(
+    ApplianceType.objects.filter(is_published=True).order_by('title'),
+    APPLIANCE_TYPE_FIELDS
+)
+workshop_list = reference_list(
+    Workshop.objects.filter(is_published=True).order_by('name'),
+    WORKSHOP_FIELDS
+)
+status_list = reference_list(
+    RepairStatus.objects.filter(is_active=True), STATUS_FIELDS
+)
@@ -0,0 +1,15 @@
+from django.urls import path
+
+from . import api
+
+app_name = 'api'
+
+urlpatterns = [
+    path('orders/', api.order_list, name='orders'),
+    path('orders/<int:order_id>/', api.order_detail, name='order_detail'),
+    path(
+        'appliance-types/', api.appliance_type_list, name='appliance_types'
+    ),
+    path('workshops/', api.workshop_list, name='workshops'),
+    path('statuses/', api.status_list, name='statuses'),
+]
@@ -5,3 +5,6 @@ class RepairConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'repair_shop.repair'
     verbose_name = 'Мастерская по ремонту'
+
+    def ready(self):
+        from . import checks, signals, sqlite  # noqa: F401
@@ -0,0 +1,85 @@
+"""Общие инструменты замеров для management-команд bench_*."""
+import time
+from contextlib import contextmanager
+from wsgiref.util import setup_testing_defaults
+
+from django.db import connections
+
+
+def percentile(values, percent):
+    """Перцентиль по ближайшему рангу; values не обязаны быть отсортированы"""
+    ordered = sorted(values)
+    position = round((len(ordered) - 1) * percent / 100)
+    return ordered[position]
+
+
+class QueryRecorder:
+    """Считает SQL-запросы и их суммарное время.
+
+    Подключается через connection.execute_wrapper и переживает
+    переподключения: обертки хранятся в объекте соединения Django.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started
+
+    def reset(self):
+        self.count = 0
+        self.duration = 0.0
+
+
+def wsgi_get(application, path, query_string='', **headers):
+    """GET-запрос через WSGI-приложение в том же процессе.
+
+    Возвращает код ответа, заголовки и тело. Дополнительные заголовки
+    передаются в виде ключей WSGI-окружения: HTTP_ACCEPT_ENCODING='gzip'.
+    """
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': path,
+        'QUERY_STRING': query_string,
+        'HTTP_HOST': 'localhost',
+        **headers,
+    }
+    setup_testing_defaults(environ)
+    started = []
+
+    def start_response(status, response_headers, exc_info=None):
+        started.append((status, response_headers))
+
+    result = application(environ, start_response)
+    try:
+        body = b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    status, response_headers = started[0]
+    return int(status.split()[0]), dict(response_headers), body
+
+
+@contextmanager
+def use_database(name, alias='default'):
+    """Временно направляет соединение alias в другой файл SQLite"""
+    connection = connections[alias]
+    original = connection.settings_dict['NAME']
+    connection.close()
+    # close() не закрывает базу в памяти (тестовую): ее соединение
+    # откладывается до возврата, иначе база пропадет
+    kept = connection.connection
+    connection.connection = None
+    connection.settings_dict['NAME'] = str(name)
+    try:
+        yield connection
+    finally:
+        connection.close()
+        connection.settings_dict['NAME'] = original
+        connection.connection = kept
@@ -0,0 +1,100 @@
+"""Кэш отрендеренных карточек заказов.
+
+Ключ карточки содержит id заказа, его updated_at и версию справочников,
+поэтому любое сохранение заказа само по себе дает новую версию.
+Изменения клиента, мастерской, типа техники или статуса сдвигают
+updated_at связанных заказов через invalidate_order_cards (см.
+signals.py). Версия справочников в ключе нужна воркеру, который еще
+держит старый снимок справочников: его карточки лягут под старым
+ключом и не попадут на страницы остальных.
+"""
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.safestring import mark_safe
+
+from .metrics import record_cache
+from .references import current_version
+
+CARD_TEMPLATE = 'includes/order_card.html'
+KEY_PREFIX = 'order_card'
+
+
+class CacheStats:
+    """Счетчики попаданий и промахов кэша в текущем процессе"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hits, misses):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def reset(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    @property
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+stats = CacheStats()
+
+
+def card_cache_key(pk, updated_at, version=None):
+    if version is None:
+        version = current_version()
+    return f'{KEY_PREFIX}:{pk}:{updated_at.timestamp():.6f}:{version}'
+
+
+def render_order_cards(orders):
+    """HTML карточек в порядке orders; недостающие рендерятся и кэшируются.
+
+    Все карточки страницы читаются и записываются одним обращением
+    к кэшу, чтобы не платить по сетевому запросу за карточку.
+    """
+    version = current_version()
+    keys = [
+        card_cache_key(order.pk, order.updated_at, version)
+        for order in orders
+    ]
+    cached = cache.get_many(keys)
+    missing = {}
+    cards = []
+    for key, order in zip(keys, orders):
+        html = cached.get(key)
+        if html is None:
+            html = render_to_string(CARD_TEMPLATE, {'order': order})
+            missing[key] = html
+        cards.append(mark_safe(html))
+    if missing:
+        cache.set_many(missing, settings.ORDER_CARD_CACHE_TIMEOUT)
+    stats.record(hits=len(keys) - len(missing), misses=len(missing))
+    record_cache(
+        'order_cards', hits=len(keys) - len(missing), misses=len(missing)
+    )
+    return cards
+
+
+def invalidate_order_cards(orders):
+    """Удаляет карточки заказов выборки и сдвигает их версию."""
+    version = current_version()
+    keys = [
+        card_cache_key(pk, updated_at, version)
+        for pk, updated_at in orders.values_list('pk', 'updated_at')
+    ]
+    if not keys:
+        return
+    cache.delete_many(keys)
+    # Новая версия нужна и тем воркерам, у которых карточка уже
+    # лежит в собственном кэше процесса
+    orders.update(updated_at=timezone.now())
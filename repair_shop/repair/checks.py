@@ -0,0 +1,25 @@
+"""Проверки настроек для manage.py check --deploy"""
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+# Бэкенды, у которых в каждом процессе свое содержимое
+PROCESS_LOCAL_CACHES = ('django.core.cache.backends.locmem.LocMemCache',)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """Кэш по умолчанию должен быть общим для всех воркеров"""
+    backend = settings.CACHES['default']['BACKEND']
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [
+        Error(
+            f'{backend} хранит данные в памяти одного процесса',
+            hint=(
+                'Версию справочников (references.py) и удаление страниц '
+                'отслеживания (tracking.py) должны видеть все воркеры: '
+                'задайте REDIS_URL или другой общий бэкенд в CACHES.'
+            ),
+            id='repair.E001',
+        )
+    ]
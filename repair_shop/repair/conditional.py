@@ -0,0 +1,58 @@
+"""Условные GET-запросы (ETag / Last-Modified) для страниц заказов.
+
+Валидатор страницы считается одним агрегирующим запросом по тем же
+строкам, что попадут на страницу, без загрузки объектов и рендера
+шаблона. Если версия у клиента актуальна, отдается 304 Not Modified.
+"""
+from functools import wraps
+
+from django.db.models import Count, Max, Sum
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+
+
+def order_validators(orders):
+    """Значения ETag и времени последнего изменения выборки заказов.
+
+    Сумма id отличает выборки одного размера с разным составом:
+    например, когда заказ скрыли и на его место в окне страницы
+    сдвинулся более старый.
+    """
+    state = orders.aggregate(
+        count=Count('pk'),
+        pk_sum=Sum('pk'),
+        last_modified=Max('updated_at'),
+    )
+    if not state['count']:
+        return None, None
+    last_modified = state['last_modified']
+    etag = quote_etag(
+        f'{state["count"]}-{state["pk_sum"]}-'
+        f'{last_modified.timestamp():.6f}'
+    )
+    return etag, int(last_modified.timestamp())
+
+
+def conditional_orders(get_orders):
+    """Декоратор представления со страницей заказов.
+
+    get_orders(request, *args, **kwargs) возвращает выборку заказов,
+    которые будут показаны на странице.
+    """
+    def decorator(view):
+        @wraps(view)
+        def inner(request, *args, **kwargs):
+            etag, last_modified = order_validators(
+                get_orders(request, *args, **kwargs)
+            )
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified
+            )
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if etag and response.status_code == 200:
+                    response['ETag'] = etag
+                    response['Last-Modified'] = http_date(last_modified)
+            return response
+        return inner
+    return decorator
@@ -0,0 +1,141 @@
+"""Потоковая выгрузка заказов в CSV и JSON Lines.
+
+Строки читаются серверным курсором (.iterator) из values_list и сразу
+превращаются в байты, поэтому память не зависит от объема выгрузки.
+Колонки совпадают с теми, что понимает команда import_orders.
+"""
+import csv
+import json
+import zlib
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+
+from .models import RepairOrder
+
+# Колонка выгрузки и поле, из которого она берется
+COLUMNS = (
+    ('id', 'pk'),
+    ('created_at', 'created_at'),
+    ('accepted_at', 'accepted_at'),
+    ('completed_at', 'completed_at'),
+    ('customer_name', 'customer__name'),
+    ('customer_phone', 'customer__phone'),
+    ('customer_email', 'customer__email'),
+    ('customer_address', 'customer__address'),
+    ('appliance_type', 'appliance_type__slug'),
+    ('appliance_brand', 'appliance_brand'),
+    ('appliance_model', 'appliance_model'),
+    ('description', 'description'),
+    ('workshop', 'workshop__name'),
+    ('master', 'master__username'),
+    ('status', 'status__name'),
+    ('estimated_cost', 'estimated_cost'),
+    ('final_cost', 'final_cost'),
+    ('is_published', 'is_published'),
+)
+HEADER = [column for column, _ in COLUMNS]
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+# Сколько строк выбирать из базы за раз и сколько байт копить
+# перед отправкой очередного куска клиенту
+CHUNK_SIZE = 2000
+FLUSH_BYTES = 64 * 1024
+
+
+def export_rows(date_from=None, date_to=None, workshop=None, status=None,
+                appliance_type=None, chunk_size=CHUNK_SIZE):
+    """Кортежи значений колонок COLUMNS по порядку id.
+
+    Период задается датами включительно, в текущем часовом поясе.
+    """
+    orders = RepairOrder.objects.all()
+    if date_from:
+        orders = orders.filter(created_at__gte=start_of_day(date_from))
+    if date_to:
+        orders = orders.filter(
+            created_at__lt=start_of_day(date_to + timedelta(days=1))
+        )
+    if workshop:
+        orders = orders.filter(workshop=workshop)
+    if status:
+        orders = orders.filter(status=status)
+    if appliance_type:
+        orders = orders.filter(appliance_type=appliance_type)
+    return orders.order_by('pk').values_list(
+        *(lookup for _, lookup in COLUMNS)
+    ).iterator(chunk_size=chunk_size)
+
+
+def start_of_day(day):
+    return timezone.make_aware(datetime.combine(day, time()))
+
+
+def csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def json_value(value):
+    """Значения, которые json не умеет сам: даты и Decimal"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+class Echo:
+    """Псевдофайл для csv.writer: возвращает строку вместо записи"""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    # BOM нужен Excel, чтобы распознать UTF-8 и не испортить кириллицу
+    writer = csv.writer(Echo())
+    yield '\ufeff' + writer.writerow(HEADER)
+    for row in rows:
+        yield writer.writerow([csv_value(value) for value in row])
+
+
+def jsonl_lines(rows):
+    for row in rows:
+        yield json.dumps(
+            dict(zip(HEADER, row)), ensure_ascii=False, default=json_value
+        ) + '\n'
+
+
+def export_chunks(rows, export_format='csv', compress=False):
+    """Куски байт выгрузки размером около FLUSH_BYTES"""
+    lines = csv_lines(rows) if export_format == 'csv' else jsonl_lines(rows)
+    # wbits=31 - формат gzip, а не голый zlib
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    buffer, size = [], 0
+    for line in lines:
+        data = line.encode()
+        buffer.append(data)
+        size += len(data)
+        if size >= FLUSH_BYTES:
+            chunk = b''.join(buffer)
+            buffer, size = [], 0
+            if compressor:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+    chunk = b''.join(buffer)
+    if compressor:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
+
+
+def export_filename(export_format, compress=False):
+    name = f'orders-{timezone.localdate():%Y%m%d}.{export_format}'
+    return f'{name}.gz' if compress else name
@@ -0,0 +1,38 @@
+from django import forms
+
+from .models import ApplianceType, RepairStatus, Workshop
+
+
+class OrderExportForm(forms.Form):
+    """Параметры выгрузки заказов: формат и фильтры"""
+    format = forms.ChoiceField(
+        label='Формат',
+        choices=(('csv', 'CSV'), ('jsonl', 'JSON Lines')),
+        required=False
+    )
+    gzip = forms.BooleanField(label='Сжать gzip', required=False)
+    date_from = forms.DateField(label='Созданы с', required=False)
+    date_to = forms.DateField(label='Созданы по', required=False)
+    workshop = forms.ModelChoiceField(
+        Workshop.objects.all(), label='Мастерская', required=False
+    )
+    status = forms.ModelChoiceField(
+        RepairStatus.objects.all(), label='Статус', required=False
+    )
+    appliance_type = forms.ModelChoiceField(
+        ApplianceType.objects.all(),
+        label='Тип техники',
+        to_field_name='slug',
+        required=False
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        date_from = cleaned_data.get('date_from')
+        date_to = cleaned_data.get('date_to')
+        if date_from and date_to and date_from > date_to:
+            raise forms.ValidationError(
+                'Начало периода позже его конца.'
+            )
+        cleaned_data['format'] = cleaned_data.get('format') or 'csv'
+        return cleaned_data
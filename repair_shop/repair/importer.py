@@ -0,0 +1,373 @@
+"""Массовая загрузка заказов и клиентов из CSV или JSON Lines.
+
+Формат совпадает с выгрузкой export_orders. Справочники (типы техники,
+мастерские, статусы, мастера) и клиенты загружаются в память один раз,
+строки пишутся пачками, каждая пачка - в своей транзакции. Заказы
+вставляются executemany с уже подготовленными значениями, без
+построения моделей: именно это, а не сама база, ограничивает скорость
+bulk_create.
+"""
+import csv
+import gzip
+import json
+from collections import namedtuple
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import (
+    ApplianceType, Customer, RepairOrder, RepairStatus, Workshop
+)
+from .search import index_documents, insert_trigger_disabled
+from .sqlite import temporary_pragmas
+from .stats import ZERO, add_many_to_stats
+from .utils import generate_tracking_codes, normalize_phone
+
+User = get_user_model()
+
+ORDER_COLUMNS = (
+    'customer_id', 'appliance_type_id', 'appliance_brand',
+    'appliance_model', 'description', 'master_id', 'workshop_id',
+    'status_id', 'estimated_cost', 'final_cost', 'created_at',
+    'updated_at', 'accepted_at', 'completed_at', 'is_published',
+    'tracking_code',
+)
+OrderRow = namedtuple('OrderRow', ORDER_COLUMNS)
+STATS_KEY_FIELDS = ('month', 'workshop_id', 'status_id', 'appliance_type_id')
+CUSTOMER_COLUMNS = (
+    'name', 'phone', 'phone_normalized', 'email', 'address', 'created_at'
+)
+
+# Кэш страниц SQLite на время загрузки (в КиБ, как cache_size со
+# знаком минус): страницы индексов заказов не вытесняются между пачками
+IMPORT_PRAGMAS = {'cache_size': -200_000}
+
+TRUE_VALUES = {'1', 'true', 'yes', 'да'}
+FALSE_VALUES = {'0', 'false', 'no', 'нет'}
+
+
+class ImportRowError(ValueError):
+    """Строку файла нельзя загрузить"""
+
+
+def open_source(path):
+    """Текстовый файл; .gz распаковывается на лету, BOM отбрасывается"""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8-sig', newline='')
+    return open(path, encoding='utf-8-sig', newline='')
+
+
+def read_records(file, source_format):
+    """Пары (номер строки, словарь) из CSV или JSON Lines.
+
+    Номер - строка файла, с которой начинается запись: по нему можно
+    продолжить загрузку с места остановки.
+    """
+    if source_format == 'csv':
+        reader = csv.DictReader(file)
+        start = 2
+        for record in reader:
+            yield start, record
+            start = reader.line_num + 1
+        return
+    for number, line in enumerate(file, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as error:
+            yield number, ImportRowError(f'некорректный JSON: {error}')
+            continue
+        if not isinstance(record, dict):
+            record = ImportRowError('ожидался объект JSON')
+        yield number, record
+
+
+def text(record, name, max_length=None, required=False):
+    value = record.get(name)
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise ImportRowError(f'{name}: поле обязательно')
+    if max_length and len(value) > max_length:
+        raise ImportRowError(f'{name}: длиннее {max_length} символов')
+    return value
+
+
+def moment(record, name, required=False):
+    value = text(record, name, required=required)
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ImportRowError(f'{name}: некорректная дата {value!r}')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def money(record, name):
+    value = text(record, name).replace(',', '.').replace(' ', '')
+    if not value:
+        return None
+    try:
+        amount = Decimal(value).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise ImportRowError(f'{name}: некорректная сумма {value!r}')
+    if amount < 0 or amount >= 10 ** 8:
+        raise ImportRowError(f'{name}: сумма вне допустимого диапазона')
+    return amount
+
+
+def flag(record, name, default=True):
+    value = record.get(name)
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool):
+        return value
+    value = str(value).strip().lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise ImportRowError(f'{name}: ожидалось да/нет, а не {value!r}')
+
+
+def lookup(mapping, record, name):
+    """Находит id в справочнике по значению колонки; пусто - None"""
+    value = text(record, name)
+    if not value:
+        return None
+    try:
+        return mapping[value]
+    except KeyError:
+        raise ImportRowError(f'{name}: неизвестное значение {value!r}')
+
+
+class OrderImporter:
+    """Загрузка записей пачками.
+
+    Клиенты сопоставляются по нормализованному телефону с уже
+    существующими и с новыми из того же файла. При dry_run строки
+    только проверяются, база не меняется.
+    """
+
+    def __init__(self, batch_size=20_000, dry_run=False):
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.appliance_types = dict(
+            ApplianceType.objects.values_list('slug', 'pk')
+        )
+        self.workshops = dict(Workshop.objects.values_list('name', 'pk'))
+        self.statuses = dict(RepairStatus.objects.values_list('name', 'pk'))
+        self.masters = dict(
+            User.objects.filter(is_staff=True).values_list('username', 'pk')
+        )
+        self.customers = {}
+        for pk, phone in Customer.objects.values_list(
+            'pk', 'phone_normalized'
+        ).order_by('pk').iterator(chunk_size=10_000):
+            self.customers.setdefault(phone, pk)
+        self.imported_orders = 0
+        self.imported_customers = 0
+        self.reset_batch()
+
+    def reset_batch(self):
+        self.new_customers = {}
+        self.orders = []
+
+    def parse_row(self, record):
+        """Проверяет запись и добавляет заказ в текущую пачку"""
+        phone = text(record, 'customer_phone', 20, required=True)
+        key = normalize_phone(phone)
+        if not key:
+            raise ImportRowError('customer_phone: в номере нет цифр')
+        created_at = moment(record, 'created_at', required=True)
+        # Пока клиент может быть еще не заведен, вместо его id
+        # хранится нормализованный телефон
+        order = OrderRow(
+            customer_id=key,
+            appliance_type_id=lookup(
+                self.appliance_types, record, 'appliance_type'
+            ),
+            appliance_brand=text(record, 'appliance_brand', 100, True),
+            appliance_model=text(record, 'appliance_model', 100),
+            description=text(record, 'description', required=True),
+            master_id=lookup(self.masters, record, 'master'),
+            workshop_id=lookup(self.workshops, record, 'workshop'),
+            status_id=lookup(self.statuses, record, 'status'),
+            estimated_cost=money(record, 'estimated_cost'),
+            final_cost=money(record, 'final_cost'),
+            created_at=created_at,
+            updated_at=self.now,
+            accepted_at=moment(record, 'accepted_at'),
+            completed_at=moment(record, 'completed_at'),
+            is_published=flag(record, 'is_published'),
+            # Код выдается при записи, сразу на всю пачку
+            tracking_code=None,
+        )
+        if key not in self.customers and key not in self.new_customers:
+            self.new_customers[key] = (
+                text(record, 'customer_name', 256, required=True),
+                phone,
+                key,
+                text(record, 'customer_email', 254),
+                text(record, 'customer_address', 512),
+                created_at,
+            )
+        self.orders.append(order)
+
+    def run(self, records, start_line=1, on_error=None, on_batch=None):
+        """Загружает записи [(номер строки, запись)].
+
+        on_error(номер, запись, ошибка) вызывается для отклоненных строк,
+        on_batch(номер последней строки) - после записи каждой пачки.
+        Возвращает число отклоненных строк.
+        """
+        with temporary_pragmas(connection, IMPORT_PRAGMAS):
+            return self.run_records(records, start_line, on_error, on_batch)
+
+    def run_records(self, records, start_line, on_error, on_batch):
+        self.now = timezone.now()
+        errors = 0
+        line = start_line - 1
+        for line, record in records:
+            if line < start_line:
+                continue
+            try:
+                if isinstance(record, ImportRowError):
+                    raise record
+                self.parse_row(record)
+            except ImportRowError as error:
+                errors += 1
+                if on_error:
+                    on_error(line, record, error)
+                continue
+            if len(self.orders) >= self.batch_size:
+                self.flush(line, on_batch)
+        if self.orders:
+            self.flush(line, on_batch)
+        return errors
+
+    def flush(self, line, on_batch=None):
+        if self.dry_run:
+            # Новые клиенты считаются заведенными, чтобы повторы
+            # телефона дальше в файле не считались новыми клиентами
+            self.customers.update(dict.fromkeys(self.new_customers))
+        else:
+            with transaction.atomic(), insert_trigger_disabled():
+                customer_names = self.write_customers()
+                self.write_orders(customer_names)
+        self.imported_customers += len(self.new_customers)
+        self.imported_orders += len(self.orders)
+        self.reset_batch()
+        if on_batch:
+            on_batch(line)
+
+    def write_customers(self):
+        """Заводит новых клиентов пачки; возвращает {id: (имя, телефон)}"""
+        if not self.new_customers:
+            return {}
+        first_id = insert_rows(
+            Customer, CUSTOMER_COLUMNS, self.new_customers.values()
+        )
+        names = {}
+        for pk, (key, row) in enumerate(
+            self.new_customers.items(), start=first_id
+        ):
+            self.customers[key] = pk
+            names[pk] = row[:2]
+        return names
+
+    def write_orders(self, customer_names):
+        # Вставка идет мимо модели, поэтому код отслеживания по
+        # умолчанию не подставится сам
+        rows = [
+            order._replace(
+                customer_id=self.customers[order.customer_id],
+                tracking_code=code
+            )
+            for order, code in zip(
+                self.orders, generate_tracking_codes(len(self.orders))
+            )
+        ]
+        first_id = insert_rows(RepairOrder, ORDER_COLUMNS, rows)
+
+        # Для поиска нужны имя и телефон клиента так, как они записаны
+        # в базе, а не в файле
+        known = {row.customer_id for row in rows} - customer_names.keys()
+        customer_names.update(
+            (pk, (name, phone))
+            for pk, name, phone in Customer.objects.filter(
+                pk__in=known
+            ).values_list('pk', 'name', 'phone')
+        )
+        index_documents(
+            (pk, row.description, row.appliance_brand, row.appliance_model,
+             *customer_names[row.customer_id])
+            for pk, row in enumerate(rows, start=first_id)
+        )
+
+        # Месяц считается так же, как в stats_key, но без поиска
+        # текущей зоны на каждую строку
+        tz = timezone.get_current_timezone()
+        deltas = {}
+        for row in rows:
+            key = (
+                row.created_at.astimezone(tz).date().replace(day=1),
+                row.workshop_id, row.status_id, row.appliance_type_id
+            )
+            orders, revenue = deltas.get(key, (0, ZERO))
+            deltas[key] = (orders + 1, revenue + (row.final_cost or ZERO))
+        add_many_to_stats(
+            (dict(zip(STATS_KEY_FIELDS, key)), delta)
+            for key, delta in deltas.items()
+        )
+
+
+def insert_rows(model, columns, rows):
+    """Вставляет строки и возвращает id первой из них.
+
+    Вызывать внутри транзакции: после первой вставки база заблокирована
+    для других писателей, поэтому наши строки - последние по id.
+    """
+    ops = connection.ops
+    fields = [model._meta.get_field(column) for column in columns]
+    dates = [
+        index for index, field in enumerate(fields)
+        if field.get_internal_type() == 'DateTimeField'
+    ]
+    adapt_datetime = datetime_adapter()
+    prepared = []
+    for row in rows:
+        row = list(row)
+        for index in dates:
+            if row[index] is not None:
+                row[index] = adapt_datetime(row[index])
+        prepared.append(row)
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        ops.quote_name(model._meta.db_table),
+        ', '.join(ops.quote_name(field.column) for field in fields),
+        ', '.join(['%s'] * len(fields))
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, prepared)
+    last_id = model.objects.aggregate(last=Max('pk'))['last']
+    return last_id - len(prepared) + 1
+
+
+def datetime_adapter():
+    """Преобразование aware datetime в значение для базы.
+
+    Для SQLite - то же, что делает adapt_datetimefield_value, но без
+    проверок на каждое значение: на сотнях тысяч дат это заметно.
+    """
+    if connection.vendor != 'sqlite' or not settings.USE_TZ:
+        return connection.ops.adapt_datetimefield_value
+    tz = connection.timezone
+    return lambda value: str(value.astimezone(tz).replace(tzinfo=None))
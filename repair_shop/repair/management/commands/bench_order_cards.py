@@ -0,0 +1,57 @@
+"""
+Замер рендера главной страницы с холодным и прогретым кэшем карточек.
+Использование: python manage.py bench_order_cards [--repeat 50]
+"""
+import statistics
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+
+from repair_shop.repair import card_cache
+from repair_shop.repair.benchmarks import percentile
+from repair_shop.repair.models import RepairOrder
+from repair_shop.repair.views import index
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает холодный и прогретый рендер главной страницы'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat', type=int, default=50,
+            help='Сколько раз рендерить страницу в каждом режиме'
+        )
+
+    def render(self, request, cold):
+        if cold:
+            cache.clear()
+        started = time.perf_counter()
+        response = index(request)
+        elapsed = time.perf_counter() - started
+        if response.status_code != 200:
+            raise CommandError(
+                f'Главная страница вернула {response.status_code}'
+            )
+        return elapsed * 1000
+
+    def handle(self, *args, **options):
+        if not RepairOrder.objects.exists():
+            raise CommandError(
+                'Нет заказов: сначала выполните create_test_data'
+            )
+        request = RequestFactory().get('/')
+        for mode, cold in (('холодный', True), ('прогретый', False)):
+            # Первый проход прогревает кэш и шаблоны и в замер не входит
+            self.render(request, cold=False)
+            card_cache.stats.reset()
+            timings = [
+                self.render(request, cold) for _ in range(options['repeat'])
+            ]
+            self.stdout.write(
+                f'{mode:>10}: медиана {statistics.median(timings):.2f} мс, '
+                f'p95 {percentile(timings, 95):.2f} мс, '
+                f'попаданий {card_cache.stats.hits}, '
+                f'промахов {card_cache.stats.misses}'
+            )
@@ -0,0 +1,122 @@
+"""
+Замер очереди уведомлений: задержка сохранения заказа со сменой
+статуса на «готов» с outbox и без него и скорость разбора очереди.
+Работает на временной базе, рабочую не трогает.
+Использование: python manage.py bench_outbox [--saves 500]
+    [--notifications 20000]
+"""
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from repair_shop.repair import notifications
+from repair_shop.repair.benchmarks import percentile, use_database
+from repair_shop.repair.models import Notification, RepairOrder
+
+# Отправка в память: замеряется очередь, а не почтовый сервер
+MEMORY_BACKENDS = {
+    'email': 'repair_shop.repair.notifications.EmailBackend',
+    'sms': 'repair_shop.repair.notifications.MemorySMSBackend',
+}
+
+
+class Command(BaseCommand):
+    help = 'Замеряет сохранение заказа с outbox и разбор очереди'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--saves', type=int, default=500,
+            help='Сохранений заказа в каждом режиме'
+        )
+        parser.add_argument(
+            '--notifications', type=int, default=20_000,
+            help='Сколько уведомлений разобрать'
+        )
+        parser.add_argument(
+            '--batch-size', type=int,
+            default=settings.NOTIFICATIONS['BATCH_SIZE']
+        )
+
+    def handle(self, *args, **options):
+        config = {**settings.NOTIFICATIONS, 'BACKENDS': MEMORY_BACKENDS}
+        email = 'django.core.mail.backends.locmem.EmailBackend'
+        with tempfile.TemporaryDirectory() as directory, \
+                use_database(Path(directory) / 'outbox.sqlite3'), \
+                override_settings(NOTIFICATIONS=config, EMAIL_BACKEND=email):
+            call_command('migrate', verbosity=0)
+            call_command(
+                'create_test_data', orders=options['saves'] * 4, seed=42,
+                stdout=self.stderr
+            )
+            self.measure_saves(options['saves'])
+            self.measure_drain(
+                options['notifications'], options['batch_size']
+            )
+
+    def measure_saves(self, count):
+        ready = settings.NOTIFICATIONS['READY_STATUS']
+        orders = list(
+            RepairOrder.objects.exclude(status__name=ready)
+            .values_list('pk', flat=True)[:count * 2]
+        )
+        status = RepairOrder.objects.filter(
+            status__name=ready
+        ).values_list('status', flat=True).first()
+        modes = {
+            'без outbox': {**settings.NOTIFICATIONS, 'READY_STATUS': None},
+            'с outbox': settings.NOTIFICATIONS,
+        }
+        timings = {mode: [] for mode in modes}
+        # Режимы чередуются, чтобы прогрев и рост базы не достались
+        # одному из них
+        for number, pk in enumerate(orders):
+            mode = list(modes)[number % 2]
+            with override_settings(NOTIFICATIONS=modes[mode]):
+                # Как в админке: заказ загружается и сохраняется целиком
+                order = RepairOrder.objects.get(pk=pk)
+                order.status_id = status
+                started = time.perf_counter()
+                order.save()
+                timings[mode].append((time.perf_counter() - started) * 1000)
+        for mode, values in timings.items():
+            self.stdout.write(
+                f'{mode:>11}: сохранение заказа - медиана '
+                f'{statistics.median(values):.2f} мс, '
+                f'p95 {percentile(values, 95):.2f} мс'
+            )
+
+    def measure_drain(self, count, batch_size):
+        Notification.objects.all().delete()
+        orders = list(RepairOrder.objects.values_list('pk', flat=True))
+        # Как после смены статусов: тексты воркер составит сам
+        Notification.objects.bulk_create(
+            (
+                Notification(
+                    order_id=orders[number % len(orders)],
+                    key=f'bench:{number}'
+                )
+                for number in range(count)
+            ),
+            batch_size=2000
+        )
+        worker_id = notifications.new_worker_id()
+        sent = 0
+        started = time.perf_counter()
+        while True:
+            batch_sent, failed = notifications.process_batch(
+                worker_id, batch_size
+            )
+            if not batch_sent and not failed:
+                break
+            sent += batch_sent
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'Разбор очереди: {sent} уведомлений за {elapsed:.2f} с '
+            f'({sent / elapsed:.0f} в секунду, пачка {batch_size})'
+        )
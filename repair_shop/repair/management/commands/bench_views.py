@@ -0,0 +1,264 @@
+"""
+Замер задержки публичных страниц на данных разного объема.
+Использование:
+    python manage.py bench_views --scales 1000 100000 1000000
+    python manage.py bench_views --output run.json --baseline prev.json
+    python manage.py bench_views --accept-encoding ''
+"""
+import json
+import platform
+import sqlite3
+import time
+import tracemalloc
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db.models import Count
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from repair_shop.repair.benchmarks import (
+    QueryRecorder, percentile, use_database, wsgi_get
+)
+from repair_shop.repair.models import ApplianceType, RepairOrder, Workshop
+
+DEFAULT_SCALES = [1_000, 100_000, 1_000_000]
+
+
+class Command(BaseCommand):
+    help = 'Замеряет задержку, число запросов и память публичных страниц'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scales', type=int, nargs='+', default=DEFAULT_SCALES,
+            help='Объемы данных (число заказов)'
+        )
+        parser.add_argument(
+            '--data-dir', type=Path,
+            default=Path(settings.BASE_DIR) / 'bench_data',
+            help='Каталог с базами SQLite для каждого объема'
+        )
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help='Пересоздать базы, даже если они уже есть'
+        )
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--repeat', type=int, default=30,
+            help='Запросов на страницу в замере'
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=3,
+            help='Запросов на страницу перед замером'
+        )
+        parser.add_argument(
+            '--cold', action='store_true',
+            help='Очищать кэш перед каждым запросом'
+        )
+        parser.add_argument(
+            '--accept-encoding', default='gzip',
+            help='Заголовок Accept-Encoding запросов; пустая строка - '
+                 'без сжатия'
+        )
+        parser.add_argument(
+            '--output', type=Path,
+            help='Файл для JSON-отчета (по умолчанию stdout)'
+        )
+        parser.add_argument(
+            '--baseline', type=Path,
+            help='JSON-отчет прошлого прогона для сравнения'
+        )
+        parser.add_argument(
+            '--threshold', type=float, default=0.2,
+            help='Допустимый рост p95 относительно baseline (0.2 = 20%%)'
+        )
+        parser.add_argument(
+            '--min-delta-ms', type=float, default=0.5,
+            help='Рост p95 меньше этого значения не считается регрессией: '
+                 'на быстрых страницах он в пределах шума'
+        )
+
+    def handle(self, *args, **options):
+        options['data_dir'].mkdir(parents=True, exist_ok=True)
+        report = {
+            'meta': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'sqlite': sqlite3.sqlite_version,
+                'repeat': options['repeat'],
+                'cold_cache': options['cold'],
+                'accept_encoding': options['accept_encoding'],
+                'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            },
+            'results': {},
+        }
+        application = get_wsgi_application()
+        hosts = [*settings.ALLOWED_HOSTS, 'localhost']
+        for scale in options['scales']:
+            path = options['data_dir'] / f'orders_{scale}.sqlite3'
+            self.prepare_dataset(path, scale, options)
+            with use_database(path), override_settings(ALLOWED_HOSTS=hosts):
+                report['results'][str(scale)] = {
+                    name: self.measure(application, url, options)
+                    for name, url in self.urls().items()
+                }
+
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            options['output'].write_text(output, encoding='utf-8')
+        else:
+            self.stdout.write(output)
+
+        if options['baseline']:
+            regressions = self.compare(
+                json.loads(options['baseline'].read_text(encoding='utf-8')),
+                report, options['threshold'], options['min_delta_ms']
+            )
+            if regressions:
+                raise CommandError(
+                    'Регрессии производительности:\n' + '\n'.join(regressions)
+                )
+            self.stderr.write(self.style.SUCCESS('Регрессий нет'))
+
+    def prepare_dataset(self, path, scale, options):
+        """Создает базу объема scale или берет готовую.
+
+        Неподходящая база не чистится, а создается заново: удаление
+        заказов через ORM обошло бы их по одному с сигналами, а клиенты
+        и мастерские прошлого набора остались бы в новом.
+        """
+        if path.exists() and not options['rebuild']:
+            with use_database(path):
+                call_command('migrate', verbosity=0)
+                if RepairOrder.objects.count() == scale:
+                    self.stderr.write(
+                        f'{path.name}: используются готовые данные'
+                    )
+                    return
+        for suffix in ('', '-wal', '-shm'):
+            Path(f'{path}{suffix}').unlink(missing_ok=True)
+        self.stderr.write(f'{path.name}: генерация {scale} заказов')
+        with use_database(path):
+            call_command('migrate', verbosity=0)
+            call_command(
+                'create_test_data', orders=scale, seed=options['seed'],
+                stdout=self.stderr
+            )
+
+    def urls(self):
+        """Страницы для замера: самые нагруженные списки и свежий заказ"""
+        appliance_type = ApplianceType.objects.annotate(
+            orders_count=Count('orders')
+        ).order_by('-orders_count').first()
+        workshop = Workshop.objects.annotate(
+            orders_count=Count('repairorder')
+        ).order_by('-orders_count').first()
+        order = RepairOrder.objects.published().order_by('-created_at').first()
+        api_orders = reverse('api:orders')
+        return {
+            'repair:index': reverse('repair:index'),
+            'repair:order_detail': reverse(
+                'repair:order_detail', kwargs={'order_id': order.id}
+            ),
+            'repair:appliance_type_orders': reverse(
+                'repair:appliance_type_orders',
+                kwargs={'appliance_type_slug': appliance_type.slug}
+            ),
+            'repair:workshop_orders': reverse(
+                'repair:workshop_orders',
+                kwargs={'workshop_id': workshop.id}
+            ),
+            'repair:track_order': order.get_tracking_url(),
+            'api:orders': api_orders,
+            'api:orders_sparse': f'{api_orders}?fields=id,status',
+            'api:order_detail': reverse(
+                'api:order_detail', kwargs={'order_id': order.id}
+            ),
+            'api:appliance_type_orders': (
+                f'{api_orders}?appliance_type={appliance_type.slug}'
+            ),
+            'api:workshop_orders': f'{api_orders}?workshop={workshop.id}',
+            'pages:about': reverse('pages:about'),
+            'pages:rules': reverse('pages:rules'),
+        }
+
+    def measure(self, application, url, options):
+        recorder = QueryRecorder()
+        encoding = options['accept_encoding']
+        latencies, cpu_times, queries, sql_times = [], [], [], []
+        with django.db.connection.execute_wrapper(recorder):
+            for _ in range(options['warmup']):
+                self.request(application, url, encoding)
+            for _ in range(options['repeat']):
+                if options['cold']:
+                    cache.clear()
+                recorder.reset()
+                started = time.perf_counter()
+                cpu_started = time.process_time()
+                size = self.request(application, url, encoding)
+                cpu_times.append((time.process_time() - cpu_started) * 1000)
+                latencies.append((time.perf_counter() - started) * 1000)
+                queries.append(recorder.count)
+                sql_times.append(recorder.duration * 1000)
+        content_size = self.request(application, url)
+
+        # Память меряется отдельным запросом: tracemalloc замедляет код
+        # и исказил бы задержку
+        if options['cold']:
+            cache.clear()
+        tracemalloc.start()
+        self.request(application, url, encoding)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        return {
+            'url': url,
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p95_ms': round(percentile(latencies, 95), 3),
+            'p99_ms': round(percentile(latencies, 99), 3),
+            'queries': max(queries),
+            'sql_ms': round(sum(sql_times) / len(sql_times), 3),
+            'cpu_ms': round(sum(cpu_times) / len(cpu_times), 3),
+            'peak_memory_kb': round(peak / 1024, 1),
+            # Байт на проводе с --accept-encoding и без сжатия
+            'response_bytes': size,
+            'content_bytes': content_size,
+        }
+
+    def request(self, application, url, encoding=''):
+        path, _, query_string = url.partition('?')
+        status, _, body = wsgi_get(
+            application, path, query_string, HTTP_ACCEPT_ENCODING=encoding
+        )
+        if status != 200:
+            raise CommandError(f'{url} вернул {status}')
+        return len(body)
+
+    def compare(self, baseline, report, threshold, min_delta_ms):
+        """Список регрессий относительно прошлого отчета"""
+        regressions = []
+        for scale, views in report['results'].items():
+            for name, current in views.items():
+                previous = baseline['results'].get(scale, {}).get(name)
+                if previous is None:
+                    continue
+                limit = max(
+                    previous['p95_ms'] * (1 + threshold),
+                    previous['p95_ms'] + min_delta_ms
+                )
+                if current['p95_ms'] > limit:
+                    regressions.append(
+                        f'{scale} заказов, {name}: p95 '
+                        f'{previous["p95_ms"]} → {current["p95_ms"]} мс'
+                    )
+                if current['queries'] > previous['queries']:
+                    regressions.append(
+                        f'{scale} заказов, {name}: запросов '
+                        f'{previous["queries"]} → {current["queries"]}'
+                    )
+        return regressions
@@ -1,21 +1,186 @@
 """
 Команда для создания тестовых данных мастерской по ремонту.
-Использование: python manage.py create_test_data
+Использование:
+    python manage.py create_test_data
+    python manage.py create_test_data --orders 1000000 --seed 42
 """
+import random
+import time
+from datetime import date, datetime, time as dt_time, timedelta
+from decimal import Decimal
+from itertools import accumulate, islice
+
 from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import Max
 from repair_shop.repair.models import (
     ApplianceType, Workshop, Customer, RepairStatus, RepairOrder
 )
+from repair_shop.repair.references import invalidate_references
+from repair_shop.repair.sqlite import analyze
+from repair_shop.repair.stats import rebuild_order_stats
+from repair_shop.repair.utils import (
+    explicit_timestamps, generate_tracking_code, normalize_phone
+)
 from django.utils import timezone
-from datetime import timedelta
 
 User = get_user_model()
 
+# Конец периода генерации фиксирован, чтобы один и тот же seed
+# давал одинаковые данные независимо от дня запуска
+DEFAULT_END_DATE = date(2025, 12, 1)
+
+# Марки по убыванию популярности для каждого типа техники
+BRANDS = {
+    'refrigerator': [
+        'Samsung', 'Atlant', 'LG', 'Bosch', 'Indesit', 'Haier', 'Beko',
+        'Liebherr', 'Stinol', 'Pozis',
+    ],
+    'washing-machine': [
+        'LG', 'Samsung', 'Bosch', 'Indesit', 'Candy', 'Beko', 'Haier',
+        'Electrolux', 'Whirlpool', 'Hotpoint',
+    ],
+    'microwave': [
+        'Samsung', 'LG', 'Panasonic', 'Midea', 'Bosch', 'Hyundai', 'BBK',
+        'Gorenje',
+    ],
+    'dishwasher': [
+        'Bosch', 'Electrolux', 'Weissgauff', 'Midea', 'Indesit', 'Hansa',
+        'Beko', 'Hotpoint',
+    ],
+}
+
+FAULTS = {
+    'refrigerator': [
+        'Не морозит, компрессор не включается.',
+        'Сильно шумит при работе.',
+        'Течет вода под ящиками для овощей.',
+        'Намерзает лед на задней стенке.',
+        'Не горит подсветка, камера теплая.',
+    ],
+    'washing-machine': [
+        'Не отжимает, не сливает воду.',
+        'Не греет воду.',
+        'Сильная вибрация при отжиме.',
+        'Течет из-под дверцы.',
+        'Не открывается люк после стирки.',
+    ],
+    'microwave': [
+        'Не греет, но включается.',
+        'Искрит внутри камеры.',
+        'Не вращается тарелка.',
+        'Не реагирует на кнопки.',
+    ],
+    'dishwasher': [
+        'Не моет посуду, вода не нагревается.',
+        'Не сливает воду.',
+        'Ошибка на дисплее, программа не запускается.',
+        'Остаются разводы на посуде.',
+    ],
+}
+
+# Доля заказов и диапазон предварительной стоимости по типам техники
+APPLIANCE_TYPE_SHARES = {
+    'refrigerator': (35, (2000, 9000)),
+    'washing-machine': (35, (1500, 8000)),
+    'microwave': (15, (800, 3500)),
+    'dishwasher': (15, (1500, 7000)),
+}
+
+STREETS = [
+    'Ленина', 'Пушкина', 'Гагарина', 'Мира', 'Советская', 'Садовая',
+    'Лесная', 'Школьная', 'Центральная', 'Молодежная',
+]
+MALE_NAMES = ['Иван', 'Петр', 'Сергей', 'Алексей', 'Дмитрий', 'Андрей']
+FEMALE_NAMES = ['Мария', 'Анна', 'Елена', 'Ольга', 'Наталья', 'Татьяна']
+SURNAMES = [
+    'Иванов', 'Петров', 'Сидоров', 'Смирнов', 'Кузнецов', 'Попов',
+    'Васильев', 'Соколов', 'Михайлов', 'Новиков', 'Федоров', 'Морозов',
+]
+MALE_PATRONYMICS = ['Иванович', 'Петрович', 'Сергеевич', 'Алексеевич']
+FEMALE_PATRONYMICS = ['Ивановна', 'Петровна', 'Сергеевна', 'Алексеевна']
+
+
+def zipf_weights(count, exponent=1.1):
+    """Накопленные веса: первый элемент встречается чаще всех"""
+    return list(accumulate(1 / rank ** exponent
+                           for rank in range(1, count + 1)))
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Progress:
+    """Вывод хода вставки не чаще раза в секунду"""
+
+    def __init__(self, stdout, label, total):
+        self.stdout = stdout
+        self.label = label
+        self.total = total
+        self.done = 0
+        self.started = self.reported = time.perf_counter()
+
+    @property
+    def rate(self):
+        elapsed = time.perf_counter() - self.started
+        return self.done / elapsed if elapsed else 0.0
+
+    def advance(self, count):
+        self.done += count
+        now = time.perf_counter()
+        if now - self.reported >= 1 or self.done == self.total:
+            self.reported = now
+            self.stdout.write(
+                f'  {self.label}: {self.done}/{self.total} '
+                f'({self.rate:.0f} строк/с)'
+            )
+
 
 class Command(BaseCommand):
     help = 'Создает тестовые данные для мастерской по ремонту'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--orders', type=int, default=0,
+            help='Сгенерировать столько заказов; без параметра создается '
+                 'небольшой демонстрационный набор'
+        )
+        parser.add_argument(
+            '--customers', type=int,
+            help='Количество клиентов (по умолчанию треть от числа заказов)'
+        )
+        parser.add_argument(
+            '--workshops', type=int, default=10,
+            help='Количество мастерских'
+        )
+        parser.add_argument(
+            '--masters', type=int, default=20,
+            help='Количество мастеров'
+        )
+        parser.add_argument(
+            '--seed', type=int, default=42,
+            help='Зерно генератора: один seed дает одинаковые данные'
+        )
+        parser.add_argument(
+            '--days', type=int, default=730,
+            help='За сколько дней до --end-date распределить заказы'
+        )
+        parser.add_argument(
+            '--end-date', type=date.fromisoformat, default=DEFAULT_END_DATE,
+            help='Дата последних заказов, ГГГГ-ММ-ДД'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Строк в одной вставке bulk_create'
+        )
+
     def handle(self, *args, **options):
         self.stdout.write('Создание тестовых данных...')
 
@@ -71,6 +236,13 @@ class Command(BaseCommand):
             if created:
                 self.stdout.write(f'  ✓ Создан тип техники: {at.title}')
 
+        if options['orders']:
+            self.generate(statuses, appliance_types, options)
+        else:
+            self.create_demo_data(statuses, appliance_types)
+
+    def create_demo_data(self, statuses, appliance_types):
+        """Небольшой демонстрационный набор для ручной проверки"""
         # Создание мастерских
         workshops_data = [
             {
@@ -198,13 +370,19 @@ class Command(BaseCommand):
 
         created_orders = 0
         for order_data in orders_data:
-            order, created = RepairOrder.objects.get_or_create(
-                customer=order_data['customer'],
-                appliance_brand=order_data['appliance_brand'],
-                appliance_model=order_data['appliance_model'],
-                created_at__date=order_data['created_at'].date(),
-                defaults=order_data
+            order_data['updated_at'] = (
+                order_data.get('completed_at') or order_data['created_at']
             )
+            # Без этого auto_now_add подменит дату создания на текущую,
+            # и повторный запуск не найдет уже созданные заказы
+            with explicit_timestamps(RepairOrder):
+                order, created = RepairOrder.objects.get_or_create(
+                    customer=order_data['customer'],
+                    appliance_brand=order_data['appliance_brand'],
+                    appliance_model=order_data['appliance_model'],
+                    created_at__date=order_data['created_at'].date(),
+                    defaults=order_data
+                )
             if created:
                 created_orders += 1
                 self.stdout.write(
@@ -225,3 +403,208 @@ class Command(BaseCommand):
             )
         )
 
+    def generate(self, statuses, appliance_types, options):
+        """Синтетические данные заданного объема.
+
+        Строки создаются генераторами и пишутся пачками через
+        bulk_create, каждая пачка в своей транзакции, поэтому память
+        не растет с числом заказов. Все случайные величины берутся
+        из одного random.Random(seed).
+        """
+        rng = random.Random(options['seed'])
+        orders_count = options['orders']
+        customers_count = options['customers'] or max(orders_count // 3, 1)
+        end = timezone.make_aware(
+            datetime.combine(options['end_date'], dt_time())
+        )
+        started = time.perf_counter()
+
+        workshop_ids = self.generate_workshops(rng, options['workshops'])
+        master_ids = self.generate_masters(options['masters'])
+        with explicit_timestamps(Customer, RepairOrder):
+            first_customer_id = self.insert_batches(
+                Customer,
+                self.customer_rows(rng, customers_count, end,
+                                   options['days']),
+                customers_count, options['batch_size'], 'клиенты'
+            )
+            self.insert_batches(
+                RepairOrder,
+                self.order_rows(
+                    rng, orders_count, end, options['days'],
+                    statuses, appliance_types, workshop_ids, master_ids,
+                    first_customer_id, customers_count
+                ),
+                orders_count, options['batch_size'], 'заказы'
+            )
+        # bulk_create не вызывает сигналы, статистику считаем разом
+        rebuild_order_stats()
+        analyze(connection)
+
+        elapsed = time.perf_counter() - started
+        total = customers_count + orders_count
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'\n✓ Готово! Создано клиентов: {customers_count}, '
+                f'заказов: {orders_count} за {elapsed:.1f} с '
+                f'({total / elapsed:.0f} строк/с)'
+            )
+        )
+
+    def generate_workshops(self, rng, count):
+        names = [f'Мастерская №{number}' for number in range(1, count + 1)]
+        existing = set(
+            Workshop.objects.filter(name__in=names)
+            .values_list('name', flat=True)
+        )
+        # Случайные значения берутся и для уже существующих мастерских,
+        # чтобы дальнейшая последовательность не зависела от состояния базы
+        workshops = [
+            Workshop(
+                name=name,
+                address=f'ул. {rng.choice(STREETS)}, '
+                        f'д. {rng.randint(1, 150)}',
+                phone=f'+7 (495) {rng.randint(100, 999)}-'
+                      f'{rng.randint(10, 99)}-{rng.randint(10, 99)}'
+            )
+            for name in names
+        ]
+        Workshop.objects.bulk_create(
+            workshop for workshop in workshops
+            if workshop.name not in existing
+        )
+        # bulk_create не вызывает сигналы: кэш справочников сбрасываем сами
+        invalidate_references()
+        workshops = dict(
+            Workshop.objects.filter(name__in=names).values_list('name', 'id')
+        )
+        return [workshops[name] for name in names]
+
+    def generate_masters(self, count):
+        usernames = [f'master{number:03d}' for number in range(1, count + 1)]
+        # Пароль '!' - заведомо непригодный для входа и, в отличие от
+        # make_password(None), одинаковый при каждом запуске
+        User.objects.bulk_create(
+            [
+                User(username=username, password='!', is_staff=True,
+                     first_name=MALE_NAMES[number % len(MALE_NAMES)],
+                     last_name=SURNAMES[number % len(SURNAMES)])
+                for number, username in enumerate(usernames)
+            ],
+            ignore_conflicts=True
+        )
+        masters = dict(
+            User.objects.filter(username__in=usernames)
+            .values_list('username', 'id')
+        )
+        return [masters[username] for username in usernames]
+
+    def insert_batches(self, model, rows, total, batch_size, label):
+        """Пишет строки пачками и возвращает id первой вставленной.
+
+        Строки одной команды получают id подряд, поэтому диапазон id
+        новых клиентов известен без их загрузки в память.
+        """
+        first_id = None
+        progress = Progress(self.stdout, label, total)
+        for batch in chunked(rows, batch_size):
+            with transaction.atomic():
+                model.objects.bulk_create(batch, batch_size=batch_size)
+                if first_id is None:
+                    last_id = model.objects.aggregate(last=Max('pk'))['last']
+                    first_id = last_id - len(batch) + 1
+            progress.advance(len(batch))
+        return first_id
+
+    def customer_rows(self, rng, count, end, days):
+        for number in range(count):
+            if rng.random() < 0.5:
+                name = (f'{rng.choice(SURNAMES)} {rng.choice(MALE_NAMES)} '
+                        f'{rng.choice(MALE_PATRONYMICS)}')
+            else:
+                name = (f'{rng.choice(SURNAMES)}а {rng.choice(FEMALE_NAMES)} '
+                        f'{rng.choice(FEMALE_PATRONYMICS)}')
+            created_at = end - timedelta(days=days * rng.random())
+            phone = (f'+7 ({rng.randint(900, 999)}) {rng.randint(0, 999):03d}'
+                     f'-{rng.randint(0, 99):02d}-{rng.randint(0, 99):02d}')
+            yield Customer(
+                name=name,
+                phone=phone,
+                # bulk_create не вызывает save()
+                phone_normalized=normalize_phone(phone),
+                email=(f'client{number}@example.com'
+                       if rng.random() < 0.4 else ''),
+                address=(f'ул. {rng.choice(STREETS)}, д. {rng.randint(1, 150)}'
+                         if rng.random() < 0.6 else ''),
+                created_at=created_at,
+            )
+
+    def order_rows(self, rng, count, end, days, statuses, appliance_types,
+                   workshop_ids, master_ids, first_customer_id,
+                   customers_count):
+        slugs = list(APPLIANCE_TYPE_SHARES)
+        slug_weights = list(accumulate(
+            share for share, _ in APPLIANCE_TYPE_SHARES.values()
+        ))
+        brand_weights = {
+            slug: zipf_weights(len(brands)) for slug, brands in BRANDS.items()
+        }
+        workshop_weights = zipf_weights(len(workshop_ids))
+        master_weights = zipf_weights(len(master_ids), exponent=0.5)
+
+        for _ in range(count):
+            slug = rng.choices(slugs, cum_weights=slug_weights)[0]
+            brand = rng.choices(
+                BRANDS[slug], cum_weights=brand_weights[slug]
+            )[0]
+            low, high = APPLIANCE_TYPE_SHARES[slug][1]
+            estimated_cost = Decimal(rng.randrange(low, high, 100))
+
+            # Заказов за последние месяцы больше, чем за ранние
+            age = days * rng.random() ** 1.3
+            created_at = end - timedelta(days=age)
+            accepted_at = created_at + timedelta(
+                minutes=rng.randint(5, 240)
+            )
+            turnaround = rng.lognormvariate(1.0, 0.6)
+            completed_at = final_cost = None
+            if age > turnaround:
+                completed_at = created_at + timedelta(days=turnaround)
+                final_cost = Decimal(
+                    int(estimated_cost * Decimal(rng.uniform(0.9, 1.3)))
+                    // 10 * 10
+                )
+                picked_up = turnaround + rng.expovariate(1 / 3)
+                status = statuses['Выдан' if age > picked_up else 'Готов']
+            else:
+                status = statuses['В работе' if age > 0.5 else 'Принят']
+
+            yield RepairOrder(
+                customer_id=first_customer_id + int(
+                    customers_count * rng.random() ** 1.5
+                ),
+                appliance_type=appliance_types[slug],
+                appliance_brand=brand,
+                appliance_model=(
+                    f'{brand[:2].upper()}{rng.randint(100, 9999)}'
+                    f'{rng.choice("ABCDEFKMSW")}'
+                ),
+                description=rng.choice(FAULTS[slug]),
+                master_id=(
+                    rng.choices(master_ids, cum_weights=master_weights)[0]
+                    if master_ids and rng.random() < 0.9 else None
+                ),
+                workshop_id=(
+                    rng.choices(workshop_ids, cum_weights=workshop_weights)[0]
+                    if workshop_ids else None
+                ),
+                status=status,
+                estimated_cost=estimated_cost,
+                final_cost=final_cost,
+                created_at=created_at,
+                updated_at=completed_at or accepted_at,
+                accepted_at=accepted_at,
+                completed_at=completed_at,
+                is_published=rng.random() < 0.98,
+                tracking_code=generate_tracking_code(rng),
+            )
@@ -0,0 +1,48 @@
+"""
+Команда для снимка данных мастерской в JSON Lines.
+Использование: python manage.py dump_repair [--output repair.jsonl.gz]
+"""
+import gzip
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from repair_shop.repair.snapshot import BATCH_SIZE, dump
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает типы техники, мастерские, статусы, клиентов, заказы '
+        'и мастеров потоком, не загружая их в память'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output',
+            help='Файл снимка; .gz сжимается; по умолчанию - '
+                 'стандартный вывод'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=BATCH_SIZE,
+            help='Сколько строк читать из базы за раз'
+        )
+
+    def handle(self, *args, **options):
+        path = options['output']
+        started = time.perf_counter()
+        if not path:
+            dump(sys.stdout, options['chunk_size'])
+            return
+        if path.endswith('.gz'):
+            output = gzip.open(path, 'wt', encoding='utf-8')
+        else:
+            output = open(path, 'w', encoding='utf-8')
+        with output:
+            counts = dump(output, options['chunk_size'])
+        for model, count in counts.items():
+            self.stdout.write(f'  {model._meta.label}: {count}')
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Снимок записан в {path} за '
+            f'{time.perf_counter() - started:.1f} с'
+        ))
@@ -0,0 +1,84 @@
+"""
+Команда для выгрузки заказов в CSV или JSON Lines.
+Использование: python manage.py export_orders --from 2025-07-01
+    --to 2025-09-30 [--format jsonl] [--gzip] [--output orders.csv.gz]
+"""
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from repair_shop.repair.export import CHUNK_SIZE, export_chunks, export_rows
+from repair_shop.repair.forms import OrderExportForm
+
+
+class Command(BaseCommand):
+    help = 'Выгружает заказы в CSV или JSON Lines потоком'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--format', choices=('csv', 'jsonl'), default='csv'
+        )
+        parser.add_argument(
+            '--output',
+            help='Файл для выгрузки; по умолчанию - стандартный вывод'
+        )
+        parser.add_argument(
+            '--gzip', action='store_true', help='Сжимать выгрузку gzip'
+        )
+        parser.add_argument(
+            '--from', dest='date_from', help='Созданы с даты (ГГГГ-ММ-ДД)'
+        )
+        parser.add_argument(
+            '--to', dest='date_to', help='Созданы по дату включительно'
+        )
+        parser.add_argument('--workshop', help='id мастерской')
+        parser.add_argument('--status', help='id статуса ремонта')
+        parser.add_argument(
+            '--appliance-type', help='Идентификатор (slug) типа техники'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=CHUNK_SIZE,
+            help='Сколько строк читать из базы за раз'
+        )
+
+    def handle(self, *args, **options):
+        form = OrderExportForm({
+            name: options[name]
+            for name in (
+                'format', 'gzip', 'date_from', 'date_to', 'workshop',
+                'status', 'appliance_type'
+            )
+        })
+        if not form.is_valid():
+            raise CommandError(form.errors.as_text())
+        filters = form.cleaned_data
+        export_format = filters.pop('format')
+        compress = filters.pop('gzip')
+        chunks = export_chunks(
+            export_rows(chunk_size=options['chunk_size'], **filters),
+            export_format, compress
+        )
+
+        started = time.perf_counter()
+        written = 0
+        if options['output']:
+            output = open(options['output'], 'wb')
+        else:
+            output = sys.stdout.buffer
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+                written += len(chunk)
+        finally:
+            if options['output']:
+                output.close()
+
+        if options['output']:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'✓ Выгружено {written / 1024 / 1024:.1f} МБ в '
+                    f'{options["output"]} за '
+                    f'{time.perf_counter() - started:.1f} с'
+                )
+            )
@@ -0,0 +1,97 @@
+"""
+Команда для массовой загрузки заказов и клиентов.
+Использование: python manage.py import_orders orders.csv
+    [--dry-run] [--errors errors.csv] [--start-line 120001]
+"""
+import csv
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from repair_shop.repair.importer import (
+    OrderImporter, open_source, read_records
+)
+
+
+class Command(BaseCommand):
+    help = 'Загружает заказы и клиентов из CSV или JSON Lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', help='Файл в формате export_orders; .gz распакуется'
+        )
+        parser.add_argument(
+            '--format', choices=('csv', 'jsonl'),
+            help='Формат файла; по умолчанию - по расширению'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=20_000,
+            help='Сколько заказов писать в одной транзакции'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только проверить файл, ничего не записывая'
+        )
+        parser.add_argument(
+            '--errors', help='CSV-файл для отклоненных строк'
+        )
+        parser.add_argument(
+            '--start-line', type=int, default=1,
+            help='Пропустить записи, начинающиеся раньше этой строки'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        source_format = options['format'] or (
+            'jsonl' if path.removesuffix('.gz').endswith('.jsonl') else 'csv'
+        )
+        try:
+            source = open_source(path)
+        except OSError as error:
+            raise CommandError(f'Не удалось открыть {path}: {error}')
+
+        error_file = error_writer = None
+        if options['errors']:
+            error_file = open(
+                options['errors'], 'w', encoding='utf-8', newline=''
+            )
+            error_writer = csv.writer(error_file)
+            error_writer.writerow(['line', 'error', 'record'])
+
+        def on_error(line, record, error):
+            if error_writer:
+                error_writer.writerow([line, str(error), record])
+            else:
+                self.stderr.write(f'  строка {line}: {error}')
+
+        started = time.perf_counter()
+
+        def on_batch(line):
+            done = importer.imported_orders
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'  {"проверено" if importer.dry_run else "записано"} '
+                f'заказов: {done} ({done / elapsed:.0f}/с), '
+                f'обработано до строки {line}'
+            )
+
+        importer = OrderImporter(options['batch_size'], options['dry_run'])
+        try:
+            with source:
+                errors = importer.run(
+                    read_records(source, source_format),
+                    options['start_line'], on_error, on_batch
+                )
+        finally:
+            if error_file:
+                error_file.close()
+
+        elapsed = time.perf_counter() - started
+        verb = 'Проверено' if options['dry_run'] else 'Загружено'
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'✓ {verb} заказов: {importer.imported_orders}, '
+                f'новых клиентов: {importer.imported_customers}, '
+                f'отклонено строк: {errors} за {elapsed:.1f} с'
+            )
+        )
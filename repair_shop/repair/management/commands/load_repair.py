@@ -0,0 +1,58 @@
+"""
+Команда для загрузки снимка, сделанного dump_repair.
+Использование: python manage.py load_repair repair.jsonl.gz
+    [--batch-size 2000]
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.base import DeserializationError
+from django.db import IntegrityError
+
+from repair_shop.repair.importer import open_source
+from repair_shop.repair.snapshot import BATCH_SIZE, SnapshotError, load
+
+
+class Command(BaseCommand):
+    help = 'Загружает снимок данных мастерской пачками через bulk_create'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', help='Файл снимка dump_repair; .gz распакуется'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Сколько объектов писать в одной транзакции'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        try:
+            source = open_source(path)
+        except OSError as error:
+            raise CommandError(f'Не удалось открыть {path}: {error}')
+
+        started = time.perf_counter()
+        reported = started
+
+        def progress(model, loaded):
+            nonlocal reported
+            now = time.perf_counter()
+            if now - reported >= 1:
+                reported = now
+                self.stdout.write(f'  {model._meta.label}: {loaded}')
+
+        try:
+            with source:
+                counts = load(source, options['batch_size'], progress)
+        except (DeserializationError, SnapshotError, IntegrityError) as error:
+            # Пачки до ошибки уже записаны; повторная загрузка
+            # перезапишет их теми же значениями
+            raise CommandError(f'Снимок не загружен: {error}')
+
+        for model, count in counts.items():
+            self.stdout.write(f'  {model._meta.label}: {count}')
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Загружено {sum(counts.values())} объектов за '
+            f'{time.perf_counter() - started:.1f} с'
+        ))
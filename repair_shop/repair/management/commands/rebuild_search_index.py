@@ -0,0 +1,34 @@
+"""
+Команда для полной перестройки поискового индекса заказов.
+Использование: python manage.py rebuild_search_index [--batch-size 50000]
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from repair_shop.repair.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает полнотекстовый индекс заказов (FTS5)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=50_000,
+            help='Сколько id заказов индексировать за один INSERT'
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        indexed = rebuild_search_index(
+            options['batch_size'],
+            progress=lambda done: self.stdout.write(
+                f'  обработаны заказы до id {done}'
+            )
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'✓ Проиндексировано заказов: {indexed} '
+                f'за {time.perf_counter() - started:.1f} с'
+            )
+        )
@@ -0,0 +1,85 @@
+"""
+Команда для сверки таблиц статистики заказов и времени в статусах
+с заказами и журналом статусов.
+Использование: python manage.py reconcile_order_stats [--check]
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from repair_shop.repair.stats import (
+    current_stats, expected_stats, rebuild_order_stats, stats_drift
+)
+from repair_shop.repair.status_log import (
+    current_durations, expected_durations, rebuild_status_durations
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает статистику заказов и время в статусах с нуля '
+        'и сообщает, где они разошлись с заказами и журналом статусов'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только сообщить о расхождениях, не исправляя их '
+                 '(код возврата 1, если они есть)'
+        )
+        parser.add_argument(
+            '--show', type=int, default=20,
+            help='Сколько расхождений вывести подробно'
+        )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            drift = stats_drift(current_stats(), expected_stats())
+            durations_drift = stats_drift(
+                current_durations(), expected_durations()
+            )
+        else:
+            drift = rebuild_order_stats()
+            durations_drift = rebuild_status_durations()
+
+        self.report_orders(drift, options['show'])
+        self.report_durations(durations_drift, options['show'])
+        if not drift and not durations_drift:
+            self.stdout.write(self.style.SUCCESS('✓ Расхождений нет'))
+            return
+        if options['check']:
+            raise CommandError('Статистика разошлась с заказами')
+        self.stdout.write(self.style.SUCCESS('✓ Статистика пересчитана'))
+
+    def report_orders(self, drift, show):
+        if not drift:
+            return
+        orders_drift = sum(
+            abs(actual[0] - expected[0]) for _, actual, expected in drift
+        )
+        revenue_drift = sum(
+            abs(actual[1] - expected[1]) for _, actual, expected in drift
+        )
+        self.stdout.write(
+            f'Расхождений: {len(drift)} строк, '
+            f'заказов: {orders_drift}, выручки: {revenue_drift}'
+        )
+        for key, actual, expected in drift[:show]:
+            month, workshop_id, status_id, appliance_type_id = key
+            self.stdout.write(
+                f'  {month:%Y-%m} мастерская={workshop_id} '
+                f'статус={status_id} тип={appliance_type_id}: '
+                f'{actual[0]} / {actual[1]} вместо '
+                f'{expected[0]} / {expected[1]}'
+            )
+
+    def report_durations(self, drift, show):
+        if not drift:
+            return
+        self.stdout.write(f'Время в статусах: расхождений {len(drift)} строк')
+        for key, actual, expected in drift[:show]:
+            status_id, workshop_id, master_id, appliance_type_id = key
+            self.stdout.write(
+                f'  статус={status_id} мастерская={workshop_id} '
+                f'мастер={master_id} тип={appliance_type_id}: '
+                f'{actual[0]} / {actual[1]} с вместо '
+                f'{expected[0]} / {expected[1]} с'
+            )
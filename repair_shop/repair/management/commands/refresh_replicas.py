@@ -0,0 +1,37 @@
+"""
+Команда для обновления локальных реплик SQLite копией основной базы.
+Использование: python manage.py refresh_replicas [--alias replica]
+"""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from repair_shop.repair.routers import refresh_replica
+
+
+class Command(BaseCommand):
+    help = 'Копирует основную базу в реплики из DATABASE_REPLICAS'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--alias', action='append',
+            help='Обновить только эту реплику (можно несколько раз)'
+        )
+
+    def handle(self, *args, **options):
+        aliases = options['alias'] or settings.DATABASE_REPLICAS
+        unknown = set(aliases) - set(settings.DATABASE_REPLICAS)
+        if unknown:
+            raise CommandError(
+                f'Не реплики: {", ".join(sorted(unknown))}'
+            )
+        if not aliases:
+            raise CommandError('DATABASE_REPLICAS пуст')
+        for alias in aliases:
+            started = time.perf_counter()
+            refresh_replica(alias)
+            self.stdout.write(self.style.SUCCESS(
+                f'✓ {alias} обновлена за '
+                f'{time.perf_counter() - started:.1f} с'
+            ))
@@ -0,0 +1,71 @@
+"""
+Команда для отправки уведомлений клиентам из очереди (outbox).
+Использование: python manage.py run_outbox_worker [--batch-size 500]
+    [--once]
+"""
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from repair_shop.repair.notifications import new_worker_id, process_batch
+
+
+class Command(BaseCommand):
+    help = 'Отправляет уведомления из очереди пачками, с повторами'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int,
+            default=settings.NOTIFICATIONS['BATCH_SIZE'],
+            help='Сколько уведомлений забирать за раз'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=1.0,
+            help='Пауза, когда очередь пуста, секунд'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Разобрать очередь и завершиться'
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше нуля')
+        worker_id = new_worker_id()
+        stopping = False
+
+        def stop(signum, frame):
+            nonlocal stopping
+            # Начатая пачка дописывается, новая не берется
+            stopping = True
+
+        if not options['once']:
+            signal.signal(signal.SIGTERM, stop)
+            signal.signal(signal.SIGINT, stop)
+
+        total_sent = total_failed = 0
+        started = time.perf_counter()
+        while not stopping:
+            # Воркер живет долго: соединение переоткрывается по
+            # CONN_MAX_AGE, как между запросами сайта
+            close_old_connections()
+            sent, failed = process_batch(worker_id, options['batch_size'])
+            total_sent += sent
+            total_failed += failed
+            if sent or failed:
+                self.stdout.write(
+                    f'  отправлено: {sent}, отложено после ошибки: {failed}'
+                )
+            elif options['once']:
+                break
+            else:
+                time.sleep(options['interval'])
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Отправлено {total_sent}, с ошибкой {total_failed} '
+            f'за {elapsed:.1f} с'
+        ))
@@ -0,0 +1,170 @@
+"""
+Нагрузка на базу из нескольких потоков: писатели меняют статусы заказов,
+читатели открывают первую страницу списка заказов. Каждая операция
+обрамлена так же, как запрос в Django: старые соединения закрываются
+до и после нее. Профиль default - стандартный SQLite (журнал DELETE, без
+PRAGMA, соединение на каждый запрос, BEGIN DEFERRED), tuned - настройки
+из settings.py.
+Использование:
+    python manage.py stress_db --writers 4 --readers 8 --duration 10
+"""
+import random
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections, connection
+from django.test.utils import override_settings
+
+from repair_shop.repair.benchmarks import percentile, use_database
+from repair_shop.repair.models import RepairOrder, RepairStatus
+from repair_shop.repair.pagination import paginate
+
+PROFILES = ('default', 'tuned')
+
+
+class Worker(threading.Thread):
+    """Поток, повторяющий операцию до истечения deadline"""
+
+    def __init__(self, operation, deadline, seed):
+        super().__init__(daemon=True)
+        self.operation = operation
+        self.deadline = deadline
+        self.random = random.Random(seed)
+        self.latencies = []
+        self.lock_errors = 0
+        self.other_errors = 0
+
+    def run(self):
+        try:
+            while time.perf_counter() < self.deadline:
+                close_old_connections()
+                started = time.perf_counter()
+                try:
+                    self.operation(self.random)
+                except OperationalError as error:
+                    if 'locked' in str(error) or 'busy' in str(error):
+                        self.lock_errors += 1
+                    else:
+                        self.other_errors += 1
+                else:
+                    self.latencies.append(time.perf_counter() - started)
+                finally:
+                    close_old_connections()
+        finally:
+            connection.close()
+
+
+class Command(BaseCommand):
+    help = 'Нагружает базу потоками писателей и читателей'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument(
+            '--duration', type=float, default=10,
+            help='Секунд на каждый профиль'
+        )
+        parser.add_argument(
+            '--profile', choices=[*PROFILES, 'both'], default='both'
+        )
+        parser.add_argument(
+            '--database', type=Path,
+            default=Path(settings.BASE_DIR) / 'bench_data' / 'stress.sqlite3',
+            help='Отдельная база SQLite для нагрузки'
+        )
+        parser.add_argument(
+            '--orders', type=int, default=20_000,
+            help='Сколько заказов сгенерировать в пустой базе'
+        )
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        options['database'].parent.mkdir(parents=True, exist_ok=True)
+        profiles = PROFILES if options['profile'] == 'both' else [
+            options['profile']
+        ]
+        with use_database(options['database']) as db:
+            call_command('migrate', verbosity=0)
+            if not RepairOrder.objects.exists():
+                self.stderr.write(
+                    f'{options["database"].name}: генерация заказов'
+                )
+                call_command(
+                    'create_test_data', orders=options['orders'],
+                    seed=options['seed'], stdout=self.stderr
+                )
+            self.order_ids = list(
+                RepairOrder.objects.values_list('pk', flat=True)
+            )
+            self.status_ids = list(
+                RepairStatus.objects.values_list('pk', flat=True)
+            )
+            original = {
+                key: db.settings_dict[key]
+                for key in ('CONN_MAX_AGE', 'OPTIONS')
+            }
+            try:
+                for profile in profiles:
+                    result = self.run_profile(db, profile, original, options)
+                    self.report(profile, result, options['duration'])
+            finally:
+                db.settings_dict.update(original)
+
+    def run_profile(self, db, profile, tuned, options):
+        pragmas, database_settings = settings.SQLITE_PRAGMAS, tuned
+        if profile == 'default':
+            pragmas = {}
+            database_settings = {'CONN_MAX_AGE': 0, 'OPTIONS': {}}
+            # Режим журнала хранится в файле базы, его надо вернуть явно
+            db.close()
+            with db.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode = delete')
+        db.close()
+        db.settings_dict.update(database_settings)
+        with override_settings(SQLITE_PRAGMAS=pragmas):
+            deadline = time.perf_counter() + options['duration']
+            writers = [
+                Worker(self.write, deadline, options['seed'] + number)
+                for number in range(options['writers'])
+            ]
+            readers = [
+                Worker(self.read, deadline, -number)
+                for number in range(options['readers'])
+            ]
+            for worker in writers + readers:
+                worker.start()
+            for worker in writers + readers:
+                worker.join()
+        db.close()
+        return writers, readers
+
+    def write(self, rng):
+        """Смена статуса заказа через save(): сигналы, индекс, статистика"""
+        order = RepairOrder.objects.get(pk=rng.choice(self.order_ids))
+        order.status_id = rng.choice(self.status_ids)
+        order.save()
+
+    def read(self, rng):
+        """Первая страница главной"""
+        paginate(RepairOrder.objects.published().select_related(
+            'customer', 'appliance_type', 'workshop', 'status'
+        ))
+
+    def report(self, profile, result, duration):
+        for role, workers in zip(('запись', 'чтение'), result):
+            latencies = [
+                latency for worker in workers for latency in worker.latencies
+            ]
+            locked = sum(worker.lock_errors for worker in workers)
+            other = sum(worker.other_errors for worker in workers)
+            p95 = percentile(latencies, 95) * 1000 if latencies else 0
+            self.stdout.write(
+                f'{profile:8} {role:7} потоков {len(workers):3}  '
+                f'{len(latencies) / duration:8.1f} оп/с  '
+                f'p95 {p95:8.1f} мс  '
+                f'«database is locked» {locked:5}  прочих ошибок {other}'
+            )
@@ -0,0 +1,79 @@
+"""
+Команда для прогрева кэшей самых посещаемых страниц после деплоя.
+Использование: python manage.py warm_cache [--workers 4] [--budget 60]
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.test.utils import override_settings
+
+from repair_shop.repair.warmup import warm, warm_urls
+
+
+class Command(BaseCommand):
+    help = (
+        'Запрашивает главную, списки по типам техники и мастерским '
+        'и последние заказы, чтобы заполнить кэши'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help='Сколько страниц рендерить одновременно'
+        )
+        parser.add_argument(
+            '--budget', type=float, default=60,
+            help='Время на прогрев, секунд; остальные страницы пропускаются'
+        )
+        parser.add_argument(
+            '--orders', type=int, default=100,
+            help='Сколько последних заказов прогреть'
+        )
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers должен быть больше нуля')
+        if isinstance(caches['default'], (LocMemCache, DummyCache)):
+            self.stderr.write(self.style.WARNING(
+                'Кэш живет в памяти процесса: воркеры сайта не увидят '
+                'прогретых карточек, прогреется только кэш ОС для базы'
+            ))
+        urls = warm_urls(options['orders'])
+        application = get_wsgi_application()
+        hosts = [*settings.ALLOWED_HOSTS, 'localhost']
+        started = time.perf_counter()
+        warmed = skipped = failed = 0
+        with override_settings(ALLOWED_HOSTS=hosts):
+            for result in warm(application, urls, options['workers'],
+                               options['budget']):
+                if result.status is None:
+                    skipped += 1
+                    continue
+                line = (
+                    f'{result.status} {result.duration * 1000:8.1f} мс  '
+                    f'{result.url}'
+                )
+                if result.status == 200:
+                    warmed += 1
+                    self.stdout.write(line)
+                else:
+                    failed += 1
+                    self.stdout.write(self.style.ERROR(line))
+
+        summary = (
+            f'Прогрето {warmed} из {len(urls)} страниц за '
+            f'{time.perf_counter() - started:.1f} с'
+        )
+        if skipped:
+            summary += f', не успели: {skipped}'
+        if failed:
+            summary += f', с ошибкой: {failed}'
+        if warmed == len(urls):
+            self.stdout.write(self.style.SUCCESS(summary))
+        else:
+            self.stdout.write(self.style.WARNING(summary))
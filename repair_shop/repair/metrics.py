@@ -0,0 +1,401 @@
+"""Метрики процесса в текстовом формате Prometheus.
+
+Счетчики и гистограммы пишутся без блокировок: у каждого потока свой
+словарь значений, и только при сборе (запрос к /metrics) словари всех
+потоков суммируются. Гейджи (gauge) вычисляются в момент сбора.
+
+При нескольких воркерах каждый процесс раз в METRICS['FLUSH_INTERVAL']
+секунд сбрасывает свои значения в файл каталога
+METRICS['MULTIPROCESS_DIR'], а /metrics складывает файлы всех
+процессов. Файлы завершившихся процессов остаются, чтобы счетчики
+не уменьшались; каталог очищают при деплое, до запуска воркеров.
+"""
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+import uuid
+import weakref
+from bisect import bisect_left
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import Count
+
+from .models import RepairOrder
+
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+
+def new_process_id():
+    # pid может достаться новому процессу, а файл прежнего владельца
+    # перезаписывать нельзя
+    return f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+
+
+PROCESS_ID = new_process_id()
+
+
+def escape_label(value):
+    return (
+        str(value).replace('\\', r'\\').replace('"', r'\"')
+        .replace('\n', r'\n')
+    )
+
+
+def format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    labels = ','.join(f'{name}="{escape_label(value)}"'
+                      for name, value in pairs)
+    return f'{{{labels}}}'
+
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def header(self):
+        return [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} {self.type}',
+        ]
+
+    def key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+
+class ShardedMetric(Metric):
+    """Метрика, значения которой потоки пишут каждый в свой словарь.
+
+    Когда поток завершается, его словарь прибавляется к общему
+    словарю завершенных потоков: иначе каждый поток, когда-либо
+    записавший значение, навсегда оставался бы в списке.
+    """
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.start_fresh()
+
+    def start_fresh(self):
+        """Забывает значения и блокировки, например после fork"""
+        self._shards_lock = threading.Lock()
+        self._retired = {}
+        self._shards = [self._retired]
+        # Последним: прежний local при сборке вызовет retire() для
+        # словарей, которых в новом списке уже нет
+        self._local = threading.local()
+
+    def shard(self):
+        values = getattr(self._local, 'values', None)
+        if values is None:
+            # Блокировка нужна один раз на поток, а не на каждую запись
+            values = self._local.values = {}
+            # Данные local удаляются вместе с потоком, а с ними и owner
+            owner = self._local.owner = ThreadOwner()
+            weakref.finalize(owner, self.retire, values).atexit = False
+            with self._shards_lock:
+                self._shards.append(values)
+        return values
+
+    def retire(self, values):
+        """Переносит словарь завершенного потока в общий"""
+        with self._shards_lock:
+            shards = [shard for shard in self._shards if shard is not values]
+            if len(shards) == len(self._shards):
+                return
+            self._shards = shards
+            for key, value in values.items():
+                self._retired[key] = self.merge(self._retired.get(key), value)
+
+    def values(self):
+        """{метки: значение} по всем потокам процесса"""
+        with self._shards_lock:
+            shards = [shard.copy() for shard in self._shards]
+        merged = {}
+        for shard in shards:
+            for key, value in shard.items():
+                merged[key] = self.merge(merged.get(key), value)
+        return merged
+
+    def reset(self):
+        with self._shards_lock:
+            for shard in self._shards:
+                shard.clear()
+
+
+class ThreadOwner:
+    """Объект в данных потока, на сборку которого подписан finalize"""
+
+
+class Counter(ShardedMetric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        values = self.shard()
+        key = self.key(labels)
+        values[key] = values.get(key, 0) + amount
+
+    @staticmethod
+    def merge(total, value):
+        return value if total is None else total + value
+
+    def samples(self, values):
+        for key, value in sorted(values.items()):
+            yield self.name + format_labels(self.labelnames, key), value
+
+
+class Histogram(ShardedMetric):
+    """Гистограмма: число наблюдений по корзинам плюс сумма"""
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(),
+                 buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        # Границы всегда float: le="1.0", как у клиентов Prometheus
+        self.buckets = (*map(float, buckets), math.inf)
+
+    def observe(self, value, **labels):
+        values = self.shard()
+        key = self.key(labels)
+        entry = values.get(key)
+        if entry is None:
+            # Число попаданий в каждую корзину и сумма последним элементом
+            entry = values[key] = [0] * (len(self.buckets) + 1)
+        entry[bisect_left(self.buckets, value)] += 1
+        entry[-1] += value
+
+    @staticmethod
+    def merge(total, value):
+        if total is None:
+            return list(value)
+        return [a + b for a, b in zip(total, value)]
+
+    def samples(self, values):
+        for key, entry in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry):
+                cumulative += count
+                yield self.name + '_bucket' + format_labels(
+                    self.labelnames, key, [('le', format_value(bound))]
+                ), cumulative
+            labels = format_labels(self.labelnames, key)
+            yield f'{self.name}_sum{labels}', entry[-1]
+            yield f'{self.name}_count{labels}', cumulative
+
+
+class Gauge(Metric):
+    """Значение, которое вычисляет функция collect() в момент сбора"""
+
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), collect=None):
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+
+    def samples(self, values):
+        for key, value in sorted(values.items()):
+            yield self.name + format_labels(self.labelnames, key), value
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def snapshot(self):
+        """Значения счетчиков и гистограмм процесса для файла"""
+        return {
+            name: [[list(key), value]
+                   for key, value in metric.values().items()]
+            for name, metric in self.metrics.items()
+            if isinstance(metric, ShardedMetric)
+        }
+
+    def collect(self, snapshots=()):
+        """Значения всех метрик: свои плюс снимки других процессов"""
+        collected = {}
+        for name, metric in self.metrics.items():
+            if isinstance(metric, Gauge):
+                collected[name] = metric.collect()
+                continue
+            values = metric.values()
+            for snapshot in snapshots:
+                for key, value in snapshot.get(name, []):
+                    key = tuple(key)
+                    values[key] = metric.merge(values.get(key), value)
+            collected[name] = values
+        return collected
+
+    def exposition(self, snapshots=()):
+        """Текстовый формат Prometheus"""
+        lines = []
+        for name, values in self.collect(snapshots).items():
+            metric = self.metrics[name]
+            lines.extend(metric.header())
+            lines.extend(
+                f'{sample} {format_value(value)}'
+                for sample, value in metric.samples(values)
+            )
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        for metric in self.metrics.values():
+            if isinstance(metric, ShardedMetric):
+                metric.reset()
+
+    def start_fresh(self):
+        for metric in self.metrics.values():
+            if isinstance(metric, ShardedMetric):
+                metric.start_fresh()
+
+
+registry = Registry()
+
+_last_flush = 0.0
+_flush_lock = threading.Lock()
+
+
+def _after_fork():
+    # Воркер, запущенный fork от мастер-процесса, начинает свой файл
+    # и не повторяет значений, накопленных родителем. Блокировки тоже
+    # новые: в момент fork их мог держать другой поток родителя
+    global PROCESS_ID, _last_flush, _flush_lock
+    PROCESS_ID = new_process_id()
+    _last_flush = 0.0
+    _flush_lock = threading.Lock()
+    registry.start_fresh()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def process_file(directory):
+    return Path(directory) / f'{PROCESS_ID}.json'
+
+
+def flush(directory):
+    """Атомарно записывает значения процесса в его файл"""
+    path = process_file(directory)
+    data = json.dumps(registry.snapshot())
+    handle, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(handle, 'w') as file:
+        file.write(data)
+    os.replace(temporary, path)
+
+
+def maybe_flush():
+    """Сбрасывает значения в файл, если прошло FLUSH_INTERVAL секунд"""
+    global _last_flush
+    directory = settings.METRICS['MULTIPROCESS_DIR']
+    if not directory:
+        return
+    now = time.monotonic()
+    if now - _last_flush < settings.METRICS['FLUSH_INTERVAL']:
+        return
+    # Запрос, которому блокировка не досталась, не ждет: файл
+    # в этот момент и так обновляется
+    if not _flush_lock.acquire(blocking=False):
+        return
+    try:
+        _last_flush = now
+        flush(directory)
+    finally:
+        _flush_lock.release()
+
+
+def other_processes(directory):
+    """Снимки из файлов всех процессов, кроме текущего"""
+    own = process_file(directory).name
+    snapshots = []
+    for path in Path(directory).glob('*.json'):
+        if path.name == own:
+            continue
+        try:
+            snapshots.append(json.loads(path.read_text()))
+        except (OSError, ValueError):
+            # Файл удален между glob и чтением
+            continue
+    return snapshots
+
+
+def exposition():
+    directory = settings.METRICS['MULTIPROCESS_DIR']
+    snapshots = other_processes(directory) if directory else ()
+    return registry.exposition(snapshots)
+
+
+def open_orders_by_status():
+    """Незавершенные заказы по статусам, по частичному индексу"""
+    # references импортирует этот модуль ради счетчиков кэша
+    from .references import references
+
+    statuses = references().statuses
+    rows = RepairOrder.objects.filter(
+        completed_at__isnull=True
+    ).values_list('status').annotate(total=Count('pk')).order_by()
+    return {
+        (statuses[pk].name if pk in statuses else 'без статуса',): total
+        for pk, total in rows
+    }
+
+
+REQUESTS = registry.register(Counter(
+    'repairshop_http_requests_total',
+    'Запросы к страницам repair и pages',
+    ('view', 'method', 'status')
+))
+REQUEST_DURATION = registry.register(Histogram(
+    'repairshop_http_request_duration_seconds',
+    'Время ответа страницы',
+    ('view',)
+))
+DB_QUERIES = registry.register(Histogram(
+    'repairshop_db_queries_per_request',
+    'Число SQL-запросов на запрос страницы',
+    ('view',),
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100)
+))
+DB_DURATION = registry.register(Histogram(
+    'repairshop_db_duration_seconds',
+    'Суммарное время SQL на запрос страницы',
+    ('view',),
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+))
+CACHE_REQUESTS = registry.register(Counter(
+    'repairshop_cache_requests_total',
+    'Обращения к кэшам: result="hit" или "miss"',
+    ('cache', 'result')
+))
+OPEN_ORDERS = registry.register(Gauge(
+    'repairshop_open_orders',
+    'Незавершенные заказы по статусам',
+    ('status',),
+    collect=open_orders_by_status
+))
+
+
+def record_cache(cache, hits, misses):
+    if hits:
+        CACHE_REQUESTS.inc(hits, cache=cache, result='hit')
+    if misses:
+        CACHE_REQUESTS.inc(misses, cache=cache, result='miss')
@@ -0,0 +1,301 @@
+import gzip
+import heapq
+import logging
+import random
+import secrets
+import string
+import struct
+import time
+import zlib
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.middleware.gzip import GZipMiddleware
+from django.template.base import Template
+from django.utils.cache import patch_vary_headers
+
+from . import metrics
+from .benchmarks import QueryRecorder
+from .routers import finish_routing, start_routing
+from .utils import accepted_encodings
+
+logger = logging.getLogger(__name__)
+
+_active_profile = ContextVar('request_profile', default=None)
+
+
+class RequestProfile:
+    """Счетчики одного запроса: SQL, шаблоны и общее время"""
+
+    def __init__(self, worst_queries=3):
+        self.worst_queries = worst_queries
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.statements = {}
+        self.slowest = []
+
+    @property
+    def duplicates(self):
+        """Повторы одного и того же SQL - признак N+1"""
+        return self.queries - len(self.statements)
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.queries += 1
+            self.sql_time += duration
+            self.statements[sql] = self.statements.get(sql, 0) + 1
+            entry = (duration, self.queries, sql)
+            if len(self.slowest) < self.worst_queries:
+                heapq.heappush(self.slowest, entry)
+            else:
+                heapq.heappushpop(self.slowest, entry)
+
+    def worst(self):
+        return sorted(self.slowest, reverse=True)
+
+
+def _profiled_render(render):
+    def inner(self, context):
+        profile = _active_profile.get()
+        if profile is None:
+            return render(self, context)
+        # Вложенные include считаются внутри внешнего шаблона
+        profile.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return render(self, context)
+        finally:
+            profile.template_depth -= 1
+            if not profile.template_depth:
+                profile.template_time += time.perf_counter() - started
+    inner.profiled = True
+    return inner
+
+
+class RequestProfilingMiddleware:
+    """Число и время SQL-запросов, время шаблонов и всего запроса.
+
+    Итоги отдаются в заголовке Server-Timing, медленные запросы пишутся
+    в лог вместе с самыми долгими SQL. Настройки - REQUEST_PROFILING;
+    выключенный middleware Django не загружает вовсе.
+    """
+
+    def __init__(self, get_response):
+        config = settings.REQUEST_PROFILING
+        if not config['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = config['SAMPLE_RATE']
+        self.slow_request_ms = config['SLOW_REQUEST_MS']
+        self.worst_queries = config['WORST_QUERIES']
+        if not getattr(Template.render, 'profiled', False):
+            Template.render = _profiled_render(Template.render)
+
+    def __call__(self, request):
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        profile = RequestProfile(self.worst_queries)
+        token = _active_profile.set(profile)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile))
+                response = self.get_response(request)
+        finally:
+            _active_profile.reset(token)
+        total_ms = (time.perf_counter() - started) * 1000
+
+        response['Server-Timing'] = (
+            f'db;dur={profile.sql_time * 1000:.1f};'
+            f'desc="{profile.queries} queries, '
+            f'{profile.duplicates} duplicate", '
+            f'tpl;dur={profile.template_time * 1000:.1f}, '
+            f'total;dur={total_ms:.1f}'
+        )
+        if total_ms >= self.slow_request_ms:
+            logger.warning(
+                'Медленный запрос %s %s: %.1f мс, SQL %d шт. (повторов %d) '
+                'за %.1f мс, шаблоны %.1f мс. Самые долгие запросы:\n%s',
+                request.method, request.get_full_path(), total_ms,
+                profile.queries, profile.duplicates,
+                profile.sql_time * 1000, profile.template_time * 1000,
+                '\n'.join(
+                    f'  {duration * 1000:.1f} мс: {sql}'
+                    for duration, _, sql in profile.worst()
+                )
+            )
+        return response
+
+
+class MetricsMiddleware:
+    """Счетчики, время ответа и SQL страниц repair и pages для /metrics.
+
+    Настройки - METRICS; при ENABLED = False middleware не подключается.
+    """
+
+    namespaces = {'repair', 'pages'}
+
+    def __init__(self, get_response):
+        if not settings.METRICS['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+        match = request.resolver_match
+        if match is not None and match.namespace in self.namespaces:
+            view = match.view_name
+            metrics.REQUESTS.inc(
+                view=view, method=request.method,
+                status=response.status_code
+            )
+            metrics.REQUEST_DURATION.observe(duration, view=view)
+            metrics.DB_QUERIES.observe(recorder.count, view=view)
+            metrics.DB_DURATION.observe(recorder.duration, view=view)
+        metrics.maybe_flush()
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """Отправляет чтения публичных страниц на реплики.
+
+    Публичные - GET и HEAD к представлениям repair, pages и api. После
+    записи (любой POST или изменение базы в запросе) пользователь
+    получает cookie, и REPLICA_STICKY_SECONDS его запросы читают из
+    основной базы: так он сразу видит свои изменения, даже если
+    реплика отстает. Без DATABASE_REPLICAS middleware не подключается.
+    """
+
+    public_namespaces = {'repair', 'pages', 'api'}
+    cookie_name = 'primary_until'
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        routing, token = start_routing()
+        request.replica_routing = routing
+        try:
+            response = self.get_response(request)
+        finally:
+            finish_routing(token)
+        if routing.wrote or request.method not in ('GET', 'HEAD'):
+            seconds = settings.REPLICA_STICKY_SECONDS
+            response.set_cookie(
+                self.cookie_name, str(time.time() + seconds),
+                max_age=seconds, httponly=True, samesite='Lax'
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.replica_routing.use_replica = (
+            request.method in ('GET', 'HEAD')
+            and request.resolver_match.namespace in self.public_namespaces
+            and not self.sticks_to_primary(request)
+        )
+
+    def sticks_to_primary(self, request):
+        try:
+            until = float(request.COOKIES.get(self.cookie_name, 0))
+        except ValueError:
+            return False
+        return until > time.time()
+
+
+# Типы, которые уже сжаты: повторное сжатие тратит CPU впустую
+INCOMPRESSIBLE_TYPES = (
+    'image/', 'video/', 'audio/', 'application/gzip', 'application/zip',
+    'font/woff',
+)
+
+
+def gzip_header(max_random_bytes):
+    """Заголовок gzip с именем файла случайной длины.
+
+    Та же защита от BREACH, что у GZipMiddleware: длина ответа
+    меняется от запроса к запросу, и по ней не подобрать секрет
+    со страницы, отражающей ввод пользователя.
+    """
+    length = secrets.randbelow(max_random_bytes) + 1
+    name = ''.join(
+        secrets.choice(string.ascii_letters) for _ in range(length)
+    )
+    # Без времени изменения (mtime=0), ОС неизвестна (255)
+    return (
+        b'\x1f\x8b\x08' + bytes([gzip.FNAME]) + bytes(4) + b'\x00\xff'
+        + name.encode() + b'\x00'
+    )
+
+
+def compress_stream(chunks, level, max_random_bytes):
+    """Сжимает поток, отдавая каждый кусок сразу после получения"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    crc = size = 0
+    yield gzip_header(max_random_bytes)
+    for chunk in chunks:
+        crc = zlib.crc32(chunk, crc)
+        size += len(chunk)
+        data = compressor.compress(chunk) + compressor.flush(
+            zlib.Z_SYNC_FLUSH
+        )
+        if data:
+            yield data
+    yield compressor.flush() + struct.pack('<2L', crc, size & 0xffffffff)
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """GZipMiddleware с порогом размера и быстрым сжатием потоков.
+
+    Настройки - RESPONSE_COMPRESSION. Ответы меньше MIN_SIZE байт
+    и уже сжатые типы не сжимаются: выигрыш не окупает заголовки gzip
+    и время сжатия. Обычные ответы сжимает сам GZipMiddleware, вместе
+    с его защитой от BREACH. Потоковые сжимаются с уровнем
+    STREAMING_LEVEL и отправляются по кускам сразу: GZipMiddleware
+    копит их в буфере сжатия.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        config = settings.RESPONSE_COMPRESSION
+        self.min_size = config['MIN_SIZE']
+        self.streaming_level = config['STREAMING_LEVEL']
+
+    def process_response(self, request, response):
+        content_type = response.get('Content-Type', '')
+        if (response.has_header('Content-Encoding')
+                or content_type.startswith(INCOMPRESSIBLE_TYPES)
+                or not response.streaming
+                and len(response.content) < self.min_size):
+            return response
+        # GZipMiddleware сжал бы и для «gzip;q=0»
+        if 'gzip' not in accepted_encodings(request):
+            patch_vary_headers(response, ('Accept-Encoding',))
+            return response
+        chunks = None
+        if response.streaming and not response.is_async:
+            chunks = response.streaming_content
+        response = super().process_response(request, response)
+        if chunks is not None and response.get('Content-Encoding') == 'gzip':
+            response.streaming_content = compress_stream(
+                chunks, self.streaming_level, self.max_random_bytes
+            )
+        return response
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repair', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='repairorder',
+            index=models.Index(fields=['workshop', 'created_at', 'id'], name='order_workshop_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='repairorder',
+            index=models.Index(fields=['appliance_type', 'created_at', 'id'], name='order_type_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='repairorder',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['created_at', 'id'], name='order_published_created_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repair', '0002_repairorder_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='repairorder',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='Дата изменения'),
+        ),
+    ]
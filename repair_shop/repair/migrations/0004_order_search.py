@@ -0,0 +1,100 @@
+from django.db import migrations
+
+# Телефон индексируется трижды: как записан, одними цифрами и последними
+# десятью цифрами, чтобы находился и «+7 (999) 111», и «9991112233».
+DIGITS = (
+    "REPLACE(REPLACE(REPLACE(REPLACE(REPLACE({phone}, ' ', ''), '(', ''), "
+    "')', ''), '-', ''), '+', '')"
+)
+PHONE = "{phone} || ' ' || {digits} || ' ' || SUBSTR({digits}, -10)"
+
+
+def phone(column):
+    return PHONE.format(phone=column, digits=DIGITS.format(phone=column))
+
+
+def fold(column):
+    # unicode61 не считает «ё» вариантом «е», сводим их при индексации
+    return f"REPLACE(REPLACE({column}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+INSERT_ORDER = f"""
+    INSERT INTO repair_order_search(
+        rowid, description, appliance_brand, appliance_model,
+        customer_name, customer_phone
+    )
+    SELECT NEW.id, {fold('NEW.description')}, NEW.appliance_brand,
+           NEW.appliance_model, {fold('c.name')}, {phone('c.phone')}
+    FROM repair_customer c WHERE c.id = NEW.customer_id;
+"""
+
+FORWARD = [
+    """
+    CREATE VIRTUAL TABLE repair_order_search USING fts5(
+        description, appliance_brand, appliance_model,
+        customer_name, customer_phone,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3 4'
+    );
+    """,
+    f"""
+    CREATE TRIGGER repair_order_search_insert
+    AFTER INSERT ON repair_repairorder BEGIN
+        {INSERT_ORDER}
+    END;
+    """,
+    """
+    CREATE TRIGGER repair_order_search_delete
+    AFTER DELETE ON repair_repairorder BEGIN
+        DELETE FROM repair_order_search WHERE rowid = OLD.id;
+    END;
+    """,
+    f"""
+    CREATE TRIGGER repair_order_search_update
+    AFTER UPDATE OF description, appliance_brand, appliance_model,
+        customer_id ON repair_repairorder BEGIN
+        DELETE FROM repair_order_search WHERE rowid = OLD.id;
+        {INSERT_ORDER}
+    END;
+    """,
+    f"""
+    CREATE TRIGGER repair_order_search_customer_update
+    AFTER UPDATE OF name, phone ON repair_customer BEGIN
+        UPDATE repair_order_search
+        SET customer_name = {fold('NEW.name')},
+            customer_phone = {phone('NEW.phone')}
+        WHERE rowid IN (
+            SELECT id FROM repair_repairorder WHERE customer_id = NEW.id
+        );
+    END;
+    """,
+    f"""
+    INSERT INTO repair_order_search(
+        rowid, description, appliance_brand, appliance_model,
+        customer_name, customer_phone
+    )
+    SELECT o.id, {fold('o.description')}, o.appliance_brand,
+           o.appliance_model, {fold('c.name')}, {phone('c.phone')}
+    FROM repair_repairorder o
+    JOIN repair_customer c ON c.id = o.customer_id;
+    """,
+]
+
+BACKWARD = [
+    'DROP TRIGGER IF EXISTS repair_order_search_customer_update;',
+    'DROP TRIGGER IF EXISTS repair_order_search_update;',
+    'DROP TRIGGER IF EXISTS repair_order_search_delete;',
+    'DROP TRIGGER IF EXISTS repair_order_search_insert;',
+    'DROP TABLE IF EXISTS repair_order_search;',
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repair', '0003_repairorder_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunSQL(FORWARD, BACKWARD),
+    ]
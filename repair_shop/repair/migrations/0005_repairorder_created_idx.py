@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repair', '0004_order_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='repairorder',
+            index=models.Index(fields=['created_at', 'id'], name='order_created_idx'),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.db.models.functions.comparison
+
+
+def fill_order_stats(apps, schema_editor):
+    RepairOrder = apps.get_model('repair', 'RepairOrder')
+    OrderStats = apps.get_model('repair', 'OrderStats')
+    rows = RepairOrder.objects.annotate(
+        month=models.functions.TruncMonth(
+            'created_at', output_field=models.DateField()
+        )
+    ).values(
+        'month', 'workshop_id', 'status_id', 'appliance_type_id'
+    ).annotate(
+        total=models.Count('pk'),
+        total_revenue=models.Sum('final_cost')
+    ).order_by()
+    OrderStats.objects.bulk_create(
+        (
+            OrderStats(
+                month=row['month'],
+                workshop_id=row['workshop_id'],
+                status_id=row['status_id'],
+                appliance_type_id=row['appliance_type_id'],
+                orders=row['total'],
+                revenue=row['total_revenue'] or 0
+            )
+            for row in rows.iterator()
+        ),
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repair', '0005_repairorder_created_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(verbose_name='Месяц')),
+                ('orders', models.IntegerField(default=0, verbose_name='Заказов')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Выручка')),
+                ('appliance_type', models.ForeignKey(null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='repair.appliancetype', verbose_name='Тип техники')),
+                ('status', models.ForeignKey(null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='repair.repairstatus', verbose_name='Статус ремонта')),
+                ('workshop', models.ForeignKey(null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='repair.workshop', verbose_name='Мастерская')),
+            ],
+            options={
+                'verbose_name': 'статистика заказов',
+                'verbose_name_plural': 'Статистика заказов',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='orderstats',
+            constraint=models.UniqueConstraint(models.F('month'), django.db.models.functions.comparison.Coalesce('workshop', 0), django.db.models.functions.comparison.Coalesce('status', 0), django.db.models.functions.comparison.Coalesce('appliance_type', 0), name='order_stats_unique_key'),
+        ),
+        migrations.RunPython(fill_order_stats, migrations.RunPython.noop),
+    ]
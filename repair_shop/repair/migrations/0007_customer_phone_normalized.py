@@ -0,0 +1,70 @@
+# Generated by Django 4.2.30 on 2026-10-18 21:40
+
+from django.db import migrations, models
+
+from repair_shop.repair.utils import normalize_phone
+
+BATCH_SIZE = 2000
+
+
+def fill_phone_normalized(apps, schema_editor):
+    Customer = apps.get_model('repair', 'Customer')
+    customers = Customer.objects.only('phone').order_by('pk')
+    batch = []
+    for customer in customers.iterator(chunk_size=BATCH_SIZE):
+        customer.phone_normalized = normalize_phone(customer.phone)
+        batch.append(customer)
+        if len(batch) == BATCH_SIZE:
+            Customer.objects.bulk_update(batch, ['phone_normalized'])
+            batch = []
+    Customer.objects.bulk_update(batch, ['phone_normalized'])
+
+
+# Колонка добавляется через ALTER TABLE: AddField с NOT NULL в SQLite
+# пересоздает таблицу, а вместе с ней пропали бы триггеры поиска
+# на repair_customer из 0004_order_search
+ADD_COLUMN = [
+    """
+    ALTER TABLE repair_customer
+    ADD COLUMN phone_normalized varchar(20) NOT NULL DEFAULT '';
+    """,
+]
+CREATE_INDEX = [
+    """
+    CREATE INDEX repair_customer_phone_normalized_3968f956
+    ON repair_customer (phone_normalized);
+    """,
+]
+DROP_INDEX = ['DROP INDEX repair_customer_phone_normalized_3968f956;']
+DROP_COLUMN = ['ALTER TABLE repair_customer DROP COLUMN phone_normalized;']
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repair', '0006_orderstats'),
+    ]
+
+    # Индекс строится после заполнения: так быстрее, чем обновлять его
+    # на каждой строке
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(ADD_COLUMN, DROP_COLUMN),
+            ],
+            state_operations=[
+                migrations.AddField(
+                    model_name='customer',
+                    name='phone_normalized',
+                    field=models.CharField(db_index=True, default='', editable=False, max_length=20, verbose_name='Телефон (только цифры)'),
+                    preserve_default=False,
+                ),
+            ],
+        ),
+        migrations.RunPython(fill_phone_normalized, migrations.RunPython.noop),
+        migrations.RunSQL(CREATE_INDEX, DROP_INDEX),
+        migrations.AddIndex(
+            model_name='repairorder',
+            index=models.Index(fields=['customer', 'created_at', 'id'], name='order_customer_created_idx'),
+        ),
+    ]
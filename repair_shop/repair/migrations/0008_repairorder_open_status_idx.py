@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 21:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repair', '0007_customer_phone_normalized'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='repairorder',
+            index=models.Index(condition=models.Q(('completed_at__isnull', True)), fields=['status'], name='order_open_status_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.30 on 2026-10-18 22:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repair', '0008_repairorder_open_status_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Notification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('channel', models.CharField(blank=True, choices=[('email', 'Email'), ('sms', 'SMS')], max_length=10, verbose_name='Канал')),
+                ('recipient', models.CharField(blank=True, max_length=256, verbose_name='Получатель')),
+                ('subject', models.CharField(blank=True, max_length=256, verbose_name='Тема')),
+                ('body', models.TextField(blank=True, verbose_name='Текст')),
+                ('key', models.CharField(max_length=100, unique=True, verbose_name='Ключ идемпотентности')),
+                ('state', models.CharField(choices=[('pending', 'Ожидает отправки'), ('sent', 'Отправлено'), ('failed', 'Не отправлено')], default='pending', max_length=10, verbose_name='Состояние')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Попыток')),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Отправить не раньше')),
+                ('claimed_by', models.CharField(blank=True, max_length=64, verbose_name='Воркер')),
+                ('claimed_until', models.DateTimeField(blank=True, null=True, verbose_name='Занято воркером до')),
+                ('last_error', models.TextField(blank=True, verbose_name='Последняя ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создано')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='Отправлено')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='repair.repairorder', verbose_name='Заказ')),
+            ],
+            options={
+                'verbose_name': 'уведомление',
+                'verbose_name_plural': 'Уведомления',
+                'indexes': [models.Index(condition=models.Q(('state', 'pending')), fields=['available_at', 'id'], name='notification_pending_idx')],
+            },
+        ),
+    ]
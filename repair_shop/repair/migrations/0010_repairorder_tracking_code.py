@@ -0,0 +1,74 @@
+# Generated by Django 4.2.30 on 2026-10-18 22:40
+
+from django.db import migrations, models
+
+import repair_shop.repair.utils
+from repair_shop.repair.utils import generate_tracking_code
+
+BATCH_SIZE = 2000
+
+
+def fill_tracking_codes(apps, schema_editor):
+    RepairOrder = apps.get_model('repair', 'RepairOrder')
+    table = RepairOrder._meta.db_table
+    orders = RepairOrder.objects.filter(tracking_code='').order_by('pk')
+    last = 0
+    while True:
+        ids = list(
+            orders.filter(pk__gt=last).values_list('pk', flat=True)[
+                :BATCH_SIZE
+            ]
+        )
+        if not ids:
+            break
+        # executemany, а не bulk_update: тот строит CASE на каждую строку
+        with schema_editor.connection.cursor() as cursor:
+            cursor.executemany(
+                f'UPDATE {table} SET tracking_code = %s WHERE id = %s',
+                [(generate_tracking_code(), pk) for pk in ids]
+            )
+        last = ids[-1]
+
+
+# Как в 0007: AddField в SQLite пересоздал бы таблицу заказов, и с ней
+# пропали бы триггеры поискового индекса из 0004_order_search
+ADD_COLUMN = [
+    """
+    ALTER TABLE repair_repairorder
+    ADD COLUMN tracking_code varchar(16) NOT NULL DEFAULT '';
+    """,
+]
+DROP_COLUMN = ['ALTER TABLE repair_repairorder DROP COLUMN tracking_code;']
+# Уникальный индекс строится после заполнения: до него у всех строк
+# одинаковый пустой код
+CREATE_INDEX = [
+    """
+    CREATE UNIQUE INDEX repair_repairorder_tracking_code_uniq
+    ON repair_repairorder (tracking_code);
+    """,
+]
+DROP_INDEX = ['DROP INDEX repair_repairorder_tracking_code_uniq;']
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repair', '0009_notification'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(ADD_COLUMN, DROP_COLUMN),
+            ],
+            state_operations=[
+                migrations.AddField(
+                    model_name='repairorder',
+                    name='tracking_code',
+                    field=models.CharField(default=repair_shop.repair.utils.generate_tracking_code, editable=False, max_length=16, unique=True, verbose_name='Код отслеживания'),
+                ),
+            ],
+        ),
+        migrations.RunPython(fill_tracking_codes, migrations.RunPython.noop),
+        migrations.RunSQL(CREATE_INDEX, DROP_INDEX),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.2.30 on 2026-10-18 21:49
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.db.models.functions.comparison
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('repair', '0010_repairorder_tracking_code'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatusDurationStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('transitions', models.IntegerField(default=0, verbose_name='Выходов из статуса')),
+                ('seconds', models.BigIntegerField(default=0, verbose_name='Секунд в статусе')),
+                ('appliance_type', models.ForeignKey(null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='repair.appliancetype', verbose_name='Тип техники')),
+                ('master', models.ForeignKey(null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Мастер')),
+                ('status', models.ForeignKey(null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='repair.repairstatus', verbose_name='Статус ремонта')),
+                ('workshop', models.ForeignKey(null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='repair.workshop', verbose_name='Мастерская')),
+            ],
+            options={
+                'verbose_name': 'время в статусах',
+                'verbose_name_plural': 'Время в статусах',
+            },
+        ),
+        migrations.CreateModel(
+            name='StatusEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('previous_duration', models.DurationField(blank=True, null=True, verbose_name='Время в прежнем статусе')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Время смены')),
+                ('appliance_type', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='repair.appliancetype', verbose_name='Тип техники')),
+                ('master', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Мастер')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_events', to='repair.repairorder', verbose_name='Заказ')),
+                ('previous_status', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='repair.repairstatus', verbose_name='Прежний статус')),
+                ('status', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='repair.repairstatus', verbose_name='Новый статус')),
+                ('workshop', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='repair.workshop', verbose_name='Мастерская')),
+            ],
+            options={
+                'verbose_name': 'смена статуса',
+                'verbose_name_plural': 'Журнал статусов',
+                'indexes': [models.Index(fields=['order', 'created_at', 'id'], name='status_event_order_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='statusdurationstats',
+            constraint=models.UniqueConstraint(django.db.models.functions.comparison.Coalesce('status', 0), django.db.models.functions.comparison.Coalesce('workshop', 0), django.db.models.functions.comparison.Coalesce('master', 0), django.db.models.functions.comparison.Coalesce('appliance_type', 0), name='status_duration_unique_key'),
+        ),
+    ]
@@ -1,6 +1,11 @@
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Coalesce, Substr
+from django.urls import reverse
+from django.utils import timezone
+
+from .utils import generate_tracking_code, normalize_phone
 
 User = get_user_model()
 
@@ -55,6 +60,14 @@ class Customer(models.Model):
     """Клиент мастерской"""
     name = models.CharField('Имя', max_length=256)
     phone = models.CharField('Телефон', max_length=20)
+    # Заполняется в save(); поиск по телефону - точное сравнение
+    # по индексу вместо LIKE по записанному как угодно номеру
+    phone_normalized = models.CharField(
+        'Телефон (только цифры)',
+        max_length=20,
+        db_index=True,
+        editable=False
+    )
     email = models.EmailField('Email', blank=True)
     address = models.CharField('Адрес', max_length=512, blank=True)
     created_at = models.DateTimeField('Добавлено', auto_now_add=True)
@@ -66,6 +79,18 @@ class Customer(models.Model):
     def __str__(self):
         return f"{self.name} ({self.phone})"
 
+    def get_absolute_url(self):
+        return reverse(
+            'repair:customer_detail', kwargs={'customer_id': self.pk}
+        )
+
+    def save(self, *args, **kwargs):
+        self.phone_normalized = normalize_phone(self.phone)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'phone' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'phone_normalized'}
+        super().save(*args, **kwargs)
+
 
 class RepairStatus(models.Model):
     """Статус ремонта"""
@@ -83,6 +108,40 @@ class RepairStatus(models.Model):
         return self.name
 
 
+# Сколько символов описания нужно карточке: она показывает 15 слов,
+# и запас позволяет понять, что текст длиннее и нужно многоточие
+CARD_DESCRIPTION_CHARS = 300
+
+# Колонки заказа и клиента, которые выводит карточка; тип техники,
+# мастерская и статус подставляются из кэша справочников
+CARD_FIELDS = (
+    'created_at', 'updated_at', 'appliance_brand', 'estimated_cost',
+    'final_cost', 'appliance_type', 'workshop', 'status',
+    'customer__name', 'customer__phone',
+)
+
+
+class RepairOrderQuerySet(models.QuerySet):
+    def published(self):
+        """Заказы, которые видны на сайте"""
+        return self.filter(
+            is_published=True,
+            appliance_type__is_published=True
+        )
+
+    def cards(self):
+        """Только то, что нужно карточке в списке заказов.
+
+        Полное описание не загружается: вместо него description_preview
+        с первыми CARD_DESCRIPTION_CHARS символами, обрезанными в SQL.
+        """
+        return self.select_related('customer').only(*CARD_FIELDS).annotate(
+            description_preview=Substr(
+                'description', 1, CARD_DESCRIPTION_CHARS
+            )
+        )
+
+
 class RepairOrder(models.Model):
     """Заказ на ремонт"""
     customer = models.ForeignKey(
@@ -139,14 +198,338 @@ class RepairOrder(models.Model):
         validators=[MinValueValidator(0)]
     )
     created_at = models.DateTimeField('Дата создания', auto_now_add=True)
+    updated_at = models.DateTimeField('Дата изменения', auto_now=True)
     accepted_at = models.DateTimeField('Дата принятия', null=True, blank=True)
     completed_at = models.DateTimeField('Дата завершения', null=True, blank=True)
     is_published = models.BooleanField('Отображать', default=True)
+    # Публичная ссылка /track/<код>/ вместо последовательного id
+    tracking_code = models.CharField(
+        'Код отслеживания',
+        max_length=16,
+        unique=True,
+        default=generate_tracking_code,
+        editable=False
+    )
+
+    objects = RepairOrderQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'заказ на ремонт'
         verbose_name_plural = 'Заказы на ремонт'
         ordering = ['-created_at']
+        # Индексы повторяют форму запросов публичных страниц:
+        # фильтр по мастерской или типу техники и сортировка
+        # по (created_at, id) для курсорной пагинации.
+        indexes = [
+            models.Index(
+                fields=['workshop', 'created_at', 'id'],
+                name='order_workshop_created_idx'
+            ),
+            models.Index(
+                fields=['appliance_type', 'created_at', 'id'],
+                name='order_type_created_idx'
+            ),
+            models.Index(
+                fields=['customer', 'created_at', 'id'],
+                name='order_customer_created_idx'
+            ),
+            models.Index(
+                fields=['created_at', 'id'],
+                name='order_published_created_idx',
+                condition=models.Q(is_published=True)
+            ),
+            # Гейдж незавершенных заказов по статусам на /metrics
+            models.Index(
+                fields=['status'],
+                name='order_open_status_idx',
+                condition=models.Q(completed_at__isnull=True)
+            ),
+            # Сортировка списка заказов в админке, без фильтров
+            models.Index(
+                fields=['created_at', 'id'],
+                name='order_created_idx'
+            ),
+        ]
 
     def __str__(self):
         return f"Заказ #{self.id} - {self.customer.name} ({self.appliance_brand})"
+
+    def get_tracking_url(self):
+        return reverse(
+            'repair:track_order', kwargs={'code': self.tracking_code}
+        )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Значения на момент загрузки: по ним обработчики сигналов
+        # узнают, что изменилось при сохранении, без лишнего запроса
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Вместе с заказом в той же транзакции обновляется статистика
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+        self._loaded_values = {
+            field.attname: self.__dict__[field.attname]
+            for field in self._meta.concrete_fields
+            if field.attname in self.__dict__
+        }
+
+
+class OrderStats(models.Model):
+    """Число заказов и выручка в разрезе мастерской, статуса, типа и месяца.
+
+    Строки обновляются приращениями при сохранении и удалении заказов
+    (см. stats.py); сверить их с заказами можно командой
+    reconcile_order_stats.
+    """
+    month = models.DateField('Месяц')
+    workshop = models.ForeignKey(
+        Workshop,
+        on_delete=models.DO_NOTHING,
+        null=True,
+        related_name='+',
+        verbose_name='Мастерская'
+    )
+    status = models.ForeignKey(
+        RepairStatus,
+        on_delete=models.DO_NOTHING,
+        null=True,
+        related_name='+',
+        verbose_name='Статус ремонта'
+    )
+    appliance_type = models.ForeignKey(
+        ApplianceType,
+        on_delete=models.DO_NOTHING,
+        null=True,
+        related_name='+',
+        verbose_name='Тип техники'
+    )
+    orders = models.IntegerField('Заказов', default=0)
+    revenue = models.DecimalField(
+        'Выручка',
+        max_digits=14,
+        decimal_places=2,
+        default=0
+    )
+
+    class Meta:
+        verbose_name = 'статистика заказов'
+        verbose_name_plural = 'Статистика заказов'
+        # NULL в обычном уникальном индексе не равен сам себе, поэтому
+        # ключ сравнивается через COALESCE: иначе два параллельных
+        # писателя могли бы завести две строки «без мастерской».
+        constraints = [
+            models.UniqueConstraint(
+                'month',
+                Coalesce('workshop', 0),
+                Coalesce('status', 0),
+                Coalesce('appliance_type', 0),
+                name='order_stats_unique_key'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.month:%m.%Y}: {self.orders} заказов'
+
+
+class StatusEvent(models.Model):
+    """Смена статуса заказа; журнал только пополняется.
+
+    Пишется при каждом сохранении заказа с новым статусом и при
+    массовой смене статуса в админке (см. status_log.py). Мастерская,
+    мастер и тип техники - на момент смены: по ним время в прежнем
+    статусе попадает в StatusDurationStats.
+    """
+    order = models.ForeignKey(
+        RepairOrder,
+        on_delete=models.CASCADE,
+        related_name='status_events',
+        verbose_name='Заказ'
+    )
+    previous_status = models.ForeignKey(
+        RepairStatus,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='Прежний статус'
+    )
+    status = models.ForeignKey(
+        RepairStatus,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='Новый статус'
+    )
+    # Сколько заказ пробыл в прежнем статусе; пусто, если время входа
+    # в него неизвестно (первый статус или заказ старше журнала)
+    previous_duration = models.DurationField(
+        'Время в прежнем статусе', null=True, blank=True
+    )
+    workshop = models.ForeignKey(
+        Workshop,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='Мастерская'
+    )
+    master = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='Мастер'
+    )
+    appliance_type = models.ForeignKey(
+        ApplianceType,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='Тип техники'
+    )
+    created_at = models.DateTimeField('Время смены', default=timezone.now)
+
+    class Meta:
+        verbose_name = 'смена статуса'
+        verbose_name_plural = 'Журнал статусов'
+        indexes = [
+            # Последняя смена статуса заказа - время входа в текущий
+            models.Index(
+                fields=['order', 'created_at', 'id'],
+                name='status_event_order_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return (
+            f'Заказ #{self.order_id}: {self.previous_status} → {self.status}'
+        )
+
+
+class StatusDurationStats(models.Model):
+    """Время в статусах в разрезе мастерской, мастера и типа техники.
+
+    Строки обновляются приращениями при каждой записи в StatusEvent
+    (см. status_log.py); пересобрать их по журналу можно командой
+    reconcile_order_stats.
+    """
+    status = models.ForeignKey(
+        RepairStatus,
+        on_delete=models.DO_NOTHING,
+        null=True,
+        related_name='+',
+        verbose_name='Статус ремонта'
+    )
+    workshop = models.ForeignKey(
+        Workshop,
+        on_delete=models.DO_NOTHING,
+        null=True,
+        related_name='+',
+        verbose_name='Мастерская'
+    )
+    master = models.ForeignKey(
+        User,
+        on_delete=models.DO_NOTHING,
+        null=True,
+        related_name='+',
+        verbose_name='Мастер'
+    )
+    appliance_type = models.ForeignKey(
+        ApplianceType,
+        on_delete=models.DO_NOTHING,
+        null=True,
+        related_name='+',
+        verbose_name='Тип техники'
+    )
+    transitions = models.IntegerField('Выходов из статуса', default=0)
+    seconds = models.BigIntegerField('Секунд в статусе', default=0)
+
+    class Meta:
+        verbose_name = 'время в статусах'
+        verbose_name_plural = 'Время в статусах'
+        # COALESCE по той же причине, что и в OrderStats
+        constraints = [
+            models.UniqueConstraint(
+                Coalesce('status', 0),
+                Coalesce('workshop', 0),
+                Coalesce('master', 0),
+                Coalesce('appliance_type', 0),
+                name='status_duration_unique_key'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.status_id}: {self.transitions} выходов'
+
+
+class Notification(models.Model):
+    """Уведомление клиента в очереди на отправку (outbox).
+
+    Пишется в той же транзакции, что и смена статуса заказа, а
+    отправляет его команда run_outbox_worker.
+    """
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATE_CHOICES = [
+        (PENDING, 'Ожидает отправки'),
+        (SENT, 'Отправлено'),
+        (FAILED, 'Не отправлено'),
+    ]
+    EMAIL = 'email'
+    SMS = 'sms'
+    CHANNEL_CHOICES = [(EMAIL, 'Email'), (SMS, 'SMS')]
+
+    order = models.ForeignKey(
+        RepairOrder,
+        on_delete=models.CASCADE,
+        related_name='notifications',
+        verbose_name='Заказ'
+    )
+    # Канал, получателя и текст заполняет воркер перед первой отправкой
+    channel = models.CharField(
+        'Канал', max_length=10, choices=CHANNEL_CHOICES, blank=True
+    )
+    recipient = models.CharField('Получатель', max_length=256, blank=True)
+    subject = models.CharField('Тема', max_length=256, blank=True)
+    body = models.TextField('Текст', blank=True)
+    # Передается шлюзу: повтор после сбоя не приведет ко второму письму
+    key = models.CharField(
+        'Ключ идемпотентности', max_length=100, unique=True
+    )
+    state = models.CharField(
+        'Состояние', max_length=10, choices=STATE_CHOICES, default=PENDING
+    )
+    attempts = models.PositiveIntegerField('Попыток', default=0)
+    available_at = models.DateTimeField(
+        'Отправить не раньше', default=timezone.now
+    )
+    claimed_by = models.CharField('Воркер', max_length=64, blank=True)
+    claimed_until = models.DateTimeField(
+        'Занято воркером до', null=True, blank=True
+    )
+    last_error = models.TextField('Последняя ошибка', blank=True)
+    created_at = models.DateTimeField('Создано', auto_now_add=True)
+    sent_at = models.DateTimeField('Отправлено', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'уведомление'
+        verbose_name_plural = 'Уведомления'
+        indexes = [
+            # Очередь воркера: только неотправленные, по времени попытки
+            models.Index(
+                fields=['available_at', 'id'],
+                name='notification_pending_idx',
+                condition=models.Q(state='pending')
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.get_channel_display()} {self.recipient}: {self.key}'
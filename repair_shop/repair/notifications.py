@@ -0,0 +1,285 @@
+"""Уведомления клиентов о готовности заказа через outbox.
+
+Смена статуса на NOTIFICATIONS['READY_STATUS'] только добавляет строку
+Notification в транзакцию сохранения заказа (см. signals.py): сохранение
+в админке не ждет почтового сервера или SMS-шлюза, а уведомление
+не потеряется и не уйдет, если транзакция откатится. Получателя и
+текст воркер составляет сам перед первой отправкой.
+
+Команда run_outbox_worker забирает строки пачками: захват - один
+UPDATE с арендой на LEASE_SECONDS, поэтому воркеров может быть
+несколько, а строки упавшего воркера через время аренды заберет
+другой. Ошибка откладывает отправку на RETRY_DELAY * 2^(попытка-1)
+секунд (не больше RETRY_MAX_DELAY) со случайным разбросом; после
+MAX_ATTEMPTS попыток уведомление помечается как неотправленное.
+"""
+import json
+import random
+import threading
+import uuid
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Notification, RepairOrder
+from .references import references
+
+SUBJECT = 'Заказ №{order.pk} готов'
+BODY = (
+    '{customer.name}, ремонт {order.appliance_brand} завершен. '
+    'Заказ №{order.pk} можно забрать в мастерской{workshop}.'
+)
+SMS_BODY = 'Заказ №{order.pk} ({order.appliance_brand}) готов, ждем вас.'
+
+
+def notification_key(order):
+    # Статус может стать «готов» повторно: новое событие - новый ключ
+    return f'order-ready:{order.pk}:{order.updated_at.timestamp():.6f}'
+
+
+def enqueue_ready_notification(order):
+    """Ставит в очередь уведомление, если заказ перешел в статус «готов».
+
+    Вызывается внутри транзакции сохранения заказа и добавляет к ней
+    только один INSERT: получатель и текст определяет воркер, одним
+    запросом на пачку. Повторный вызов для того же сохранения ничего
+    не добавит: ключ уникален.
+    """
+    # Статус, заведенный только что, снимок справочников может еще
+    # не содержать
+    status = references().statuses.get(order.status_id) or order.status
+    if status is None or (
+        status.name != settings.NOTIFICATIONS['READY_STATUS']
+    ):
+        return None
+    return enqueue_ready_notifications([order])[0]
+
+
+def enqueue_ready_notifications(orders):
+    """Ставит в очередь уведомления заказам, уже переведенным в «готов»"""
+    notifications = [
+        Notification(order=order, key=notification_key(order))
+        for order in orders
+    ]
+    Notification.objects.bulk_create(notifications, ignore_conflicts=True)
+    return notifications
+
+
+def compose(notification, order):
+    """Заполняет канал, получателя и текст по заказу и его клиенту"""
+    customer = order.customer
+    workshop = references().workshops.get(order.workshop_id)
+    context = {
+        'order': order,
+        'customer': customer,
+        'workshop': f' «{workshop}»' if workshop else '',
+    }
+    if customer.email:
+        notification.channel = Notification.EMAIL
+        notification.recipient = customer.email
+        notification.subject = SUBJECT.format(**context)
+        notification.body = BODY.format(**context)
+    else:
+        notification.channel = Notification.SMS
+        notification.recipient = customer.phone_normalized or customer.phone
+        notification.body = SMS_BODY.format(**context)
+
+
+def compose_new(notifications):
+    """Составляет тексты уведомлений, которые еще не составлены.
+
+    Тексты сохраняются: повторная попытка отправит то же самое, а
+    в админке видно, что ушло клиенту.
+    """
+    new = [
+        notification for notification in notifications
+        if not notification.recipient
+    ]
+    if not new:
+        return
+    orders = RepairOrder.objects.select_related('customer').in_bulk(
+        {notification.order_id for notification in new}
+    )
+    for notification in new:
+        compose(notification, orders[notification.order_id])
+    # executemany, а не bulk_update: тот строит CASE на каждую строку
+    # и на пачке в сотни уведомлений дороже самой отправки
+    table = Notification._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'UPDATE {table} SET channel = %s, recipient = %s, '
+            f'subject = %s, body = %s WHERE id = %s',
+            [
+                (notification.channel, notification.recipient,
+                 notification.subject, notification.body, notification.pk)
+                for notification in new
+            ]
+        )
+
+
+class EmailBackend:
+    """Письма через почтовый бэкенд Django (EMAIL_BACKEND).
+
+    Локально это файлы в EMAIL_FILE_PATH, в тестах - django.core.mail.outbox.
+    Ключ уходит в Message-ID: по нему почтовый сервер и клиент
+    отбрасывают повтор письма.
+    """
+
+    def send_messages(self, notifications):
+        messages = [
+            EmailMessage(
+                notification.subject, notification.body,
+                to=[notification.recipient],
+                headers={'Message-ID': f'<{notification.key}@repair-shop>'},
+            )
+            for notification in notifications
+        ]
+        # Одно соединение на пачку; ошибка соединения - ошибка всей пачки
+        get_connection().send_messages(messages)
+        return {}
+
+
+class FileSMSBackend:
+    """Заглушка SMS-шлюза: сообщения дописываются в JSON Lines файл"""
+
+    _lock = threading.Lock()
+
+    def send_messages(self, notifications):
+        path = Path(settings.NOTIFICATIONS['SMS_FILE_PATH'])
+        path.parent.mkdir(parents=True, exist_ok=True)
+        lines = ''.join(
+            json.dumps({
+                'key': notification.key,
+                'phone': notification.recipient,
+                'text': notification.body,
+            }, ensure_ascii=False) + '\n'
+            for notification in notifications
+        )
+        with self._lock, open(path, 'a', encoding='utf-8') as file:
+            file.write(lines)
+        return {}
+
+
+class MemorySMSBackend:
+    """Заглушка SMS-шлюза в памяти для тестов и замеров.
+
+    Как настоящий шлюз, не отправляет второй раз сообщение с уже
+    принятым ключом.
+    """
+
+    outbox = {}
+
+    def send_messages(self, notifications):
+        for notification in notifications:
+            self.outbox.setdefault(notification.key, notification)
+        return {}
+
+
+def get_backend(channel):
+    return import_string(settings.NOTIFICATIONS['BACKENDS'][channel])()
+
+
+def retry_delay(attempts):
+    """Пауза перед следующей попыткой после attempts неудачных, секунд"""
+    config = settings.NOTIFICATIONS
+    delay = min(
+        config['RETRY_DELAY'] * 2 ** (attempts - 1), config['RETRY_MAX_DELAY']
+    )
+    # Разброс, чтобы отложенные после общего сбоя уведомления
+    # не вернулись к шлюзу все в одну секунду
+    return delay * random.uniform(0.5, 1)
+
+
+def new_worker_id():
+    return uuid.uuid4().hex
+
+
+def claim(worker_id, batch_size):
+    """Забирает до batch_size готовых к отправке уведомлений.
+
+    UPDATE повторяет условия выборки, поэтому строку, которую между
+    выборкой и UPDATE занял другой воркер, этот не получит.
+    """
+    now = timezone.now()
+    until = now + timedelta(seconds=settings.NOTIFICATIONS['LEASE_SECONDS'])
+    available = Notification.objects.filter(
+        state=Notification.PENDING, available_at__lte=now
+    ).exclude(claimed_until__gt=now)
+    ids = list(
+        available.order_by('available_at', 'pk')
+        .values_list('pk', flat=True)[:batch_size]
+    )
+    if not ids:
+        return []
+    available.filter(pk__in=ids).update(
+        claimed_by=worker_id, claimed_until=until
+    )
+    return list(Notification.objects.filter(
+        pk__in=ids, claimed_by=worker_id, claimed_until=until
+    ).order_by('pk'))
+
+
+def send_claimed(notifications):
+    """Отправляет пачку; возвращает {id уведомления: текст ошибки}"""
+    errors = {}
+    by_channel = {}
+    for notification in notifications:
+        by_channel.setdefault(notification.channel, []).append(notification)
+    for channel, batch in by_channel.items():
+        try:
+            errors.update(get_backend(channel).send_messages(batch))
+        except Exception as error:
+            # Шлюз недоступен: вся пачка канала уйдет на повтор
+            errors.update(
+                (notification.pk, f'{type(error).__name__}: {error}')
+                for notification in batch
+            )
+    return errors
+
+
+def record_results(notifications, errors):
+    """Отмечает отправленные и откладывает упавшие уведомления"""
+    now = timezone.now()
+    sent = [
+        notification.pk for notification in notifications
+        if notification.pk not in errors
+    ]
+    Notification.objects.filter(pk__in=sent).update(
+        state=Notification.SENT, sent_at=now, claimed_by='',
+        claimed_until=None
+    )
+    failed = [
+        notification for notification in notifications
+        if notification.pk in errors
+    ]
+    for notification in failed:
+        notification.attempts += 1
+        notification.last_error = errors[notification.pk]
+        notification.claimed_by = ''
+        notification.claimed_until = None
+        if notification.attempts >= settings.NOTIFICATIONS['MAX_ATTEMPTS']:
+            notification.state = Notification.FAILED
+        else:
+            notification.available_at = now + timedelta(
+                seconds=retry_delay(notification.attempts)
+            )
+    Notification.objects.bulk_update(
+        failed,
+        ['attempts', 'last_error', 'claimed_by', 'claimed_until', 'state',
+         'available_at']
+    )
+    return len(sent), len(failed)
+
+
+def process_batch(worker_id, batch_size):
+    """Одна пачка: захват, отправка, запись итогов; (отправлено, ошибок)"""
+    notifications = claim(worker_id, batch_size)
+    if not notifications:
+        return 0, 0
+    compose_new(notifications)
+    return record_results(notifications, send_claimed(notifications))
@@ -0,0 +1,149 @@
+"""Курсорная (keyset) пагинация списков заказов.
+
+Страница выбирается условием по паре (created_at, id) вместо OFFSET,
+поэтому глубокие страницы стоят столько же, сколько первая.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+from operator import attrgetter
+
+from django.db.models import Q
+from django.http import Http404
+
+ORDERS_PER_PAGE = 10
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+# id вне диапазона INTEGER SQLite (signed 64 bit) база не примет
+MAX_PK = 2 ** 63 - 1
+
+# Позиция строки выборки: (created_at, id)
+model_position = attrgetter('created_at', 'pk')
+
+
+class InvalidCursor(ValueError):
+    """Курсор поврежден или сформирован не нами"""
+
+
+def encode_cursor(direction, created_at, pk):
+    """Упаковывает позицию в непрозрачный токен для URL"""
+    raw = json.dumps([direction, created_at.isoformat(), pk])
+    token = base64.urlsafe_b64encode(raw.encode())
+    return token.decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Распаковывает токен в (направление, created_at, id)"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        direction, created_at, pk = json.loads(
+            base64.urlsafe_b64decode(padded.encode())
+        )
+        created_at = datetime.fromisoformat(created_at)
+    except (binascii.Error, TypeError, ValueError) as error:
+        raise InvalidCursor(token) from error
+    if direction not in (NEXT, PREVIOUS) or not isinstance(pk, int) or (
+        isinstance(pk, bool) or not -MAX_PK - 1 <= pk <= MAX_PK
+    ):
+        raise InvalidCursor(token)
+    return direction, created_at, pk
+
+
+class KeysetPage:
+    """Страница выборки с токенами соседних страниц"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def page_window(queryset, cursor=None, per_page=ORDERS_PER_PAGE):
+    """Выборка окна страницы: на одну строку больше размера страницы.
+
+    Лишняя строка показывает, есть ли страница дальше по направлению
+    движения. Возвращает направление и срез queryset.
+    """
+    direction = NEXT
+    if cursor:
+        direction, created_at, pk = decode_cursor(cursor)
+        # Отдельное условие-диапазон по created_at нужно планировщику:
+        # по одному OR он выбирает MULTI-INDEX OR и сортирует всю
+        # выборку вместо чтения индекса с позиции курсора
+        if direction == NEXT:
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(pk__lt=pk),
+                created_at__lte=created_at,
+            )
+        else:
+            queryset = queryset.filter(
+                Q(created_at__gt=created_at) | Q(pk__gt=pk),
+                created_at__gte=created_at,
+            )
+    if direction == NEXT:
+        queryset = queryset.order_by('-created_at', '-pk')
+    else:
+        queryset = queryset.order_by('created_at', 'pk')
+    return direction, queryset[:per_page + 1]
+
+
+def paginate(queryset, cursor=None, per_page=ORDERS_PER_PAGE,
+             position=model_position):
+    """Возвращает страницу заказов, новые сверху, за один запрос.
+
+    position(строка) дает (created_at, id) строки; для выборок
+    values_list его нужно передать явно.
+    """
+    direction, window = page_window(queryset, cursor, per_page)
+    rows = list(window)
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if direction == PREVIOUS:
+        rows.reverse()
+    if not rows:
+        return KeysetPage(rows)
+
+    # Раз мы пришли по курсору, страница с противоположной стороны есть
+    if direction == NEXT:
+        has_next, has_previous = has_more, bool(cursor)
+    else:
+        has_next, has_previous = True, has_more
+    next_cursor = previous_cursor = None
+    if has_next:
+        next_cursor = encode_cursor(NEXT, *position(rows[-1]))
+    if has_previous:
+        previous_cursor = encode_cursor(PREVIOUS, *position(rows[0]))
+    return KeysetPage(rows, next_cursor, previous_cursor)
+
+
+def get_page_or_404(request, queryset, per_page=ORDERS_PER_PAGE):
+    """Страница по параметру ?cursor=; испорченный курсор дает 404"""
+    try:
+        return paginate(queryset, request.GET.get('cursor'), per_page)
+    except InvalidCursor:
+        raise Http404('Некорректный курсор страницы')
+
+
+def get_window_or_404(request, queryset, per_page=ORDERS_PER_PAGE):
+    """Срез queryset, из которого будет собрана страница ?cursor="""
+    try:
+        return page_window(queryset, request.GET.get('cursor'), per_page)[1]
+    except InvalidCursor:
+        raise Http404('Некорректный курсор страницы')
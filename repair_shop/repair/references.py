@@ -0,0 +1,141 @@
+"""Кэш справочников в памяти процесса: статусы, типы техники, мастерские.
+
+В каждой таблице единицы строк, поэтому процесс держит их целиком и
+подставляет в заказы вместо JOIN. Актуальность проверяется по номеру
+версии в кэше Django: любое сохранение или удаление справочника
+меняет версию (см. signals.py), и каждый воркер перечитывает таблицы
+на следующем запросе. Поэтому кэш должен быть общим для всех
+воркеров (см. checks.py): в LocMemCache новую версию увидел бы
+только тот процесс, который ее записал. Объекты общие для всех
+потоков процесса - их можно только читать.
+
+Снимок, прочитанный внутри транзакции, которая потом откатилась, мог
+бы жить до следующей правки; поэтому он в любом случае перечитывается
+не реже раза в REFERENCE_CACHE_TIMEOUT секунд.
+"""
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from .metrics import record_cache
+from .models import ApplianceType, RepairOrder, RepairStatus, Workshop
+
+VERSION_KEY = 'references:version'
+
+# Поле заказа и словарь снимка, из которого берется объект
+ORDER_FIELDS = (
+    ('appliance_type', 'appliance_types'),
+    ('workshop', 'workshops'),
+    ('status', 'statuses'),
+)
+
+
+def load(model):
+    return model.objects.using(DEFAULT_DB_ALIAS).order_by().in_bulk()
+
+
+class References:
+    """Снимок справочников одной версии"""
+
+    def __init__(self, version):
+        self.loaded_at = time.monotonic()
+        # Снимок живет дольше запроса, поэтому читается из основной
+        # базы, а не из реплики, которая может отставать от версии
+        self.version = version
+        self.statuses = load(RepairStatus)
+        self.appliance_types = load(ApplianceType)
+        self.workshops = load(Workshop)
+        self.appliance_types_by_slug = {
+            appliance_type.slug: appliance_type
+            for appliance_type in self.appliance_types.values()
+        }
+
+
+_snapshot = None
+_lock = threading.Lock()
+
+
+def current_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Ключ вытеснен или кэш очищен: заводим новую версию
+        cache.add(VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def is_fresh(snapshot, version):
+    return (
+        snapshot is not None and snapshot.version == version
+        and time.monotonic() - snapshot.loaded_at
+        < settings.REFERENCE_CACHE_TIMEOUT
+    )
+
+
+def references():
+    """Снимок справочников; перечитывается, если версия сменилась"""
+    global _snapshot
+    version = current_version()
+    snapshot = _snapshot
+    if not is_fresh(snapshot, version):
+        with _lock:
+            if not is_fresh(_snapshot, version):
+                _snapshot = References(version)
+                record_cache('references', hits=0, misses=1)
+            snapshot = _snapshot
+    else:
+        record_cache('references', hits=1, misses=0)
+    return snapshot
+
+
+def bump_version():
+    cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def invalidate_references():
+    """Меняет версию сразу и еще раз после коммита.
+
+    Между ними другой воркер может перечитать таблицы без нашего
+    изменения и запомнить снимок под новой версией; повтор после
+    коммита заставит его перечитать их еще раз.
+    """
+    bump_version()
+    transaction.on_commit(bump_version)
+
+
+def get_appliance_type(slug):
+    """Тип техники по slug; None, если такого нет"""
+    appliance_type = references().appliance_types_by_slug.get(slug)
+    if appliance_type is None:
+        # Снимок мог еще не увидеть новую запись
+        appliance_type = ApplianceType.objects.filter(slug=slug).first()
+    return appliance_type
+
+
+def get_workshop(pk):
+    """Мастерская по id; None, если такой нет"""
+    workshop = references().workshops.get(pk)
+    if workshop is None:
+        workshop = Workshop.objects.filter(pk=pk).first()
+    return workshop
+
+
+def attach_references(orders):
+    """Подставляет заказам тип техники, мастерскую и статус из снимка.
+
+    Если объекта в снимке нет, поле остается ленивым и загрузится
+    из базы при обращении.
+    """
+    snapshot = references()
+    for name, attribute in ORDER_FIELDS:
+        field = RepairOrder._meta.get_field(name)
+        objects = getattr(snapshot, attribute)
+        for order in orders:
+            related = objects.get(getattr(order, field.attname))
+            if related is not None:
+                field.set_cached_value(order, related)
+    return orders
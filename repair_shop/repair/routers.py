@@ -0,0 +1,76 @@
+"""Чтение публичных страниц с реплик базы.
+
+Реплики - алиасы из settings.DATABASE_REPLICAS. На реплику уходят
+только чтения моделей приложения repair и только в запросах, которые
+ReplicaRoutingMiddleware пометил как публичные; запись, админка,
+сессии и пользователи всегда работают с основной базой.
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICATED_APPS = {'repair'}
+
+_routing = ContextVar('replica_routing', default=None)
+
+
+class ReplicaRouting:
+    """Решение о репликах для одного запроса"""
+
+    def __init__(self):
+        self.use_replica = False
+        self.wrote = False
+
+
+def start_routing():
+    """Начинает маршрутизацию запроса; возвращает ее и токен сброса"""
+    routing = ReplicaRouting()
+    return routing, _routing.set(routing)
+
+
+def finish_routing(token):
+    _routing.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        routing = _routing.get()
+        replicas = settings.DATABASE_REPLICAS
+        if (routing is not None and routing.use_replica and replicas
+                and model._meta.app_label in REPLICATED_APPS):
+            return random.choice(replicas)
+        return None
+
+    def db_for_write(self, model, **hints):
+        routing = _routing.get()
+        if routing is not None:
+            # Дальше в этом запросе читаем свою же запись
+            routing.wrote = True
+            routing.use_replica = False
+        # Явно: иначе Django пишет туда, откуда загружен объект
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+def refresh_replica(alias, source=DEFAULT_DB_ALIAS):
+    """Копирует базу source в реплику alias целиком.
+
+    Для локальной разработки и тестов: online backup API SQLite
+    копирует базу постранично, не останавливая запись в source.
+    """
+    primary, replica = connections[source], connections[alias]
+    primary.ensure_connection()
+    replica.ensure_connection()
+    primary.connection.backup(replica.connection)
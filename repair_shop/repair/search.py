@@ -0,0 +1,178 @@
+"""Полнотекстовый поиск заказов на SQLite FTS5.
+
+Таблица repair_order_search и триггеры, которые держат ее в согласии
+с заказами и клиентами, создаются миграцией 0004_order_search.
+rowid строки индекса совпадает с id заказа.
+"""
+import re
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+from django.db.models import Max
+from django.db.models.expressions import RawSQL
+
+from .models import RepairOrder
+from .references import attach_references
+
+SEARCH_TABLE = 'repair_order_search'
+INSERT_TRIGGER = 'repair_order_search_insert'
+
+# Веса колонок для bm25: description, appliance_brand, appliance_model,
+# customer_name, customer_phone. Совпадение в марке, модели или
+# телефоне важнее совпадения в длинном описании.
+RANK = f'bm25({SEARCH_TABLE}, 1.0, 4.0, 4.0, 3.0, 3.0)'
+
+# Дальше этой страницы поиск не листается: глубокий OFFSET сортирует
+# все совпадения, а огромный номер страницы не влезет в SQLite
+MAX_SEARCH_PAGE = 100
+
+# Те же выражения, что в триггерах миграции 0004_order_search
+DIGITS = (
+    "REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(c.phone, ' ', ''), '(', ''), "
+    "')', ''), '-', ''), '+', '')"
+)
+PHONE = f"c.phone || ' ' || {DIGITS} || ' ' || SUBSTR({DIGITS}, -10)"
+FOLD = "REPLACE(REPLACE({}, 'ё', 'е'), 'Ё', 'Е')"
+
+INSERT_BATCH = f"""
+    INSERT INTO {SEARCH_TABLE}(
+        rowid, description, appliance_brand, appliance_model,
+        customer_name, customer_phone
+    )
+    SELECT o.id, {FOLD.format('o.description')}, o.appliance_brand,
+           o.appliance_model, {FOLD.format('c.name')}, {PHONE}
+    FROM repair_repairorder o
+    JOIN repair_customer c ON c.id = o.customer_id
+    WHERE o.id > %s AND o.id <= %s
+"""
+
+INSERT_DOCUMENT = f"""
+    INSERT INTO {SEARCH_TABLE}(
+        rowid, description, appliance_brand, appliance_model,
+        customer_name, customer_phone
+    ) VALUES (%s, %s, %s, %s, %s, %s)
+"""
+
+
+def build_match_query(text):
+    """Запрос FTS5 из пользовательской строки.
+
+    Каждое слово ищется как префикс, все слова обязательны, «ё»
+    приравнивается к «е», как и при индексации. Номер
+    телефона с кодом страны (7 или 8) сводится к последним 10 цифрам.
+    """
+    terms = []
+    for word in re.findall(r'\w+', text.lower().replace('ё', 'е')):
+        if word.isdigit() and len(word) == 11 and word[0] in '78':
+            word = word[1:]
+        terms.append(f'"{word}"*')
+    return ' '.join(terms)
+
+
+def search_order_ids(text, limit, offset=0):
+    """Id опубликованных заказов под запрос, лучшие первыми"""
+    match = build_match_query(text)
+    if not match:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT o.id FROM {SEARCH_TABLE}
+            JOIN repair_repairorder o ON o.id = {SEARCH_TABLE}.rowid
+            JOIN repair_appliancetype t ON t.id = o.appliance_type_id
+            WHERE {SEARCH_TABLE} MATCH %s
+              AND o.is_published AND t.is_published
+            ORDER BY {RANK}
+            LIMIT %s OFFSET %s
+            """,
+            [match, limit, offset]
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_orders(text, limit, offset=0):
+    """Заказы для карточек в порядке релевантности"""
+    ids = search_order_ids(text, limit, offset)
+    orders = RepairOrder.objects.cards().in_bulk(ids)
+    return attach_references([orders[pk] for pk in ids if pk in orders])
+
+
+def matching_orders(text):
+    """Подзапрос id заказов для фильтра pk__in, без учета публикации"""
+    return RawSQL(
+        f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s',
+        [build_match_query(text)]
+    )
+
+
+def rebuild_search_index(batch_size=50_000, progress=None):
+    """Заново заполняет индекс по диапазонам id заказов.
+
+    Возвращает число проиндексированных заказов. progress(done)
+    вызывается после каждой пачки.
+    """
+    last_id = RepairOrder.objects.aggregate(last=Max('pk'))['last'] or 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        for start in range(0, last_id, batch_size):
+            cursor.execute(INSERT_BATCH, [start, start + batch_size])
+            if progress:
+                progress(min(start + batch_size, last_id))
+        cursor.execute(
+            f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('optimize')"
+        )
+        cursor.execute(f'SELECT COUNT(*) FROM {SEARCH_TABLE}')
+        return cursor.fetchone()[0]
+
+
+def fold(text):
+    return text.replace('ё', 'е').replace('Ё', 'Е')
+
+
+def phone_terms(phone):
+    """Телефон как записан, одними цифрами и последними 10 цифрами"""
+    digits = phone
+    for char in ' ()-+':
+        digits = digits.replace(char, '')
+    return f'{phone} {digits} {digits[-10:]}'
+
+
+def index_documents(documents):
+    """Добавляет в индекс заказы, вставленные без триггера.
+
+    documents - кортежи (id, описание, марка, модель, имя клиента,
+    телефон клиента); текст готовится так же, как в триггерах.
+    """
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            INSERT_DOCUMENT,
+            [
+                (pk, fold(description), brand, model, fold(name),
+                 phone_terms(phone))
+                for pk, description, brand, model, name, phone in documents
+            ]
+        )
+
+
+@contextmanager
+def insert_trigger_disabled():
+    """Отключает индексацию новых заказов триггером на время транзакции.
+
+    Массовая загрузка индексирует заказы сама через index_documents:
+    одна вставка на пачку в разы быстрее срабатывания триггера на
+    каждую строку. DDL в SQLite транзакционен, поэтому при ошибке откат
+    вернет триггер на место, а другие соединения его отсутствия не увидят.
+    """
+    if not connection.in_atomic_block:
+        raise RuntimeError('insert_trigger_disabled нужна транзакция')
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'trigger' "
+            "AND name = %s",
+            [INSERT_TRIGGER]
+        )
+        create_sql, = cursor.fetchone()
+        cursor.execute(f'DROP TRIGGER {INSERT_TRIGGER}')
+    yield
+    with connection.cursor() as cursor:
+        cursor.execute(create_sql)
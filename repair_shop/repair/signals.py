@@ -0,0 +1,197 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models.signals import (
+    post_delete, post_save, pre_delete, pre_save
+)
+from django.dispatch import receiver
+
+from .admin_tools import facet_cache_key
+from .card_cache import card_cache_key, invalidate_order_cards
+from .models import (
+    ApplianceType, Customer, RepairOrder, RepairStatus, Workshop
+)
+from .notifications import enqueue_ready_notification
+from .references import invalidate_references
+from .stats import TRACKED_FIELDS, detach_stats, record_order_change
+from .status_log import detach_durations, record_status_change
+from .tracking import invalidate_tracking_pages
+
+
+@receiver(post_save, sender=RepairOrder)
+def drop_previous_order_card(sender, instance, created, **kwargs):
+    """Удаляет карточку прошлой версии сохраненного заказа"""
+    loaded = getattr(instance, '_loaded_values', {})
+    if not created and loaded.get('updated_at'):
+        cache.delete(card_cache_key(instance.pk, loaded['updated_at']))
+
+
+@receiver(pre_delete, sender=RepairOrder)
+def load_deferred_before_delete(sender, instance, **kwargs):
+    """Догружает отложенные поля, пока строка заказа еще существует"""
+    deferred = instance.get_deferred_fields() & {
+        'updated_at', 'tracking_code', *TRACKED_FIELDS
+    }
+    if deferred:
+        instance.refresh_from_db(fields=deferred)
+
+
+@receiver(post_delete, sender=RepairOrder)
+def drop_deleted_order_card(sender, instance, **kwargs):
+    cache.delete(card_cache_key(instance.pk, instance.updated_at))
+
+
+@receiver(post_save, sender=RepairOrder)
+@receiver(post_delete, sender=RepairOrder)
+def drop_order_tracking_page(sender, instance, **kwargs):
+    """Удаляет закэшированную страницу отслеживания заказа"""
+    if not kwargs.get('created'):
+        invalidate_tracking_pages([instance.tracking_code])
+
+
+@receiver(post_save, sender=Customer)
+def invalidate_customer_cards(sender, instance, created, **kwargs):
+    if not created:
+        invalidate_order_cards(instance.orders.all())
+
+
+# Для мастерских, типов техники и статусов сброс делается до удаления:
+# к post_delete у заказов уже обнулена ссылка (on_delete=SET_NULL),
+# и найти затронутые карточки будет нельзя.
+@receiver(post_save, sender=Workshop)
+@receiver(pre_delete, sender=Workshop)
+def invalidate_workshop_cards(sender, instance, **kwargs):
+    if not kwargs.get('created'):
+        invalidate_order_cards(RepairOrder.objects.filter(workshop=instance))
+
+
+@receiver(post_save, sender=ApplianceType)
+@receiver(pre_delete, sender=ApplianceType)
+def invalidate_appliance_type_cards(sender, instance, **kwargs):
+    if not kwargs.get('created'):
+        invalidate_order_cards(
+            RepairOrder.objects.filter(appliance_type=instance)
+        )
+
+
+@receiver(post_save, sender=RepairStatus)
+@receiver(pre_delete, sender=RepairStatus)
+def invalidate_status_cards(sender, instance, **kwargs):
+    if not kwargs.get('created'):
+        invalidate_order_cards(RepairOrder.objects.filter(status=instance))
+
+
+@receiver(post_save, sender=Workshop)
+@receiver(post_delete, sender=Workshop)
+@receiver(post_save, sender=ApplianceType)
+@receiver(post_delete, sender=ApplianceType)
+@receiver(post_save, sender=RepairStatus)
+@receiver(post_delete, sender=RepairStatus)
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def invalidate_admin_facets(sender, **kwargs):
+    """Сбрасывает варианты фильтра админки по измененной модели"""
+    cache.delete(facet_cache_key(sender))
+
+
+@receiver(post_save, sender=ApplianceType)
+@receiver(post_delete, sender=ApplianceType)
+@receiver(post_save, sender=Workshop)
+@receiver(post_delete, sender=Workshop)
+@receiver(post_save, sender=RepairStatus)
+@receiver(post_delete, sender=RepairStatus)
+def invalidate_reference_cache(sender, **kwargs):
+    """Меняет версию справочников: воркеры перечитают их из базы"""
+    invalidate_references()
+
+
+@receiver(pre_save, sender=RepairOrder)
+def load_previous_stats_values(sender, instance, raw, **kwargs):
+    """Догружает прежние значения, если заказ загружен не целиком"""
+    loaded = getattr(instance, '_loaded_values', {})
+    if raw or instance._state.adding or all(
+        name in loaded for name in TRACKED_FIELDS
+    ):
+        return
+    previous = RepairOrder.objects.filter(pk=instance.pk).values(
+        *TRACKED_FIELDS
+    ).first()
+    if previous:
+        instance._loaded_values = {**previous, **loaded}
+
+
+@receiver(post_save, sender=RepairOrder)
+def update_stats_on_save(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+    loaded = getattr(instance, '_loaded_values', {})
+    old = None
+    if not created and all(name in loaded for name in TRACKED_FIELDS):
+        old = {name: loaded[name] for name in TRACKED_FIELDS}
+    new = {name: getattr(instance, name) for name in TRACKED_FIELDS}
+    record_order_change(old, new)
+
+
+@receiver(post_save, sender=RepairOrder)
+def enqueue_notification_on_save(sender, instance, created, raw, **kwargs):
+    """Ставит уведомление клиенту в очередь в транзакции сохранения"""
+    if raw:
+        return
+    loaded = getattr(instance, '_loaded_values', {})
+    if not created and loaded.get('status_id') == instance.status_id:
+        return
+    enqueue_ready_notification(instance)
+
+
+@receiver(post_save, sender=RepairOrder)
+def log_status_change(sender, instance, created, raw, **kwargs):
+    """Пишет смену статуса в журнал в транзакции сохранения заказа"""
+    if raw:
+        return
+    loaded = getattr(instance, '_loaded_values', {})
+    if not created and loaded.get('status_id') == instance.status_id:
+        return
+    record_status_change(
+        instance, None if created else loaded.get('status_id'), created
+    )
+
+
+@receiver(post_delete, sender=RepairOrder)
+def update_stats_on_delete(sender, instance, **kwargs):
+    record_order_change(
+        {name: getattr(instance, name) for name in TRACKED_FIELDS}, None
+    )
+
+
+@receiver(pre_delete, sender=Workshop)
+def detach_workshop_stats(sender, instance, **kwargs):
+    detach_stats('workshop', instance)
+
+
+@receiver(pre_delete, sender=ApplianceType)
+def detach_appliance_type_stats(sender, instance, **kwargs):
+    detach_stats('appliance_type', instance)
+
+
+@receiver(pre_delete, sender=RepairStatus)
+def detach_status_stats(sender, instance, **kwargs):
+    detach_stats('status', instance)
+
+
+@receiver(pre_delete, sender=Workshop)
+def detach_workshop_durations(sender, instance, **kwargs):
+    detach_durations('workshop', instance)
+
+
+@receiver(pre_delete, sender=ApplianceType)
+def detach_appliance_type_durations(sender, instance, **kwargs):
+    detach_durations('appliance_type', instance)
+
+
+@receiver(pre_delete, sender=RepairStatus)
+def detach_status_durations(sender, instance, **kwargs):
+    detach_durations('status', instance)
+
+
+@receiver(pre_delete, sender=get_user_model())
+def detach_master_durations(sender, instance, **kwargs):
+    detach_durations('master', instance)
@@ -0,0 +1,235 @@
+"""Снимок данных repair в JSON Lines с постоянной памятью.
+
+Формат - сериализатор Django jsonl: объект на строку, как в фикстурах
+dumpdata. В отличие от dumpdata/loaddata, строки читаются из базы
+серверным курсором и пишутся по одной, а при загрузке собираются
+в пачки bulk_create по batch_size объектов. Поэтому память не зависит
+от объема снимка.
+
+Модели идут в порядке зависимостей (MODELS), загрузка требует того же
+порядка. Существующие строки с тем же id перезаписываются, так что
+снимок можно загружать повторно; только пользователь с тем же id или
+именем должен быть тем же пользователем, иначе загрузка отклоняется.
+bulk_create не вызывает сигналы:
+статистика, время в статусах, поисковый индекс и версия справочников
+обновляются один раз после загрузки.
+"""
+from contextlib import contextmanager
+from datetime import datetime
+
+from django.contrib.auth import get_user_model
+from django.core import serializers
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import Q
+
+from .models import (
+    ApplianceType, Customer, RepairOrder, RepairStatus, StatusEvent, Workshop
+)
+from .references import invalidate_references
+from .search import insert_trigger_disabled, rebuild_search_index
+from .stats import rebuild_order_stats
+from .status_log import rebuild_status_durations
+from .utils import explicit_timestamps
+
+User = get_user_model()
+
+# Каждая модель ссылается только на модели левее нее
+MODELS = (
+    User, ApplianceType, Workshop, RepairStatus, Customer, RepairOrder,
+    StatusEvent,
+)
+
+# Из пользователей в снимок попадают только мастера заказов и журнала
+# статусов и только эти поля: права и группы к данным мастерской
+# не относятся
+USER_FIELDS = (
+    'password', 'last_login', 'username', 'first_name', 'last_name',
+    'email', 'is_staff', 'is_active', 'date_joined',
+)
+
+BATCH_SIZE = 2000
+
+
+class SnapshotError(ValueError):
+    """Снимок нельзя загрузить"""
+
+
+class SnapshotEncoder(DjangoJSONEncoder):
+    """Даты с микросекундами, а не до миллисекунд, как в dumpdata"""
+
+    def default(self, o):
+        if isinstance(o, datetime):
+            # По updated_at версионируются карточки заказов, поэтому
+            # после загрузки дата должна совпасть до микросекунды
+            value = o.isoformat()
+            if value.endswith('+00:00'):
+                value = value.removesuffix('+00:00') + 'Z'
+            return value
+        return super().default(o)
+
+
+def snapshot_fields(model):
+    """Поля модели, которые пишутся в снимок и обновляются при загрузке"""
+    if model is User:
+        return USER_FIELDS
+    return tuple(
+        field.name for field in model._meta.concrete_fields
+        if not field.primary_key
+    )
+
+
+def snapshot_queryset(model):
+    if model is User:
+        return User.objects.filter(
+            Q(pk__in=RepairOrder.objects.filter(
+                master__isnull=False
+            ).values('master_id'))
+            | Q(pk__in=StatusEvent.objects.filter(
+                master__isnull=False
+            ).values('master_id'))
+        )
+    return model.objects.all()
+
+
+def counted(objects, counts, model):
+    for obj in objects:
+        counts[model] += 1
+        yield obj
+
+
+@contextmanager
+def read_transaction():
+    """Транзакция, которая только читает.
+
+    transaction.atomic() в SQLite начинается с BEGIN IMMEDIATE (см.
+    DATABASES в settings.py) и держала бы блокировку записи всю
+    выгрузку. BEGIN DEFERRED берет только чтение, и в режиме WAL
+    запись идет параллельно.
+    """
+    if connection.vendor != 'sqlite' or connection.in_atomic_block:
+        with transaction.atomic():
+            yield
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('BEGIN DEFERRED')
+        try:
+            yield
+        finally:
+            # Транзакция ничего не меняла, откат равнозначен фиксации
+            if connection.connection.in_transaction:
+                cursor.execute('ROLLBACK')
+
+
+def dump(stream, chunk_size=BATCH_SIZE):
+    """Пишет снимок в текстовый поток; возвращает {модель: число строк}.
+
+    Все модели читаются в одной транзакции, поэтому ссылки в снимке
+    согласованы, даже если в это время идет запись.
+    """
+    counts = dict.fromkeys(MODELS, 0)
+    with read_transaction():
+        for model in MODELS:
+            objects = snapshot_queryset(model).order_by('pk').iterator(
+                chunk_size=chunk_size
+            )
+            serializers.serialize(
+                'jsonl', counted(objects, counts, model), stream=stream,
+                fields=snapshot_fields(model), cls=SnapshotEncoder
+            )
+    return counts
+
+
+def model_batches(objects, batch_size):
+    """Пары (модель, пачка объектов) подряд идущих объектов одной модели"""
+    model, batch = None, []
+    for deserialized in objects:
+        obj = deserialized.object
+        if type(obj) is not model or len(batch) == batch_size:
+            if batch:
+                yield model, batch
+            model, batch = type(obj), []
+        batch.append(obj)
+    if batch:
+        yield model, batch
+
+
+def check_users(batch):
+    """Отклоняет пачку, если id или имя заняты другим пользователем.
+
+    Пользователи перезаписываются по id вместе с паролем: снимок
+    из другой базы иначе подменил бы чужую учетную запись.
+    """
+    usernames = {user.pk: user.username for user in batch}
+    existing = User.objects.filter(
+        Q(pk__in=usernames) | Q(username__in=usernames.values())
+    ).values_list('pk', 'username')
+    for pk, username in existing:
+        if usernames.get(pk) != username:
+            raise SnapshotError(
+                f'Пользователь {username} (id {pk}) не совпадает '
+                'с пользователем снимка: снимок из другой базы'
+            )
+
+
+def save_batch(model, batch):
+    """Вставляет пачку; строки с теми же id перезаписываются"""
+    pk = model._meta.pk.name
+    with transaction.atomic():
+        if model is RepairOrder:
+            # Индекс заново строится после загрузки
+            with insert_trigger_disabled():
+                model.objects.bulk_create(
+                    batch, update_conflicts=True, unique_fields=[pk],
+                    update_fields=snapshot_fields(model)
+                )
+        else:
+            model.objects.bulk_create(
+                batch, update_conflicts=True, unique_fields=[pk],
+                update_fields=snapshot_fields(model)
+            )
+
+
+def load(stream, batch_size=BATCH_SIZE, progress=None):
+    """Загружает снимок из текстового потока; возвращает {модель: число}.
+
+    progress(model, loaded) вызывается после каждой пачки.
+    """
+    counts = dict.fromkeys(MODELS, 0)
+    position = 0
+    objects = serializers.deserialize('jsonl', stream)
+    # Даты создания и изменения берутся из снимка, а не текущие
+    with explicit_timestamps(*MODELS):
+        for model, batch in model_batches(objects, batch_size):
+            if model not in MODELS:
+                raise SnapshotError(
+                    f'{model._meta.label} не входит в снимок repair'
+                )
+            if MODELS.index(model) < position:
+                raise SnapshotError(
+                    f'{model._meta.label} после зависящих от нее моделей: '
+                    'снимок должен идти в порядке зависимостей'
+                )
+            position = MODELS.index(model)
+            if model is User:
+                check_users(batch)
+            save_batch(model, batch)
+            counts[model] += len(batch)
+            if progress:
+                progress(model, counts[model])
+
+    # Вставка с явными id не сдвигает последовательности PostgreSQL;
+    # в SQLite список команд пуст
+    statements = connection.ops.sequence_reset_sql(no_style(), MODELS)
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+    if counts[RepairOrder]:
+        rebuild_search_index()
+        rebuild_order_stats()
+    if counts[StatusEvent]:
+        rebuild_status_durations()
+    invalidate_references()
+    return counts
@@ -0,0 +1,104 @@
+"""Настройка соединений SQLite через PRAGMA.
+
+Параметры берутся из settings.SQLITE_PRAGMAS и применяются к каждому
+новому соединению с базой SQLite. С CONN_MAX_AGE соединение живет
+между запросами, поэтому PRAGMA выполняются один раз на соединение,
+а не на каждый запрос. После migrate здесь же собирается статистика
+ANALYZE.
+"""
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
+from django.dispatch import receiver
+
+
+def pragma_statements(pragmas):
+    """SQL для словаря {имя: значение}; busy_timeout идет первым.
+
+    Смена journal_mode требует блокировки базы, и ожидание этой
+    блокировки уже должно подчиняться busy_timeout.
+    """
+    ordered = sorted(
+        pragmas.items(), key=lambda item: item[0] != 'busy_timeout'
+    )
+    return [f'PRAGMA {name} = {value}' for name, value in ordered]
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    """Применяет SQLITE_PRAGMAS к новому соединению SQLite"""
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    with connection.cursor() as cursor:
+        for statement in pragma_statements(pragmas):
+            cursor.execute(statement)
+
+
+def current_pragmas(connection, names):
+    """Фактические значения PRAGMA соединения: {имя: значение}"""
+    values = {}
+    with connection.cursor() as cursor:
+        for name in names:
+            cursor.execute(f'PRAGMA {name}')
+            values[name] = cursor.fetchone()[0]
+    return values
+
+
+@contextmanager
+def temporary_pragmas(connection, pragmas):
+    """Меняет PRAGMA соединения SQLite на время блока.
+
+    С CONN_MAX_AGE соединение переживет блок, поэтому прежние
+    значения возвращаются. Для других баз ничего не делает.
+    """
+    if connection.vendor != 'sqlite':
+        yield
+        return
+    previous = current_pragmas(connection, pragmas)
+    with connection.cursor() as cursor:
+        for statement in pragma_statements(pragmas):
+            cursor.execute(statement)
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            for statement in pragma_statements(previous):
+                cursor.execute(statement)
+
+
+def analyze(connection):
+    """Обновляет статистику планировщика sqlite_stat1.
+
+    Из нее же админка берет число строк таблиц без COUNT(*)
+    (admin_tools.table_row_estimate).
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+        # Частичные индексы пустых таблиц попадают в статистику с нулем
+        # строк, и планировщик считал бы таблицу пустой и после
+        # наполнения. Без строки он берет оценки по умолчанию
+        cursor.execute(
+            "DELETE FROM sqlite_stat1 WHERE stat = '0' OR stat LIKE '0 %'"
+        )
+        # Перечитывает статистику в планировщик
+        cursor.execute('ANALYZE sqlite_master')
+
+
+@receiver(post_migrate)
+def analyze_after_migrate(sender, using, **kwargs):
+    """Статистика после миграций: новые индексы без нее не учитываются.
+
+    Новая база пропускается: статистика пустых таблиц только
+    помешала бы планировщику, когда они наполнятся.
+    """
+    # post_migrate приходит для каждого приложения, а ANALYZE - на всю базу
+    if sender.label != 'repair':
+        return
+    if sender.get_model('RepairOrder').objects.using(using).exists():
+        analyze(connections[using])
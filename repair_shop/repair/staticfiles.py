@@ -0,0 +1,116 @@
+"""Статика с хэшем содержимого в имени и заранее сжатыми копиями.
+
+collectstatic кладет в STATIC_ROOT файлы вида bootstrap.min.<хэш>.css,
+а рядом с ними .gz и, если установлен пакет brotli, .br. Имя меняется
+вместе с содержимым, поэтому такие файлы кэшируются навсегда; сжимаются
+они один раз при сборке, а не на каждый запрос.
+"""
+import gzip
+import mimetypes
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import (
+    ManifestStaticFilesStorage, staticfiles_storage
+)
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.http import FileResponse, Http404
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import require_safe
+
+from .utils import accepted_encodings
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+# Картинки и шрифты уже сжаты, повторно их сжимать бесполезно
+COMPRESSIBLE_EXTENSIONS = {
+    '.css', '.js', '.map', '.svg', '.json', '.txt', '.xml', '.html', '.ico'
+}
+COMPRESS_MIN_SIZE = 1024
+# Копия хранится, только если она заметно меньше оригинала
+MAX_RATIO = 0.95
+
+# Порядок - предпочтение при выборе копии для ответа
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+# Файл, запрошенный по исходному имени, может измениться при деплое
+SHORT_CACHE = 'public, max-age=300'
+
+
+def compressed_copies(content):
+    """{суффикс: сжатое содержимое} для копий, которые стоит хранить"""
+    copies = {'.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        copies['.br'] = brotli.compress(content)
+    return {
+        suffix: data for suffix, data in copies.items()
+        if len(data) < len(content) * MAX_RATIO
+    }
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Манифест хэшированных имен плюс .gz/.br копии хэшированных файлов"""
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in self.hashed_files.values():
+            yield from self.compress(name)
+
+    def compress(self, name):
+        if os.path.splitext(name)[1] not in COMPRESSIBLE_EXTENSIONS:
+            return
+        with self.open(name) as file:
+            content = file.read()
+        if len(content) < COMPRESS_MIN_SIZE:
+            return
+        for suffix, data in compressed_copies(content).items():
+            compressed_name = name + suffix
+            if self.exists(compressed_name):
+                self.delete(compressed_name)
+            self._save(compressed_name, ContentFile(data))
+            yield name, compressed_name, True
+
+
+@require_safe
+def serve_static(request, path):
+    """Файл из STATIC_ROOT; сжатая копия выбирается по Accept-Encoding"""
+    if not settings.STATIC_ROOT:
+        raise Http404('STATIC_ROOT не задан')
+    try:
+        full_path = safe_join(settings.STATIC_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404('Файл не найден')
+    if not os.path.isfile(full_path):
+        raise Http404('Файл не найден')
+    content_type, _ = mimetypes.guess_type(full_path)
+    accepted = accepted_encodings(request)
+    encoding = None
+    for candidate, suffix in ENCODINGS:
+        if candidate in accepted and os.path.isfile(full_path + suffix):
+            encoding, full_path = candidate, full_path + suffix
+            break
+    response = FileResponse(
+        open(full_path, 'rb'),
+        content_type=content_type or 'application/octet-stream'
+    )
+    # FileResponse подставляет имя файла, а это может быть имя копии .gz
+    del response['Content-Disposition']
+    if encoding:
+        response['Content-Encoding'] = encoding
+    patch_vary_headers(response, ('Accept-Encoding',))
+    hashed_files = getattr(staticfiles_storage, 'hashed_files', {})
+    response['Cache-Control'] = (
+        IMMUTABLE if path in hashed_files.values() else SHORT_CACHE
+    )
+    return response
@@ -0,0 +1,188 @@
+"""Инкрементальная статистика заказов (модель OrderStats).
+
+Сохранение и удаление заказа превращается в приращения счетчиков
+через F(): два процесса, одновременно меняющие одну строку, не теряют
+обновления друг друга. Массовые операции в обход save() (bulk_create,
+update()) статистику не трогают - после них нужна пересборка
+rebuild_order_stats().
+"""
+from decimal import Decimal
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, DateField, F, Sum
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+
+from .models import OrderStats, RepairOrder
+
+KEY_FIELDS = ('month', 'workshop_id', 'status_id', 'appliance_type_id')
+
+# Поля заказа, от которых зависит статистика
+TRACKED_FIELDS = (
+    'created_at', 'workshop_id', 'status_id', 'appliance_type_id',
+    'final_cost'
+)
+
+ZERO = Decimal('0.00')
+
+
+def stats_key(values):
+    """Ключ строки статистики по значениям полей заказа"""
+    month = timezone.localtime(values['created_at']).date().replace(day=1)
+    return {
+        'month': month,
+        'workshop_id': values['workshop_id'],
+        'status_id': values['status_id'],
+        'appliance_type_id': values['appliance_type_id'],
+    }
+
+
+def add_to_stats(key, orders, revenue):
+    """Прибавляет приращения к строке статистики, создавая ее при нужде"""
+    if not orders and not revenue:
+        return
+    rows = OrderStats.objects.filter(**key)
+    changes = {
+        'orders': F('orders') + orders,
+        'revenue': F('revenue') + revenue,
+    }
+    if rows.update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            OrderStats.objects.create(**key, orders=orders, revenue=revenue)
+    except IntegrityError:
+        # Строку успел создать параллельный писатель
+        rows.update(**changes)
+
+
+def add_many_to_stats(deltas):
+    """Прибавляет приращения [(ключ, (заказов, выручка))] одним запросом.
+
+    Для массовой загрузки: вместо UPDATE и, возможно, INSERT на каждый
+    ключ - один UPSERT по уникальному индексу order_stats_unique_key.
+    """
+    table = OrderStats._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"""
+            INSERT INTO {table} (
+                month, workshop_id, status_id, appliance_type_id,
+                orders, revenue
+            ) VALUES (%s, %s, %s, %s, %s, %s)
+            ON CONFLICT (
+                month, COALESCE(workshop_id, 0), COALESCE(status_id, 0),
+                COALESCE(appliance_type_id, 0)
+            ) DO UPDATE SET
+                orders = orders + excluded.orders,
+                revenue = revenue + excluded.revenue
+            """,
+            [
+                (
+                    connection.ops.adapt_datefield_value(key['month']),
+                    key['workshop_id'], key['status_id'],
+                    key['appliance_type_id'], orders,
+                    connection.ops.adapt_decimalfield_value(revenue)
+                )
+                for key, (orders, revenue) in deltas
+            ]
+        )
+
+
+def record_order_change(old, new):
+    """Переносит заказ в статистике из состояния old в new.
+
+    old и new - словари значений TRACKED_FIELDS; None означает, что
+    заказа в этом состоянии нет (он создан или удален).
+    """
+    old_key = stats_key(old) if old else None
+    new_key = stats_key(new) if new else None
+    old_revenue = old and old['final_cost'] or ZERO
+    new_revenue = new and new['final_cost'] or ZERO
+    if old_key == new_key:
+        add_to_stats(new_key, 0, new_revenue - old_revenue)
+        return
+    if old_key:
+        add_to_stats(old_key, -1, -old_revenue)
+    if new_key:
+        add_to_stats(new_key, 1, new_revenue)
+
+
+def detach_stats(field_name, instance):
+    """Переносит строки удаляемой мастерской, статуса или типа в пустые.
+
+    Заказы при таком удалении получают NULL (on_delete=SET_NULL) одним
+    UPDATE без сигналов, поэтому статистику переносим отдельно.
+    """
+    for row in OrderStats.objects.filter(**{field_name: instance}):
+        key = {name: getattr(row, name) for name in KEY_FIELDS}
+        key[f'{field_name}_id'] = None
+        row.delete()
+        add_to_stats(key, row.orders, row.revenue)
+
+
+def current_stats():
+    """Содержимое таблицы статистики: {ключ: (заказов, выручка)}"""
+    rows = OrderStats.objects.values(*KEY_FIELDS, 'orders', 'revenue')
+    return {
+        tuple(row[name] for name in KEY_FIELDS): (
+            row['orders'], row['revenue']
+        )
+        for row in rows
+        if row['orders'] or row['revenue']
+    }
+
+
+def expected_stats():
+    """Статистика, посчитанная GROUP BY по всем заказам"""
+    rows = RepairOrder.objects.annotate(
+        month=TruncMonth('created_at', output_field=DateField())
+    ).values(*KEY_FIELDS).annotate(
+        total=Count('pk'),
+        total_revenue=Coalesce(Sum('final_cost'), ZERO)
+    ).order_by()
+    return {
+        tuple(row[name] for name in KEY_FIELDS): (
+            row['total'], row['total_revenue']
+        )
+        for row in rows
+    }
+
+
+def stats_drift(current, expected):
+    """Расхождения: [(ключ, в таблице, должно быть)]"""
+    missing = (0, ZERO)
+    return [
+        (key, current.get(key, missing), expected.get(key, missing))
+        for key in sorted(
+            current.keys() | expected.keys(),
+            key=lambda key: tuple(str(part) for part in key)
+        )
+        if current.get(key, missing) != expected.get(key, missing)
+    ]
+
+
+def rebuild_order_stats(batch_size=1000):
+    """Пересобирает таблицу статистики по заказам.
+
+    Возвращает найденные до пересборки расхождения (см. stats_drift).
+    """
+    with transaction.atomic():
+        # Блокирует запись в SQLite на время пересборки, чтобы между
+        # подсчетом и заменой строк не проскочили приращения
+        OrderStats.objects.filter(pk=0).update(orders=0)
+        expected = expected_stats()
+        drift = stats_drift(current_stats(), expected)
+        OrderStats.objects.all().delete()
+        OrderStats.objects.bulk_create(
+            (
+                OrderStats(
+                    **dict(zip(KEY_FIELDS, key)),
+                    orders=orders,
+                    revenue=revenue
+                )
+                for key, (orders, revenue) in expected.items()
+            ),
+            batch_size=batch_size
+        )
+    return drift
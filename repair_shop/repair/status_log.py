@@ -0,0 +1,312 @@
+"""Журнал смен статуса заказов и время, проведенное в статусах.
+
+Каждая смена статуса - строка StatusEvent со временем, которое заказ
+пробыл в прежнем статусе. То же время одним UPSERT прибавляется
+к строке StatusDurationStats с ключом (статус, мастерская, мастер,
+тип техники). Поэтому отчет читает по строке на сочетание
+справочников, сколько бы ни было заказов.
+
+Время входа в статус - время последней записи журнала по заказу.
+Первая смена статуса у заказа, созданного до журнала или загруженного
+в обход save(), его не знает и в статистику не попадает. Массовая
+смена статуса в админке идет через change_status(): обычный
+QuerySet.update() журнал не пополнит.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, Max, Sum
+from django.utils import timezone
+
+from .card_cache import card_cache_key
+from .models import RepairOrder, StatusDurationStats, StatusEvent
+from .notifications import enqueue_ready_notifications
+from .references import current_version, references
+from .stats import (
+    TRACKED_FIELDS, ZERO, add_many_to_stats, stats_drift, stats_key
+)
+from .tracking import invalidate_tracking_pages
+
+User = get_user_model()
+
+KEY_FIELDS = ('status_id', 'workshop_id', 'master_id', 'appliance_type_id')
+
+
+def entered_at(order_ids):
+    """{id заказа: время последней смены статуса} по индексу журнала"""
+    return dict(
+        StatusEvent.objects.filter(order_id__in=order_ids)
+        .values('order_id').annotate(last=Max('created_at'))
+        .values_list('order_id', 'last').order_by()
+    )
+
+
+def new_event(order, previous_status_id, entered, now):
+    duration = None
+    if entered is not None:
+        # Целые секунды: тогда сумма по журналу при пересборке
+        # совпадет с суммой приращений
+        seconds = int((now - entered).total_seconds())
+        duration = timedelta(seconds=max(seconds, 0))
+    return StatusEvent(
+        order_id=order.pk,
+        previous_status_id=previous_status_id,
+        status_id=order.status_id,
+        previous_duration=duration,
+        workshop_id=order.workshop_id,
+        master_id=order.master_id,
+        appliance_type_id=order.appliance_type_id,
+        created_at=now,
+    )
+
+
+def add_durations(deltas):
+    """Прибавляет {ключ: (выходов, секунд)} одним запросом.
+
+    UPSERT по уникальному индексу status_duration_unique_key, как
+    add_many_to_stats для статистики заказов.
+    """
+    if not deltas:
+        return
+    table = StatusDurationStats._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"""
+            INSERT INTO {table} (
+                status_id, workshop_id, master_id, appliance_type_id,
+                transitions, seconds
+            ) VALUES (%s, %s, %s, %s, %s, %s)
+            ON CONFLICT (
+                COALESCE(status_id, 0), COALESCE(workshop_id, 0),
+                COALESCE(master_id, 0), COALESCE(appliance_type_id, 0)
+            ) DO UPDATE SET
+                transitions = transitions + excluded.transitions,
+                seconds = seconds + excluded.seconds
+            """,
+            [(*key, transitions, seconds)
+             for key, (transitions, seconds) in deltas.items()]
+        )
+
+
+def event_durations(events):
+    """Приращения времени в статусах по записям журнала"""
+    deltas = {}
+    for event in events:
+        if event.previous_duration is None:
+            continue
+        key = (
+            event.previous_status_id, event.workshop_id, event.master_id,
+            event.appliance_type_id
+        )
+        transitions, seconds = deltas.get(key, (0, 0))
+        deltas[key] = (
+            transitions + 1,
+            seconds + int(event.previous_duration.total_seconds())
+        )
+    return deltas
+
+
+def record_status_change(order, previous_status_id, created=False):
+    """Пишет в журнал смену статуса только что сохраненного заказа"""
+    entered = None if created else entered_at([order.pk]).get(order.pk)
+    event = new_event(order, previous_status_id, entered, order.updated_at)
+    event.save()
+    add_durations(event_durations([event]))
+    return event
+
+
+def is_ready_status(status):
+    return status.name == settings.NOTIFICATIONS['READY_STATUS']
+
+
+def change_status(orders, status):
+    """Переводит заказы выборки в статус status; возвращает их число.
+
+    Заказы меняются одним UPDATE без save() и сигналов, а журнал,
+    статистика заказов, время в статусах, уведомление о готовности
+    и кэши страниц обновляются пачкой так же, как при сохранении
+    каждого заказа.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        changed = list(
+            orders.exclude(status=status).select_related(None)
+            .order_by().only(
+                'tracking_code', 'updated_at', 'master',
+                'workshop', 'status', 'appliance_type', 'created_at',
+                'final_cost'
+            )
+        )
+        if not changed:
+            return 0
+        ids = [order.pk for order in changed]
+        entered = entered_at(ids)
+        RepairOrder.objects.filter(pk__in=ids).update(
+            status=status, updated_at=now
+        )
+
+        stats_deltas = {}
+        events = []
+        card_keys = []
+        version = current_version()
+        for order in changed:
+            old = {name: getattr(order, name) for name in TRACKED_FIELDS}
+            previous_status_id = order.status_id
+            card_keys.append(
+                card_cache_key(order.pk, order.updated_at, version)
+            )
+            order.status = status
+            order.updated_at = now
+            new = {name: getattr(order, name) for name in TRACKED_FIELDS}
+            revenue = order.final_cost or ZERO
+            for key, sign in ((stats_key(old), -1), (stats_key(new), 1)):
+                key = tuple(key.items())
+                orders_delta, revenue_delta = stats_deltas.get(key, (0, ZERO))
+                stats_deltas[key] = (
+                    orders_delta + sign, revenue_delta + sign * revenue
+                )
+            events.append(new_event(
+                order, previous_status_id, entered.get(order.pk), now
+            ))
+        add_many_to_stats(
+            (dict(key), delta) for key, delta in stats_deltas.items()
+            if delta != (0, ZERO)
+        )
+        StatusEvent.objects.bulk_create(events)
+        add_durations(event_durations(events))
+        if is_ready_status(status):
+            enqueue_ready_notifications(changed)
+        cache.delete_many(card_keys)
+        invalidate_tracking_pages(order.tracking_code for order in changed)
+    return len(changed)
+
+
+def detach_durations(field_name, instance):
+    """Переносит время удаляемого справочника или мастера в строки без него.
+
+    Записи журнала получают NULL сами (on_delete=SET_NULL), а строки
+    статистики связаны без каскада, как в OrderStats.
+    """
+    rows = list(StatusDurationStats.objects.filter(**{field_name: instance}))
+    if not rows:
+        return
+    StatusDurationStats.objects.filter(
+        pk__in=[row.pk for row in rows]
+    ).delete()
+    deltas = {}
+    for row in rows:
+        key = {name: getattr(row, name) for name in KEY_FIELDS}
+        key[f'{field_name}_id'] = None
+        key = tuple(key.values())
+        transitions, seconds = deltas.get(key, (0, 0))
+        deltas[key] = (transitions + row.transitions, seconds + row.seconds)
+    add_durations(deltas)
+
+
+def current_durations():
+    """Содержимое таблицы времени в статусах: {ключ: (выходов, секунд)}"""
+    rows = StatusDurationStats.objects.values_list(
+        *KEY_FIELDS, 'transitions', 'seconds'
+    )
+    return {
+        tuple(row[:4]): (row[4], row[5])
+        for row in rows
+        if row[4] or row[5]
+    }
+
+
+def expected_durations():
+    """Время в статусах, посчитанное GROUP BY по журналу"""
+    rows = StatusEvent.objects.filter(
+        previous_duration__isnull=False
+    ).values_list(
+        'previous_status_id', 'workshop_id', 'master_id', 'appliance_type_id'
+    ).annotate(
+        transitions=Count('pk'), total=Sum('previous_duration')
+    ).order_by()
+    return {
+        tuple(row[:4]): (row[4], int(row[5].total_seconds()))
+        for row in rows
+    }
+
+
+def rebuild_status_durations(batch_size=1000):
+    """Пересобирает время в статусах по журналу.
+
+    Возвращает найденные до пересборки расхождения (см. stats_drift).
+    """
+    with transaction.atomic():
+        # Блокирует запись, как в rebuild_order_stats
+        StatusDurationStats.objects.filter(pk=0).update(transitions=0)
+        expected = expected_durations()
+        drift = stats_drift(current_durations(), expected)
+        StatusDurationStats.objects.all().delete()
+        StatusDurationStats.objects.bulk_create(
+            (
+                StatusDurationStats(
+                    **dict(zip(KEY_FIELDS, key)),
+                    transitions=transitions,
+                    seconds=seconds
+                )
+                for key, (transitions, seconds) in expected.items()
+            ),
+            batch_size=batch_size
+        )
+    return drift
+
+
+def status_position(status, pk):
+    # Статусы без записи в справочнике (удаленные и пустой) - в конце
+    if status is None:
+        return (1, 0, pk or 0)
+    return (0, status.order, pk)
+
+
+def duration_report(group):
+    """Среднее время в статусах по мастерским, мастерам или типам техники.
+
+    group - 'workshop', 'master' или 'appliance_type'. Читаются только
+    строки StatusDurationStats, по числу сочетаний справочников.
+    Возвращает (статусы, [(группа, [ячейка по каждому статусу])]);
+    ячейка - словарь transitions и hours или None.
+    """
+    rows = StatusDurationStats.objects.values_list(
+        f'{group}_id', 'status_id'
+    ).annotate(
+        total_transitions=Sum('transitions'), total_seconds=Sum('seconds')
+    ).order_by()
+    cells = {}
+    for group_id, status_id, transitions, seconds in rows:
+        if transitions:
+            cells[group_id, status_id] = {
+                'transitions': transitions,
+                'hours': seconds / transitions / 3600,
+            }
+    snapshot = references()
+    status_ids = sorted(
+        {status_id for _, status_id in cells},
+        key=lambda pk: status_position(snapshot.statuses.get(pk), pk)
+    )
+    statuses = [snapshot.statuses.get(pk) for pk in status_ids]
+    group_ids = {group_id for group_id, _ in cells}
+    if group == 'master':
+        names = {
+            user.pk: user.get_full_name() or user.username
+            for user in User.objects.filter(pk__in=group_ids - {None})
+        }
+    else:
+        objects = getattr(snapshot, f'{group}s')
+        names = {pk: str(objects[pk]) for pk in group_ids if pk in objects}
+    groups = sorted(
+        (
+            (names.get(group_id, 'не указано'), [
+                cells.get((group_id, status_id)) for status_id in status_ids
+            ])
+            for group_id in group_ids
+        ),
+        key=lambda row: row[0]
+    )
+    return statuses, groups
@@ -0,0 +1,11 @@
+from django import template
+
+from ..card_cache import render_order_cards
+
+register = template.Library()
+
+
+@register.simple_tag
+def order_cards(order_list):
+    """Список HTML-карточек заказов с учетом кэша"""
+    return render_order_cards(list(order_list))
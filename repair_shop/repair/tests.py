@@ -1,9 +1,55 @@
+import csv
+import gc
+import gzip
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase, Client
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, connections, router, transaction
+from django.db.models import F, Sum
+from django.test import (
+    TestCase, TransactionTestCase, Client, override_settings
+)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 
+from repair_shop.repair import (
+    card_cache, checks, export, metrics, notifications, search, snapshot,
+    sqlite, stats, status_log
+)
+from repair_shop.repair.admin_tools import table_row_estimate
+from repair_shop.repair.benchmarks import percentile, use_database
+from repair_shop.repair.management.commands.bench_views import (
+    Command as BenchViewsCommand
+)
 from repair_shop.repair.models import (
-    ApplianceType, Workshop, Customer, RepairStatus, RepairOrder
+    CARD_DESCRIPTION_CHARS, ApplianceType, Workshop, Customer, RepairStatus,
+    RepairOrder, OrderStats, Notification, StatusEvent, StatusDurationStats
+)
+from repair_shop.repair.middleware import RequestProfile
+from repair_shop.repair.pagination import (
+    NEXT, ORDERS_PER_PAGE, encode_cursor
+)
+from repair_shop.repair.references import invalidate_references, references
+from repair_shop.repair.routers import refresh_replica
+from repair_shop.repair.search import MAX_SEARCH_PAGE
+from repair_shop.repair.staticfiles import IMMUTABLE, SHORT_CACHE
+from repair_shop.repair.utils import (
+    TRACKING_ALPHABET, explicit_timestamps, normalize_phone
 )
 
 User = get_user_model()
@@ -184,4 +230,2620 @@ class RepairLogicTest(TestCase):
         response = self.guest_client.get(
             reverse('repair:order_detail', kwargs={'order_id': hidden_order.id})
         )
-        self.assertEqual(response.status_code, 404)
\ No newline at end of file
+        self.assertEqual(response.status_code, 404)
+
+
+class RepairPaginationTest(TestCase):
+    ORDERS_COUNT = 35
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.create(name='Ivan', phone='123')
+        cls.appliance_type = ApplianceType.objects.create(
+            title='Fridge', slug='fridge'
+        )
+        cls.workshop = Workshop.objects.create(name='Main Shop')
+        RepairOrder.objects.bulk_create(
+            RepairOrder(
+                customer=cls.customer,
+                appliance_type=cls.appliance_type,
+                workshop=cls.workshop,
+                appliance_brand=f'Brand {number}',
+                description='Broken'
+            )
+            for number in range(cls.ORDERS_COUNT)
+        )
+        # Одинаковое время создания: порядок должен держаться на id
+        RepairOrder.objects.update(created_at=timezone.now())
+        cls.urls = (
+            reverse('repair:index'),
+            reverse('repair:appliance_type_orders',
+                    kwargs={'appliance_type_slug': 'fridge'}),
+            reverse('repair:workshop_orders',
+                    kwargs={'workshop_id': cls.workshop.id}),
+        )
+
+    def walk_forward(self, url):
+        """Проходит все страницы по ссылкам «Старее»."""
+        pages = []
+        response = self.client.get(url)
+        while True:
+            pages.append(response.context['page_obj'])
+            if not pages[-1].has_next:
+                return pages
+            response = self.client.get(
+                url, {'cursor': pages[-1].next_cursor}
+            )
+
+    def test_pages_cover_all_orders_once(self):
+        """Страницы идут от новых к старым без пропусков и повторов."""
+        expected = list(
+            RepairOrder.objects.order_by('-id').values_list('id', flat=True)
+        )
+        for url in self.urls:
+            with self.subTest(url=url):
+                pages = self.walk_forward(url)
+                ids = [order.id for page in pages for order in page]
+                self.assertEqual(ids, expected)
+                self.assertEqual(
+                    [len(page) for page in pages],
+                    [ORDERS_PER_PAGE] * 3 + [5]
+                )
+
+    def test_query_count_does_not_grow_with_depth(self):
+        """Глубокая страница стоит столько же запросов, сколько первая."""
+        for url in self.urls:
+            with self.subTest(url=url):
+                pages = self.walk_forward(url)
+                with CaptureQueriesContext(connection) as first:
+                    self.client.get(url)
+                with CaptureQueriesContext(connection) as deep:
+                    self.client.get(url, {'cursor': pages[-2].next_cursor})
+                self.assertEqual(len(first), len(deep))
+                # Выборка страницы всегда ограничена per_page + 1 строкой
+                self.assertIn(f'LIMIT {ORDERS_PER_PAGE + 1}', deep[-1]['sql'])
+
+    def test_previous_cursor_returns_to_previous_page(self):
+        """Ссылка «Новее» возвращает ровно на предыдущую страницу."""
+        url = self.urls[0]
+        pages = self.walk_forward(url)
+        response = self.client.get(
+            url, {'cursor': pages[2].previous_cursor}
+        )
+        page = response.context['page_obj']
+        self.assertEqual(list(page), list(pages[1]))
+        self.assertTrue(page.has_next)
+        self.assertTrue(page.has_previous)
+        first = self.client.get(url, {'cursor': pages[1].previous_cursor})
+        self.assertFalse(first.context['page_obj'].has_previous)
+
+    def test_invalid_cursor_returns_404(self):
+        """Испорченный курсор дает 404, а не ошибку сервера."""
+        huge = encode_cursor(NEXT, timezone.now(), 10 ** 30)
+        for cursor in ('garbage', 'WyJ4IiwgMSwgMl0', huge):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(self.urls[0], {'cursor': cursor})
+                self.assertEqual(response.status_code, 404)
+
+
+class RepairQueryPlanTest(TestCase):
+    """Запросы публичных страниц идут по индексам.
+
+    Каждый SQL-запрос, выполненный представлением, прогоняется через
+    EXPLAIN QUERY PLAN: полный проход по таблице или сортировка во
+    временном B-дереве означают, что запрос перестал попадать в индекс.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        customer = Customer.objects.create(name='Ivan', phone='123')
+        cls.appliance_type = ApplianceType.objects.create(
+            title='Fridge', slug='fridge'
+        )
+        cls.workshop = Workshop.objects.create(name='Main Shop')
+        status = RepairStatus.objects.create(name='In Progress')
+        RepairOrder.objects.bulk_create(
+            RepairOrder(
+                customer=customer,
+                appliance_type=cls.appliance_type,
+                workshop=cls.workshop,
+                status=status,
+                appliance_brand='Samsung',
+                description='Broken'
+            )
+            for _ in range(ORDERS_PER_PAGE * 2)
+        )
+
+    def setUp(self):
+        # Справочники читаются целиком раз на процесс, а не на запрос
+        references()
+
+    def assert_queries_use_indexes(self, url, data=None):
+        tables = set(connection.introspection.table_names())
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, data)
+        self.assertEqual(response.status_code, 200)
+        for query in context.captured_queries:
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                plan = [row[-1] for row in cursor.fetchall()]
+            for step in plan:
+                with self.subTest(url=url, data=data, step=step):
+                    self.assertNotIn('TEMP B-TREE', step)
+                    # Проход по подзапросу окна страницы (LIMIT) допустим,
+                    # по таблице без индекса - нет
+                    words = step.split()
+                    self.assertFalse(
+                        words[0] == 'SCAN' and words[1] in tables
+                        and 'USING' not in step,
+                        f'Полный проход по таблице: {query["sql"]}'
+                    )
+        return response
+
+    def test_list_views_use_indexes(self):
+        """Первая и следующая страницы списков не сканируют таблицу."""
+        urls = (
+            reverse('repair:index'),
+            reverse('repair:appliance_type_orders',
+                    kwargs={'appliance_type_slug': 'fridge'}),
+            reverse('repair:workshop_orders',
+                    kwargs={'workshop_id': self.workshop.id}),
+        )
+        for url in urls:
+            response = self.assert_queries_use_indexes(url)
+            cursor = response.context['page_obj'].next_cursor
+            response = self.assert_queries_use_indexes(url, {'cursor': cursor})
+            cursor = response.context['page_obj'].previous_cursor
+            self.assert_queries_use_indexes(url, {'cursor': cursor})
+
+    def test_order_detail_uses_primary_key(self):
+        """Страница заказа ищет строку по первичному ключу."""
+        order = RepairOrder.objects.first()
+        self.assert_queries_use_indexes(
+            reverse('repair:order_detail', kwargs={'order_id': order.id})
+        )
+
+
+class OrderCardCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        card_cache.stats.reset()
+        self.customer = Customer.objects.create(name='Ivan', phone='123')
+        self.appliance_type = ApplianceType.objects.create(
+            title='Fridge', slug='fridge'
+        )
+        self.workshop = Workshop.objects.create(name='Main Shop')
+        self.status = RepairStatus.objects.create(name='In Progress')
+        self.order = RepairOrder.objects.create(
+            customer=self.customer,
+            appliance_type=self.appliance_type,
+            workshop=self.workshop,
+            status=self.status,
+            appliance_brand='Samsung',
+            description='Broken'
+        )
+        self.other_order = RepairOrder.objects.create(
+            customer=Customer.objects.create(name='Petr', phone='456'),
+            appliance_type=ApplianceType.objects.create(
+                title='Oven', slug='oven'
+            ),
+            appliance_brand='Bosch',
+            description='Broken'
+        )
+
+    def get_index(self):
+        return self.client.get(reverse('repair:index'))
+
+    def test_second_render_is_served_from_cache(self):
+        """Повторный показ страницы не рендерит карточки заново."""
+        self.get_index()
+        self.assertEqual(
+            (card_cache.stats.hits, card_cache.stats.misses), (0, 2)
+        )
+        response = self.get_index()
+        self.assertEqual(
+            (card_cache.stats.hits, card_cache.stats.misses), (2, 2)
+        )
+        self.assertTemplateNotUsed(response, card_cache.CARD_TEMPLATE)
+        self.assertContains(response, 'Samsung')
+
+    def test_related_changes_invalidate_cards(self):
+        """Правка клиента меняет его карточки, правка справочника - все."""
+        # Справочник меняет свою версию, а она входит в ключ карточки
+        renames = (
+            (self.customer, 'name', 'Ivan Ivanov', (1, 1)),
+            (self.workshop, 'name', 'North Shop', (0, 2)),
+            (self.appliance_type, 'title', 'Freezer', (0, 2)),
+            (self.status, 'name', 'Ready', (0, 2)),
+        )
+        self.get_index()
+        for instance, field, value, expected in renames:
+            with self.subTest(model=type(instance).__name__):
+                setattr(instance, field, value)
+                instance.save()
+                card_cache.stats.reset()
+                response = self.get_index()
+                self.assertContains(response, value)
+                self.assertEqual(
+                    (card_cache.stats.hits, card_cache.stats.misses), expected
+                )
+
+    def test_order_save_and_delete_invalidate_card(self):
+        """Сохранение заказа дает новую карточку, удаление убирает ее."""
+        self.get_index()
+        order = RepairOrder.objects.get(pk=self.order.pk)
+        old_key = card_cache.card_cache_key(order.pk, order.updated_at)
+        order.appliance_brand = 'LG'
+        order.save()
+        self.assertIsNone(cache.get(old_key))
+        self.assertContains(self.get_index(), 'LG')
+        order.delete()
+        self.assertIsNone(
+            cache.get(card_cache.card_cache_key(order.pk, order.updated_at))
+        )
+
+    def test_reference_delete_invalidates_cards(self):
+        """Удаление мастерской убирает ее название из карточек."""
+        self.get_index()
+        self.workshop.delete()
+        self.assertNotContains(self.get_index(), 'Main Shop')
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.create(name='Ivan', phone='123')
+        cls.appliance_type = ApplianceType.objects.create(
+            title='Fridge', slug='fridge'
+        )
+        cls.workshop = Workshop.objects.create(name='Main Shop')
+        RepairOrder.objects.bulk_create(
+            RepairOrder(
+                customer=cls.customer,
+                appliance_type=cls.appliance_type,
+                workshop=cls.workshop,
+                appliance_brand=f'Brand {number}',
+                description='Broken'
+            )
+            for number in range(ORDERS_PER_PAGE + 5)
+        )
+        cls.order = RepairOrder.objects.first()
+        cls.urls = (
+            reverse('repair:index'),
+            reverse('repair:order_detail', kwargs={'order_id': cls.order.id}),
+            reverse('repair:appliance_type_orders',
+                    kwargs={'appliance_type_slug': 'fridge'}),
+            reverse('repair:workshop_orders',
+                    kwargs={'workshop_id': cls.workshop.id}),
+        )
+
+    def test_current_etag_gets_304_for_one_query(self):
+        """Актуальная копия у клиента стоит одного запроса без рендера."""
+        for url in self.urls:
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                with self.assertNumQueries(1):
+                    response = self.client.get(
+                        url, HTTP_IF_NONE_MATCH=etag
+                    )
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.templates, [])
+
+    def test_if_modified_since_gets_304(self):
+        """Клиент без ETag проверяет актуальность по Last-Modified."""
+        for url in self.urls:
+            with self.subTest(url=url):
+                last_modified = self.client.get(url)['Last-Modified']
+                response = self.client.get(
+                    url, HTTP_IF_MODIFIED_SINCE=last_modified
+                )
+                self.assertEqual(response.status_code, 304)
+
+    def test_changed_order_invalidates_etag(self):
+        """Правка заказа на странице дает новую версию страницы."""
+        for url in self.urls:
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                self.order.description = f'Broken again {url}'
+                self.order.save()
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etag)
+
+    def test_hidden_order_changes_page_etag(self):
+        """Скрытый заказ сдвигает окно страницы и меняет ETag."""
+        url = self.urls[0]
+        etag = self.client.get(url)['ETag']
+        RepairOrder.objects.filter(pk=self.order.pk).update(
+            is_published=False
+        )
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_deep_page_has_own_validator(self):
+        """Страница по курсору проверяется по своим строкам."""
+        url = self.urls[0]
+        cursor = self.client.get(url).context['page_obj'].next_cursor
+        etag = self.client.get(url, {'cursor': cursor})['ETag']
+        # Изменение заказа с первой страницы не трогает вторую
+        newest = RepairOrder.objects.order_by('-created_at', '-id').first()
+        newest.save()
+        response = self.client.get(
+            url, {'cursor': cursor}, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 304)
+
+
+class CreateTestDataCommandTest(TestCase):
+    def generate(self, **options):
+        call_command(
+            'create_test_data', stdout=StringIO(), workshops=3, masters=4,
+            batch_size=50, **options
+        )
+        return list(
+            RepairOrder.objects.order_by('pk').values_list(
+                'customer__phone', 'appliance_type__slug', 'appliance_brand',
+                'workshop__name', 'master__username', 'status__name',
+                'final_cost', 'created_at', 'completed_at', 'is_published',
+                'tracking_code'
+            )
+        )
+
+    def test_demo_data_is_created_once(self):
+        """Без параметров создается демонстрационный набор без дублей."""
+        call_command('create_test_data', stdout=StringIO())
+        call_command('create_test_data', stdout=StringIO())
+        self.assertEqual(RepairOrder.objects.count(), 4)
+        self.assertEqual(Customer.objects.count(), 3)
+
+    def test_generated_volume(self):
+        """Генератор создает заданное число клиентов и заказов."""
+        self.generate(orders=300, customers=40, seed=1)
+        self.assertEqual(RepairOrder.objects.count(), 300)
+        self.assertEqual(Customer.objects.count(), 40)
+        self.assertEqual(Workshop.objects.count(), 3)
+        self.assertFalse(
+            RepairOrder.objects.filter(
+                status__name__in=('Готов', 'Выдан'), completed_at=None
+            ).exists()
+        )
+
+    def test_same_seed_gives_same_dataset(self):
+        """Повторная генерация с тем же seed дает те же строки."""
+        first = self.generate(orders=300, seed=3)
+        RepairOrder.objects.all().delete()
+        Customer.objects.all().delete()
+        self.assertEqual(self.generate(orders=300, seed=3), first)
+        RepairOrder.objects.all().delete()
+        Customer.objects.all().delete()
+        self.assertNotEqual(self.generate(orders=300, seed=4), first)
+
+    def test_generated_data_is_analyzed(self):
+        """После генерации число заказов известно из статистики."""
+        self.generate(orders=300, seed=1)
+        self.assertEqual(table_row_estimate(RepairOrder), 300)
+
+
+PROFILING = {
+    'ENABLED': True,
+    'SAMPLE_RATE': 1.0,
+    'SLOW_REQUEST_MS': 10_000,
+    'WORST_QUERIES': 2,
+}
+
+
+@override_settings(REQUEST_PROFILING=PROFILING)
+class RequestProfilingMiddlewareTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        customer = Customer.objects.create(name='Ivan', phone='123')
+        appliance_type = ApplianceType.objects.create(
+            title='Fridge', slug='fridge'
+        )
+        RepairOrder.objects.create(
+            customer=customer,
+            appliance_type=appliance_type,
+            appliance_brand='Samsung',
+            description='Broken'
+        )
+
+    def test_server_timing_header(self):
+        """В ответе есть число запросов, время SQL, шаблонов и общее."""
+        response = self.client.get(reverse('repair:index'))
+        self.assertRegex(
+            response['Server-Timing'],
+            r'^db;dur=[\d.]+;desc="2 queries, 0 duplicate", '
+            r'tpl;dur=[\d.]+, total;dur=[\d.]+$'
+        )
+
+    @override_settings(
+        REQUEST_PROFILING={**PROFILING, 'ENABLED': False}
+    )
+    def test_disabled_profiling_is_not_loaded(self):
+        """Выключенный профилировщик не участвует в обработке."""
+        response = self.client.get(reverse('repair:index'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    @override_settings(
+        REQUEST_PROFILING={**PROFILING, 'SAMPLE_RATE': 0.0}
+    )
+    def test_unsampled_requests_are_skipped(self):
+        response = self.client.get(reverse('repair:index'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    @override_settings(
+        REQUEST_PROFILING={**PROFILING, 'SLOW_REQUEST_MS': 0}
+    )
+    def test_slow_request_is_logged_with_worst_queries(self):
+        """Медленный запрос попадает в лог вместе с самыми долгими SQL."""
+        logger = 'repair_shop.repair.middleware'
+        with self.assertLogs(logger, 'WARNING') as log:
+            self.client.get(reverse('repair:index'))
+        self.assertIn('repair_repairorder', log.output[0])
+
+    def test_duplicate_queries_are_counted(self):
+        """Повторы одного SQL с разными параметрами считаются дублями."""
+        profile = RequestProfile(worst_queries=2)
+        for sql in ('SELECT 1', 'SELECT 2', 'SELECT 1', 'SELECT 1'):
+            profile(lambda *args: None, sql, (), False, {})
+        self.assertEqual(profile.queries, 4)
+        self.assertEqual(profile.duplicates, 2)
+        self.assertEqual(len(profile.worst()), 2)
+
+
+class OrderSearchTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.appliance_type = ApplianceType.objects.create(
+            title='Стиральные машины', slug='washers', is_published=True
+        )
+        cls.status = RepairStatus.objects.create(name='Принят', order=1)
+        cls.customer = Customer.objects.create(
+            name='Пётр Соколов', phone='+7 (916) 123-45-67'
+        )
+        other = Customer.objects.create(name='Анна Иванова', phone='555')
+
+        def create(customer, brand, description, **kwargs):
+            return RepairOrder.objects.create(
+                customer=customer,
+                appliance_type=cls.appliance_type,
+                appliance_brand=brand,
+                description=description,
+                status=cls.status,
+                **kwargs
+            )
+
+        cls.drum = create(
+            cls.customer, 'Bosch', 'Не вращается барабан, шумит подшипник'
+        )
+        cls.pump = create(other, 'Indesit', 'Не сливает воду, засор насоса')
+        cls.bosch_pump = create(other, 'LG', 'Насос Bosch не качает')
+        cls.hidden = create(
+            other, 'Bosch', 'Скрытый заказ', is_published=False
+        )
+
+    def found(self, text):
+        return search.search_order_ids(text, limit=50)
+
+    def test_prefix_and_case_insensitive_match(self):
+        """Ищутся начала слов в любом регистре, включая кириллицу."""
+        self.assertEqual(self.found('БАРАБ'), [self.drum.pk])
+        self.assertEqual(
+            set(self.found('насос')), {self.pump.pk, self.bosch_pump.pk}
+        )
+        self.assertEqual(self.found('подшипник бош'), [])
+
+    def test_e_with_diaeresis(self):
+        """Буква ё в имени находится и через е."""
+        self.assertEqual(self.found('петр'), [self.drum.pk])
+        self.assertEqual(self.found('Пётр'), [self.drum.pk])
+
+    def test_phone_digits(self):
+        """Телефон находится по цифрам в любом формате."""
+        for text in ('89161234567', '+7 916 123-45-67', '9161234'):
+            with self.subTest(text=text):
+                self.assertEqual(self.found(text), [self.drum.pk])
+
+    def test_brand_ranks_above_description(self):
+        """Совпадение в марке важнее упоминания в описании."""
+        self.assertEqual(
+            self.found('bosch'), [self.drum.pk, self.bosch_pump.pk]
+        )
+
+    def test_index_follows_customer_changes(self):
+        """Переименование клиента сразу попадает в индекс."""
+        self.customer.name = 'Павел Орлов'
+        self.customer.save()
+        self.assertEqual(self.found('пётр'), [])
+        self.assertEqual(self.found('орлов'), [self.drum.pk])
+
+    def test_index_follows_order_changes(self):
+        """Изменение и удаление заказа обновляют индекс."""
+        RepairOrder.objects.filter(pk=self.pump.pk).update(
+            description='Течет дверца'
+        )
+        self.assertEqual(self.found('засор'), [])
+        self.assertEqual(self.found('дверца'), [self.pump.pk])
+        self.pump.delete()
+        self.assertEqual(self.found('дверца'), [])
+
+    def test_search_page(self):
+        """Страница поиска показывает найденные опубликованные заказы."""
+        response = self.client.get(reverse('repair:search'), {'q': 'bosch'})
+        self.assertTemplateUsed(response, 'repair/search.html')
+        self.assertEqual(
+            response.context['order_list'], [self.drum, self.bosch_pump]
+        )
+        self.assertFalse(response.context['has_next'])
+        empty = self.client.get(reverse('repair:search'), {'q': '!!!'})
+        self.assertEqual(empty.context['order_list'], [])
+
+    def test_search_page_limit(self):
+        """Номер страницы дальше предела дает 404, а не ошибку SQLite."""
+        url = reverse('repair:search')
+        last = self.client.get(url, {'q': 'bosch', 'page': MAX_SEARCH_PAGE})
+        self.assertEqual(last.status_code, 200)
+        self.assertEqual(last.context['order_list'], [])
+        for page in (MAX_SEARCH_PAGE + 1, 10 ** 30):
+            response = self.client.get(url, {'q': 'bosch', 'page': page})
+            self.assertEqual(response.status_code, 404)
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке идет через FTS5, а не LIKE."""
+        admin_user = User.objects.create_superuser('admin', password='pass')
+        self.client.force_login(admin_user)
+        url = reverse('admin:repair_repairorder_changelist')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'q': 'bosch'})
+        self.assertEqual(
+            set(response.context['cl'].result_list),
+            {self.drum, self.bosch_pump, self.hidden}
+        )
+        sql = ' '.join(query['sql'] for query in queries)
+        self.assertIn('MATCH', sql)
+        self.assertNotIn('LIKE', sql)
+
+    def test_rebuild_command(self):
+        """Команда перестраивает индекс с нуля."""
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM repair_order_search')
+        self.assertEqual(self.found('барабан'), [])
+        call_command('rebuild_search_index', batch_size=2, stdout=StringIO())
+        self.assertEqual(self.found('барабан'), [self.drum.pk])
+        self.assertEqual(len(self.found('не')), 3)
+
+
+class RepairOrderAdminTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', password='pass')
+        cls.status = RepairStatus.objects.create(name='Принят', order=1)
+        cls.workshop = Workshop.objects.create(name='Центральная')
+        cls.appliance_type = ApplianceType.objects.create(
+            title='Холодильники', slug='fridges'
+        )
+        cls.customers = Customer.objects.bulk_create(
+            Customer(name=f'Клиент {number}', phone=str(number))
+            for number in range(30)
+        )
+        cls.masters = [
+            User.objects.create_user(f'master{number}', is_staff=True)
+            for number in range(3)
+        ]
+        User.objects.create_user('visitor')
+        for number, customer in enumerate(cls.customers):
+            RepairOrder.objects.create(
+                customer=customer,
+                appliance_type=cls.appliance_type,
+                appliance_brand='Atlant',
+                description='Не морозит',
+                workshop=cls.workshop,
+                master=cls.masters[number % 3],
+                status=cls.status
+            )
+        cls.changelist = reverse('admin:repair_repairorder_changelist')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def test_changelist_queries_do_not_depend_on_rows(self):
+        """Связанные объекты списка загружаются одним запросом."""
+        self.client.get(self.changelist)
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(self.changelist)
+        self.assertEqual(len(response.context['cl'].result_list), 30)
+        RepairOrder.objects.exclude(customer=self.customers[0]).delete()
+        with CaptureQueriesContext(connection) as few:
+            response = self.client.get(self.changelist)
+        self.assertEqual(len(response.context['cl'].result_list), 1)
+        self.assertEqual(len(many), len(few))
+
+    def test_count_is_cached(self):
+        """Число заказов не пересчитывается на каждой странице."""
+        self.client.get(self.changelist, {'workshop__id__exact': 1})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                self.changelist, {'workshop__id__exact': 1}
+            )
+        self.assertEqual(response.context['cl'].result_count, 30)
+        self.assertFalse(
+            any('COUNT(' in query['sql'] for query in queries)
+        )
+
+    def test_unfiltered_count_uses_table_statistics(self):
+        """Без фильтров число строк берется из статистики ANALYZE."""
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.customers[0].orders.all().delete()
+        response = self.client.get(self.changelist)
+        self.assertEqual(response.context['cl'].result_count, 30)
+
+    def test_migrate_collects_table_statistics(self):
+        """После migrate статистика есть без ручного ANALYZE."""
+        self.assertIsNone(table_row_estimate(RepairOrder))
+        call_command('migrate', verbosity=0)
+        self.assertEqual(table_row_estimate(RepairOrder), 30)
+
+    def test_filters_list_staff_and_refresh(self):
+        """В фильтре мастера только сотрудники, новая мастерская видна."""
+        response = self.client.get(self.changelist)
+        choices = {
+            spec.title: [
+                choice['display'] for choice in spec.choices(
+                    response.context['cl']
+                )
+            ]
+            for spec in response.context['cl'].filter_specs
+        }
+        self.assertNotIn('visitor', choices['Мастер'])
+        self.assertIn('master0', choices['Мастер'])
+        Workshop.objects.create(name='Северная')
+        response = self.client.get(self.changelist)
+        self.assertContains(response, 'Северная')
+
+    def test_change_form_does_not_list_customers(self):
+        """Клиент и мастер выбираются через автодополнение."""
+        order = self.customers[0].orders.get()
+        response = self.client.get(
+            reverse('admin:repair_repairorder_change', args=[order.pk])
+        )
+        self.assertContains(response, 'admin-autocomplete')
+        self.assertNotContains(response, 'Клиент 29')
+
+
+class OrderStatsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.accepted = RepairStatus.objects.create(name='Принят', order=1)
+        cls.done = RepairStatus.objects.create(name='Готов', order=2)
+        cls.workshop = Workshop.objects.create(name='Центральная')
+        cls.appliance_type = ApplianceType.objects.create(
+            title='Холодильники', slug='fridges'
+        )
+        cls.customer = Customer.objects.create(name='Клиент', phone='1')
+
+    def create_order(self, **kwargs):
+        fields = {
+            'customer': self.customer,
+            'appliance_type': self.appliance_type,
+            'appliance_brand': 'Atlant',
+            'description': 'Не морозит',
+            'workshop': self.workshop,
+            'status': self.accepted,
+        }
+        return RepairOrder.objects.create(**{**fields, **kwargs})
+
+    def assert_stats_consistent(self):
+        self.assertEqual(
+            stats.stats_drift(stats.current_stats(), stats.expected_stats()),
+            []
+        )
+
+    def test_save_and_delete_update_stats(self):
+        """Создание, смена статуса, стоимости и удаление учитываются."""
+        order = self.create_order()
+        self.create_order(final_cost=1000)
+        self.assert_stats_consistent()
+        order.status = self.done
+        order.final_cost = 2500
+        order.save()
+        self.assert_stats_consistent()
+        row = OrderStats.objects.get(status=self.done)
+        self.assertEqual((row.orders, row.revenue), (1, 2500))
+        partial = RepairOrder.objects.only('status').get(pk=order.pk)
+        partial.status = self.accepted
+        partial.save()
+        self.assert_stats_consistent()
+        partial.delete()
+        self.assert_stats_consistent()
+        self.assertEqual(
+            OrderStats.objects.aggregate(total=Sum('orders'))['total'], 1
+        )
+
+    def test_deleted_workshop_moves_stats(self):
+        """Статистика удаленной мастерской переходит в «не указано»."""
+        self.create_order(final_cost=500)
+        other = Workshop.objects.create(name='Северная')
+        self.create_order(workshop=None, final_cost=300)
+        self.create_order(workshop=other)
+        other.delete()
+        self.workshop.delete()
+        self.assert_stats_consistent()
+        self.assertEqual(OrderStats.objects.get().orders, 3)
+
+    def test_reconcile_reports_and_fixes_drift(self):
+        """Сверка находит изменения в обход save() и исправляет их."""
+        self.create_order()
+        RepairOrder.objects.update(status=self.done, final_cost=700)
+        with self.assertRaises(CommandError):
+            call_command(
+                'reconcile_order_stats', check=True, stdout=StringIO()
+            )
+        output = StringIO()
+        call_command('reconcile_order_stats', stdout=output)
+        self.assertIn('Расхождений: 2 строк', output.getvalue())
+        self.assert_stats_consistent()
+        call_command('reconcile_order_stats', check=True, stdout=StringIO())
+
+    def test_dashboard_reads_only_stats(self):
+        """Сводка доступна сотрудникам и не читает таблицу заказов."""
+        self.create_order(final_cost=1200)
+        url = reverse('repair:stats')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(
+            User.objects.create_user('manager', is_staff=True)
+        )
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.context['totals']['total_orders'], 1)
+        self.assertContains(response, 'Центральная')
+        self.assertFalse(
+            any('repair_repairorder' in query['sql'] for query in queries)
+        )
+
+
+class OrderExportTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.status = RepairStatus.objects.create(name='Готов', order=1)
+        cls.workshop = Workshop.objects.create(name='Центральная')
+        cls.appliance_type = ApplianceType.objects.create(
+            title='Холодильники', slug='fridges'
+        )
+        customer = Customer.objects.create(
+            name='Иванов, Иван', phone='+7 (999) 111-22-33'
+        )
+        with explicit_timestamps(RepairOrder):
+            for day in (1, 15, 31):
+                created_at = timezone.make_aware(datetime(2025, 1, day, 12))
+                RepairOrder.objects.create(
+                    customer=customer,
+                    appliance_type=cls.appliance_type,
+                    appliance_brand='Atlant',
+                    description='Не морозит,\nшумит',
+                    workshop=cls.workshop if day > 1 else None,
+                    status=cls.status,
+                    final_cost=Decimal('1500.50'),
+                    created_at=created_at,
+                    updated_at=created_at
+                )
+        cls.staff = User.objects.create_user('accountant', is_staff=True)
+
+    def export(self, **params):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('repair:export_orders'), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_csv_with_filters(self):
+        """CSV содержит заголовок и только отфильтрованные заказы."""
+        content = self.export(
+            date_from='2025-01-02', date_to='2025-01-31',
+            workshop=self.workshop.pk
+        ).decode('utf-8-sig')
+        rows = list(csv.DictReader(StringIO(content)))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]['customer_name'], 'Иванов, Иван')
+        self.assertEqual(rows[0]['description'], 'Не морозит,\nшумит')
+        self.assertEqual(rows[1]['created_at'][:10], '2025-01-31')
+        self.assertEqual(rows[1]['appliance_type'], 'fridges')
+        self.assertEqual(rows[1]['final_cost'], '1500.50')
+
+    def test_gzipped_jsonl(self):
+        """JSON Lines можно сжать gzip на лету."""
+        content = gzip.decompress(self.export(format='jsonl', gzip='on'))
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(len(rows), 3)
+        self.assertIsNone(rows[0]['workshop'])
+        self.assertEqual(rows[0]['final_cost'], '1500.50')
+        self.assertEqual(rows[2]['status'], 'Готов')
+
+    def test_invalid_filters_and_access(self):
+        """Выгрузка только для сотрудников и с корректными фильтрами."""
+        url = reverse('repair:export_orders')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(self.staff)
+        response = self.client.get(url, {'date_from': '2025-13-01'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_command_writes_file(self):
+        """Команда пишет ту же выгрузку в файл."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'orders.csv')
+            call_command(
+                'export_orders', output=path, date_to='2025-01-15',
+                stdout=StringIO()
+            )
+            with open(path, encoding='utf-8-sig', newline='') as file:
+                rows = list(csv.DictReader(file))
+        self.assertEqual(len(rows), 2)
+
+
+class ImportOrdersTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.status = RepairStatus.objects.create(name='Принят', order=1)
+        cls.workshop = Workshop.objects.create(name='Центральная')
+        cls.appliance_type = ApplianceType.objects.create(
+            title='Холодильники', slug='fridges'
+        )
+        cls.customer = Customer.objects.create(
+            name='Пётр Соколов', phone='+7 (916) 123-45-67'
+        )
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write(self, name, records):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=export.HEADER)
+            writer.writeheader()
+            for record in records:
+                writer.writerow(record)
+        return path
+
+    def record(self, **fields):
+        return {
+            'created_at': '2025-03-01T10:00:00+03:00',
+            'customer_name': 'Анна Иванова',
+            'customer_phone': '8 (999) 111-22-33',
+            'appliance_type': 'fridges',
+            'appliance_brand': 'Atlant',
+            'description': 'Не морозит',
+            'workshop': 'Центральная',
+            'status': 'Принят',
+            'final_cost': '1500.50',
+            **fields
+        }
+
+    def test_import_dedupes_customers_and_updates_indexes(self):
+        """Клиенты сводятся по телефону, статистика и поиск обновлены."""
+        path = self.write('orders.csv', [
+            self.record(),
+            self.record(customer_phone='+7 999 1112233', final_cost=''),
+            self.record(customer_phone='89161234567', description='Течет'),
+        ])
+        call_command('import_orders', path, batch_size=2, stdout=StringIO())
+        self.assertEqual(Customer.objects.count(), 2)
+        anna = Customer.objects.get(name='Анна Иванова')
+        self.assertEqual(anna.orders.count(), 2)
+        self.assertEqual(anna.phone_normalized, normalize_phone(anna.phone))
+        self.assertEqual(self.customer.orders.get().description, 'Течет')
+        order = anna.orders.order_by('pk').first()
+        self.assertEqual(order.final_cost, Decimal('1500.50'))
+        self.assertEqual(
+            order.created_at,
+            timezone.make_aware(datetime(2025, 3, 1, 7))
+        )
+        self.assertEqual(
+            stats.stats_drift(stats.current_stats(), stats.expected_stats()),
+            []
+        )
+        self.assertEqual(len(search.search_order_ids('течет соколов', 5)), 1)
+        self.assertEqual(len(search.search_order_ids('9991112233', 5)), 2)
+        codes = set(
+            RepairOrder.objects.values_list('tracking_code', flat=True)
+        )
+        self.assertEqual(len(codes), 3)
+        self.assertEqual({len(code) for code in codes}, {10})
+
+    def test_export_round_trip(self):
+        """Выгрузку export_orders можно загрузить обратно."""
+        RepairOrder.objects.create(
+            customer=self.customer,
+            appliance_type=self.appliance_type,
+            appliance_brand='Bosch',
+            description='Шумит',
+            workshop=self.workshop,
+            status=self.status,
+            estimated_cost=100
+        )
+        path = os.path.join(self.directory, 'orders.jsonl.gz')
+        call_command(
+            'export_orders', format='jsonl', gzip=True, output=path,
+            stdout=StringIO()
+        )
+        call_command('import_orders', path, stdout=StringIO())
+        first, second = RepairOrder.objects.order_by('pk').values(
+            'customer', 'appliance_type', 'appliance_brand', 'description',
+            'workshop', 'status', 'estimated_cost', 'created_at'
+        )
+        self.assertEqual(first, second)
+
+    def test_errors_dry_run_and_resume(self):
+        """Плохие строки уходят в отчет, dry-run ничего не пишет."""
+        path = self.write('orders.csv', [
+            self.record(workshop='Неизвестная'),
+            self.record(created_at='вчера'),
+            self.record(),
+            self.record(customer_phone='+7 999 000-00-00'),
+        ])
+        errors = os.path.join(self.directory, 'errors.csv')
+        call_command(
+            'import_orders', path, dry_run=True, errors=errors,
+            stdout=StringIO()
+        )
+        self.assertFalse(RepairOrder.objects.exists())
+        with open(errors, encoding='utf-8') as file:
+            report = list(csv.DictReader(file))
+        self.assertEqual([row['line'] for row in report], ['2', '3'])
+        self.assertIn('workshop', report[0]['error'])
+
+        call_command(
+            'import_orders', path, start_line=5, stdout=StringIO(),
+            stderr=StringIO()
+        )
+        self.assertEqual(
+            list(RepairOrder.objects.values_list(
+                'customer__phone', flat=True
+            )),
+            ['+7 999 000-00-00']
+        )
+
+    def test_normalize_phone(self):
+        """Разные записи одного номера нормализуются одинаково."""
+        for phone in ('8 (999) 111-22-33', '+7 999 1112233', '9991112233'):
+            with self.subTest(phone=phone):
+                self.assertEqual(normalize_phone(phone), '79991112233')
+        self.assertEqual(normalize_phone('112'), '112')
+
+
+class OrderApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        customer = Customer.objects.create(name='Ivan', phone='123')
+        cls.appliance_type = ApplianceType.objects.create(
+            title='Fridge', slug='fridge'
+        )
+        cls.hidden_type = ApplianceType.objects.create(
+            title='Oven', slug='oven', is_published=False
+        )
+        cls.workshop = Workshop.objects.create(name='Main Shop')
+        cls.hidden_workshop = Workshop.objects.create(
+            name='Closed Shop', is_published=False
+        )
+        cls.status = RepairStatus.objects.create(name='In Progress')
+        RepairOrder.objects.bulk_create(
+            RepairOrder(
+                customer=customer,
+                appliance_type=cls.appliance_type,
+                workshop=(
+                    cls.workshop if number % 2 else cls.hidden_workshop
+                ),
+                status=cls.status,
+                appliance_brand=f'Brand {number}',
+                description='Broken',
+                is_published=number != 0
+            )
+            for number in range(ORDERS_PER_PAGE + 5)
+        )
+        RepairOrder.objects.create(
+            customer=customer,
+            appliance_type=cls.hidden_type,
+            appliance_brand='Bosch',
+            description='Hidden type',
+        )
+        cls.published = list(
+            RepairOrder.objects.published()
+            .order_by('-created_at', '-pk').values_list('pk', flat=True)
+        )
+
+    def test_pages_match_html_list(self):
+        """Страницы API содержат те же заказы, что и главная."""
+        url = reverse('api:orders')
+        ids, data = [], self.client.get(url).json()
+        while True:
+            ids.extend(order['id'] for order in data['results'])
+            if data['next'] is None:
+                break
+            data = self.client.get(data['next']).json()
+        self.assertEqual(ids, self.published)
+        previous = self.client.get(data['previous']).json()
+        self.assertEqual(
+            [order['id'] for order in previous['results']],
+            self.published[:ORDERS_PER_PAGE]
+        )
+
+    def test_sparse_fields(self):
+        """?fields= ограничивает ключи ответа и колонки запроса."""
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(
+                reverse('api:orders'), {'fields': 'status,id', 'limit': 2}
+            )
+        self.assertEqual(
+            response.json()['results'][0],
+            {'status': 'In Progress', 'id': self.published[0]}
+        )
+        self.assertNotIn('description', context.captured_queries[-1]['sql'])
+        response = self.client.get(
+            reverse('api:orders'), {'fields': 'id,password'}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('password', response.json()['error'])
+
+    def test_filters_match_html_views(self):
+        """Фильтры по типу и мастерской повторяют HTML-страницы."""
+        url = reverse('api:orders')
+        data = self.client.get(
+            url, {'workshop': self.workshop.id, 'fields': 'id,workshop_name'}
+        ).json()
+        self.assertEqual(
+            {order['workshop_name'] for order in data['results']},
+            {'Main Shop'}
+        )
+        data = self.client.get(url, {'appliance_type': 'oven'}).json()
+        self.assertEqual(data['results'], [])
+        data = self.client.get(
+            url, {'workshop': self.hidden_workshop.id}
+        ).json()
+        self.assertEqual(data['results'], [])
+        # Скрытая мастерская в карточке заказа не раскрывается
+        data = self.client.get(
+            url, {'fields': 'workshop_id,workshop_name', 'limit': 2}
+        ).json()
+        self.assertIn(
+            {'workshop_id': None, 'workshop_name': None}, data['results']
+        )
+
+    def test_order_detail(self):
+        """Скрытый заказ отдается как 404 в JSON."""
+        pk = self.published[0]
+        response = self.client.get(
+            reverse('api:order_detail', kwargs={'order_id': pk}),
+            {'fields': 'id,appliance_type'}
+        )
+        self.assertEqual(
+            response.json(), {'id': pk, 'appliance_type': 'fridge'}
+        )
+        self.assertTrue(response.has_header('ETag'))
+        hidden = RepairOrder.objects.exclude(pk__in=self.published).first()
+        response = self.client.get(
+            reverse('api:order_detail', kwargs={'order_id': hidden.pk})
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertIn('error', response.json())
+
+    def test_reference_lists(self):
+        """Справочники содержат только опубликованные записи."""
+        self.assertEqual(
+            self.client.get(reverse('api:appliance_types')).json(),
+            {'results': [{
+                'id': self.appliance_type.id, 'title': 'Fridge',
+                'slug': 'fridge', 'description': '',
+            }]}
+        )
+        data = self.client.get(
+            reverse('api:workshops'), {'fields': 'name'}
+        ).json()
+        self.assertEqual(data, {'results': [{'name': 'Main Shop'}]})
+        data = self.client.get(reverse('api:statuses')).json()
+        self.assertEqual(data['results'][0]['name'], 'In Progress')
+
+    def test_bad_parameters_return_400(self):
+        """Испорченный курсор и limit дают 400 с текстом ошибки."""
+        huge = encode_cursor(NEXT, timezone.now(), -10 ** 30)
+        for params in ({'cursor': 'garbage'}, {'cursor': huge},
+                       {'limit': 0}, {'limit': 1000}, {'workshop': 'main'}):
+            with self.subTest(params=params):
+                response = self.client.get(reverse('api:orders'), params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+
+
+class SqliteTuningTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'tuned.sqlite3')
+
+    def open_connection(self, **options):
+        """Отдельное соединение с файлом базы по настройкам default."""
+        default = connections['default']
+        settings_dict = {
+            **default.settings_dict, 'NAME': self.path, **options
+        }
+        wrapper = type(default)(settings_dict, alias='tuned')
+        wrapper.ensure_connection()
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def test_pragmas_applied_to_new_connections(self):
+        """Новое соединение получает PRAGMA из настроек."""
+        pragmas = sqlite.current_pragmas(self.open_connection(), (
+            'journal_mode', 'synchronous', 'busy_timeout', 'temp_store',
+            'cache_size', 'mmap_size',
+        ))
+        self.assertEqual(pragmas, {
+            'journal_mode': 'wal',
+            'synchronous': 1,
+            'busy_timeout': 5000,
+            'temp_store': 2,
+            'cache_size': -20000,
+            'mmap_size': 128 * 1024 * 1024,
+        })
+
+    def test_temporary_pragmas_are_restored(self):
+        """temporary_pragmas возвращает прежние значения после блока."""
+        tuned = self.open_connection()
+        with sqlite.temporary_pragmas(tuned, {'cache_size': -100_000}):
+            self.assertEqual(
+                sqlite.current_pragmas(tuned, ['cache_size']),
+                {'cache_size': -100_000}
+            )
+        self.assertEqual(
+            sqlite.current_pragmas(tuned, ['cache_size']),
+            {'cache_size': -20000}
+        )
+
+    def test_busy_timeout_goes_first(self):
+        """busy_timeout выставляется до смены режима журнала."""
+        self.assertEqual(
+            sqlite.pragma_statements(
+                {'journal_mode': 'wal', 'busy_timeout': 100}
+            ),
+            ['PRAGMA busy_timeout = 100', 'PRAGMA journal_mode = wal']
+        )
+
+    def test_atomic_takes_write_lock_immediately(self):
+        """Транзакция сразу занимает базу для записи."""
+        connections['tuned'] = self.open_connection()
+        self.addCleanup(connections.__delitem__, 'tuned')
+        other = sqlite3.connect(self.path, timeout=0)
+        self.addCleanup(other.close)
+        with transaction.atomic(using='tuned'):
+            with self.assertRaisesMessage(sqlite3.OperationalError, 'locked'):
+                other.execute('BEGIN IMMEDIATE')
+
+    def test_unknown_transaction_mode(self):
+        """Опечатка в transaction_mode видна при подключении."""
+        with self.assertRaises(ImproperlyConfigured):
+            self.open_connection(OPTIONS={'transaction_mode': 'LAZY'})
+
+
+class ReplicaRoutingTest(TransactionTestCase):
+    """Публичные страницы читают реплику, запись идет в основную базу.
+
+    Реплика - отдельный файл SQLite, который обновляется только явным
+    refresh_replica(): все, что записано после, видно лишь в default.
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        connections.settings['replica'] = {
+            **connections['default'].settings_dict,
+            'NAME': os.path.join(directory.name, 'replica.sqlite3'),
+        }
+        self.addCleanup(connections.settings.pop, 'replica')
+        self.addCleanup(connections.__delitem__, 'replica')
+        self.addCleanup(connections['replica'].close)
+        replicas = override_settings(DATABASE_REPLICAS=['replica'])
+        replicas.enable()
+        self.addCleanup(replicas.disable)
+
+        customer = Customer.objects.create(name='Ivan', phone='123')
+        self.appliance_type = ApplianceType.objects.create(
+            title='Fridge', slug='fridge', description='Холодильники'
+        )
+        self.order = RepairOrder.objects.create(
+            customer=customer,
+            appliance_type=self.appliance_type,
+            appliance_brand='Samsung',
+            description='Broken',
+        )
+        refresh_replica('replica')
+        # Справочники процесс держит в памяти и перечитывает из основной
+        # базы только при смене версии
+        references()
+
+    def queries(self, url):
+        """Число запросов страницы к основной базе и к реплике."""
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(primary), len(replica)
+
+    def test_public_reads_never_hit_primary(self):
+        """Публичные страницы и API не обращаются к основной базе."""
+        urls = (
+            reverse('repair:index'),
+            reverse('repair:order_detail',
+                    kwargs={'order_id': self.order.id}),
+            reverse('repair:appliance_type_orders',
+                    kwargs={'appliance_type_slug': 'fridge'}),
+            reverse('api:orders'),
+            reverse('api:appliance_types'),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                primary, replica = self.queries(url)
+                self.assertEqual(primary, 0)
+                self.assertGreater(replica, 0)
+
+        # Заказ, которого еще нет в реплике, на главной не виден
+        RepairOrder.objects.create(
+            customer=self.order.customer,
+            appliance_type=self.appliance_type,
+            appliance_brand='Bosch',
+            description='Noisy',
+        )
+        self.assertNotContains(self.client.get(reverse('repair:index')),
+                               'Bosch')
+        refresh_replica('replica')
+        self.assertContains(self.client.get(reverse('repair:index')),
+                            'Bosch')
+
+    def test_admin_uses_primary(self):
+        """Админка читает и пишет только основную базу."""
+        self.client.force_login(User.objects.create_superuser('admin'))
+        primary, replica = self.queries(
+            reverse('admin:repair_repairorder_changelist')
+        )
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+    def test_read_your_writes(self):
+        """После записи пользователь читает основную базу, пока не
+        истечет окно REPLICA_STICKY_SECONDS.
+        """
+        self.client.force_login(User.objects.create_superuser('admin'))
+        response = self.client.post(
+            reverse('admin:repair_customer_change',
+                    args=[self.order.customer_id]),
+            {'name': 'Иван Петров', 'phone': '123'}
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('primary_until', response.cookies)
+
+        url = reverse('repair:order_detail',
+                      kwargs={'order_id': self.order.id})
+        response = self.client.get(url)
+        self.assertEqual(response.context['order'].customer.name,
+                         'Иван Петров')
+        self.assertEqual(self.queries(url)[1], 0)
+
+        # Окно прошло: снова реплика, которая еще не догнала запись.
+        # Сессия и пользователь по-прежнему читаются из основной базы
+        self.client.cookies['primary_until'] = '0'
+        response = self.client.get(url)
+        self.assertEqual(response.context['order'].customer.name, 'Ivan')
+        self.assertGreater(self.queries(url)[1], 0)
+
+    def test_replicas_are_not_migrated(self):
+        """Миграции и запись никогда не направляются в реплику."""
+        self.assertFalse(router.allow_migrate('replica', 'repair'))
+        self.assertEqual(router.db_for_write(RepairOrder), 'default')
+        order = RepairOrder.objects.using('replica').get(pk=self.order.pk)
+        self.assertEqual(router.db_for_write(RepairOrder, instance=order),
+                         'default')
+
+
+class ReferenceCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        customer = Customer.objects.create(name='Ivan', phone='123')
+        cls.appliance_type = ApplianceType.objects.create(
+            title='Fridge', slug='fridge', description='Холодильники'
+        )
+        cls.workshop = Workshop.objects.create(
+            name='Main Shop', is_published=True
+        )
+        cls.status = RepairStatus.objects.create(name='In Progress')
+        RepairOrder.objects.create(
+            customer=customer,
+            appliance_type=cls.appliance_type,
+            workshop=cls.workshop,
+            status=cls.status,
+            appliance_brand='Samsung',
+            description='Broken',
+        )
+
+    def setUp(self):
+        self.urls = (
+            reverse('repair:index'),
+            reverse('repair:appliance_type_orders',
+                    kwargs={'appliance_type_slug': 'fridge'}),
+            reverse('repair:workshop_orders',
+                    kwargs={'workshop_id': self.workshop.id}),
+        )
+        # Снимок мог остаться от откатившейся транзакции другого теста
+        cache.clear()
+        references()
+
+    def test_lists_read_only_orders_and_customers(self):
+        """Списки не ищут справочник и не соединяют его с заказами."""
+        for url in self.urls:
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as context:
+                    response = self.client.get(url)
+                self.assertContains(response, 'In Progress')
+                self.assertContains(response, 'Main Shop')
+                self.assertEqual(len(context), 2)
+                page_sql = context.captured_queries[-1]['sql']
+                for table in ('repair_workshop', 'repair_repairstatus'):
+                    self.assertNotIn(table, page_sql)
+                for query in context.captured_queries:
+                    self.assertNotIn(
+                        'FROM "repair_appliancetype"', query['sql']
+                    )
+                    self.assertNotIn('FROM "repair_workshop"', query['sql'])
+
+    def test_admin_edit_visible_on_next_request(self):
+        """Правка справочника в админке видна уже следующему запросу."""
+        self.client.force_login(User.objects.create_superuser('admin'))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('admin:repair_appliancetype_change',
+                        args=[self.appliance_type.pk]),
+                {'title': 'Холодильник', 'slug': 'fridge',
+                 'description': 'Холодильники', 'is_published': 'on'}
+            )
+        self.assertEqual(response.status_code, 302)
+        response = self.client.get(self.urls[1])
+        self.assertEqual(response.context['appliance_type'].title,
+                         'Холодильник')
+        self.assertContains(self.client.get(self.urls[0]), 'Холодильник')
+
+    def test_hidden_and_unknown_references_return_404(self):
+        """Скрытый или неизвестный справочник дает 404."""
+        self.workshop.is_published = False
+        self.workshop.save()
+        response = self.client.get(self.urls[2])
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(
+            reverse('repair:appliance_type_orders',
+                    kwargs={'appliance_type_slug': 'oven'})
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_version_changes_again_after_commit(self):
+        """Версия меняется при сохранении и еще раз после коммита."""
+        before = references()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.status.delete()
+            during = references()
+        self.assertIsNot(during, before)
+        self.assertEqual(len(callbacks), 1)
+        self.assertIsNot(references(), during)
+        self.assertNotIn(self.status.pk, references().statuses)
+
+    def test_stale_worker_cards_use_old_version(self):
+        """Карточки, отрендеренные до смены версии, не читаются после."""
+        self.client.get(self.urls[0])
+        invalidate_references()
+        card_cache.stats.reset()
+        self.client.get(self.urls[0])
+        self.assertEqual(
+            (card_cache.stats.hits, card_cache.stats.misses), (0, 1)
+        )
+
+    def test_deploy_check_requires_shared_cache(self):
+        """Проверка check --deploy отклоняет кэш одного процесса."""
+        errors = checks.check_shared_cache(None)
+        self.assertEqual([error.id for error in errors], ['repair.E001'])
+        self.assertIn('tracking.py', errors[0].hint)
+        redis = {'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': 'redis://127.0.0.1:6379/0',
+        }}
+        with override_settings(CACHES=redis):
+            self.assertEqual(checks.check_shared_cache(None), [])
+
+
+class OrderCardProjectionTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        customer = Customer.objects.create(name='Ivan', phone='123')
+        cls.appliance_type = ApplianceType.objects.create(
+            title='Fridge', slug='fridge'
+        )
+        cls.long_description = ' '.join(
+            f'слово{number}' for number in range(1000)
+        )
+        cls.order = RepairOrder.objects.create(
+            customer=customer,
+            appliance_type=cls.appliance_type,
+            appliance_brand='Samsung',
+            description=cls.long_description,
+        )
+
+    def test_cards_do_not_load_full_description(self):
+        """Карточка получает обрезанное в SQL описание."""
+        order = RepairOrder.objects.cards().get(pk=self.order.pk)
+        self.assertIn('description', order.get_deferred_fields())
+        self.assertEqual(
+            order.description_preview,
+            self.long_description[:CARD_DESCRIPTION_CHARS]
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(order.customer.name, 'Ivan')
+
+    def test_list_pages_render_cards_without_extra_queries(self):
+        """Списки рендерят карточки без догрузки отложенных полей."""
+        cache.clear()
+        urls = (
+            reverse('repair:index'),
+            reverse('repair:appliance_type_orders',
+                    kwargs={'appliance_type_slug': 'fridge'}),
+            reverse('repair:search') + '?q=слово1',
+        )
+        references()
+        for url in urls:
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as context:
+                    response = self.client.get(url)
+                self.assertContains(response, 'слово14 …')
+                self.assertNotContains(response, 'слово15')
+                column = '"repair_repairorder"."description"'
+                for query in context.captured_queries:
+                    # Описание читается только внутри SUBSTR
+                    self.assertEqual(
+                        query['sql'].count(column),
+                        query['sql'].count(f'SUBSTR({column}')
+                    )
+
+
+class CustomerHistoryTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.create(
+            name='Ivan', phone='8 (999) 111-22-33'
+        )
+        other = Customer.objects.create(name='Petr', phone='+7 999 444 55 66')
+        appliance_type = ApplianceType.objects.create(
+            title='Fridge', slug='fridge'
+        )
+        created_at = timezone.now() - timezone.timedelta(days=30)
+        with explicit_timestamps(RepairOrder):
+            for number, days in enumerate((2, 4, None)):
+                completed_at = (
+                    created_at + timezone.timedelta(days=days)
+                    if days else None
+                )
+                RepairOrder.objects.create(
+                    customer=cls.customer,
+                    appliance_type=appliance_type,
+                    appliance_brand=f'Brand{number}',
+                    description='Не включается',
+                    final_cost=Decimal('1000.50') if days else None,
+                    created_at=created_at,
+                    updated_at=created_at,
+                    completed_at=completed_at,
+                    # Сотрудник видит и скрытые с сайта заказы
+                    is_published=number != 1,
+                )
+            RepairOrder.objects.create(
+                customer=other,
+                appliance_type=appliance_type,
+                appliance_brand='Other',
+                description='Чужой заказ',
+                final_cost=Decimal('99999'),
+                created_at=created_at,
+                updated_at=created_at,
+            )
+        cls.staff = User.objects.create_user('manager', is_staff=True)
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+        references()
+
+    def test_phone_normalized_on_save(self):
+        """Нормализованный телефон заполняется и при частичном save()."""
+        self.assertEqual(self.customer.phone_normalized, '79991112233')
+        self.customer.phone = '+7 (999) 000-00-00'
+        self.customer.save(update_fields=['phone'])
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.phone_normalized, '79990000000')
+
+    def test_customer_pages_are_staff_only(self):
+        """Страницы клиентов закрыты для посетителей сайта."""
+        self.client.logout()
+        for url in (
+            reverse('repair:customer_lookup'),
+            self.customer.get_absolute_url(),
+        ):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 302)
+                self.assertIn('login', response['Location'])
+
+    def test_lookup_redirects_to_single_customer(self):
+        """Номер в любой записи находит клиента по индексу."""
+        response = self.client.get(
+            reverse('repair:customer_lookup'), {'phone': '+7 999 111-22-33'}
+        )
+        self.assertRedirects(response, self.customer.get_absolute_url())
+        plan = str(Customer.objects.filter(
+            phone_normalized='79991112233'
+        ).explain())
+        self.assertIn('USING INDEX', plan)
+
+    def test_lookup_lists_customers_with_same_phone(self):
+        """Несколько клиентов с одним номером выводятся списком."""
+        namesake = Customer.objects.create(name='Anna', phone='9991112233')
+        response = self.client.get(
+            reverse('repair:customer_lookup'), {'phone': '89991112233'}
+        )
+        self.assertContains(response, self.customer.get_absolute_url())
+        self.assertContains(response, namesake.get_absolute_url())
+        response = self.client.get(
+            reverse('repair:customer_lookup'), {'phone': '000'}
+        )
+        self.assertContains(response, 'Клиентов с таким телефоном нет')
+
+    def test_detail_shows_orders_and_totals(self):
+        """История клиента: все его заказы и итоги одним запросом."""
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.customer.get_absolute_url())
+        brands = [
+            order.appliance_brand for order in response.context['order_list']
+        ]
+        self.assertEqual(brands, ['Brand2', 'Brand1', 'Brand0'])
+        self.assertNotContains(response, 'Other')
+        totals = response.context['totals']
+        self.assertEqual(totals['total_orders'], 3)
+        self.assertEqual(totals['total_cost'], Decimal('2001.00'))
+        self.assertEqual(
+            totals['average_turnaround'], timezone.timedelta(days=3)
+        )
+        self.assertEqual(response.context['turnaround_days'], 3)
+        aggregates = [
+            query['sql'] for query in context.captured_queries
+            if 'COUNT(' in query['sql'] and 'SUM(' in query['sql']
+        ]
+        self.assertEqual(len(aggregates), 1)
+
+    def test_detail_uses_cursor_pagination(self):
+        """Страницы истории переключаются курсором по индексу клиента."""
+        RepairOrder.objects.bulk_create(
+            RepairOrder(
+                customer=self.customer, appliance_brand=f'Extra{number}',
+                description='Не включается'
+            )
+            for number in range(ORDERS_PER_PAGE)
+        )
+        url = self.customer.get_absolute_url()
+        first = self.client.get(url).context['page_obj']
+        self.assertTrue(first.has_next)
+        second = self.client.get(url, {'cursor': first.next_cursor})
+        self.assertEqual(len(second.context['order_list']), 3)
+        self.assertEqual(second.context['totals']['total_orders'], 13)
+        self.assertEqual(
+            self.client.get(url, {'cursor': 'broken'}).status_code, 404
+        )
+        plan = str(
+            self.customer.orders.cards()
+            .order_by('-created_at', '-pk')[:ORDERS_PER_PAGE + 1].explain()
+        )
+        self.assertIn('order_customer_created_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_admin_search_by_full_phone(self):
+        """Полный номер в поиске админки сравнивается по индексу."""
+        self.client.force_login(User.objects.create_superuser('admin'))
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(
+                reverse('admin:repair_customer_changelist'),
+                {'q': '8-999-111-22-33'}
+            )
+        self.assertContains(response, 'Ivan')
+        self.assertNotContains(response, 'Petr')
+        self.assertFalse(any(
+            'LIKE' in query['sql'] for query in context.captured_queries
+        ))
+
+
+class ResponseCompressionTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        customer = Customer.objects.create(name='Ivan', phone='123')
+        appliance_type = ApplianceType.objects.create(
+            title='Fridge', slug='fridge'
+        )
+        RepairOrder.objects.bulk_create(
+            RepairOrder(
+                customer=customer,
+                appliance_type=appliance_type,
+                appliance_brand=f'Brand{number}',
+                description='Не морозит, шумит компрессор',
+            )
+            for number in range(ORDERS_PER_PAGE)
+        )
+        cls.staff = User.objects.create_user('manager', is_staff=True)
+
+    def test_large_page_is_gzipped(self):
+        """Страница сжимается, ETag становится слабым и дает 304."""
+        plain = self.client.get(reverse('repair:index'))
+        response = self.client.get(
+            reverse('repair:index'), HTTP_ACCEPT_ENCODING='gzip, br'
+        )
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertLess(len(response.content), len(plain.content) / 2)
+        self.assertEqual(response['ETag'], 'W/' + plain['ETag'])
+        response = self.client.get(
+            reverse('repair:index'), HTTP_ACCEPT_ENCODING='gzip',
+            HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_random_padding(self):
+        """Длина сжатого ответа случайна: защита от BREACH."""
+        self.client.force_login(self.staff)
+        urls = [reverse('repair:index'), reverse('repair:export_orders')]
+        for url in urls:
+            with self.subTest(url=url):
+                bodies = set()
+                for _ in range(10):
+                    response = self.client.get(
+                        url, HTTP_ACCEPT_ENCODING='gzip'
+                    )
+                    body = b''.join(response) if response.streaming else (
+                        response.content
+                    )
+                    self.assertEqual(body[3], gzip.FNAME)
+                    bodies.add(len(body))
+                self.assertGreater(len(bodies), 1)
+
+    def test_skips_small_and_unaccepted(self):
+        """Маленькие ответы и клиенты без gzip получают тело как есть."""
+        response = self.client.get(
+            reverse('api:order_detail', kwargs={'order_id': 0}),
+            HTTP_ACCEPT_ENCODING='gzip'
+        )
+        self.assertFalse(response.has_header('Content-Encoding'))
+        for encoding in ('', 'br', 'gzip;q=0, br'):
+            with self.subTest(encoding=encoding):
+                response = self.client.get(
+                    reverse('repair:index'), HTTP_ACCEPT_ENCODING=encoding
+                )
+                self.assertFalse(response.has_header('Content-Encoding'))
+                self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_streaming_export(self):
+        """Поток сжимается по кускам, уже сжатая выгрузка - нет."""
+        self.client.force_login(self.staff)
+        url = reverse('repair:export_orders')
+        plain = b''.join(self.client.get(url).streaming_content)
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(
+            gzip.decompress(b''.join(response.streaming_content)), plain
+        )
+        response = self.client.get(
+            url, {'gzip': 'on'}, HTTP_ACCEPT_ENCODING='gzip'
+        )
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(
+            gzip.decompress(b''.join(response.streaming_content)), plain
+        )
+
+
+class CompressedStaticFilesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        directory = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(directory.cleanup)
+        cls.static_root = directory.name
+        storages = {
+            'default': {
+                'BACKEND': 'django.core.files.storage.FileSystemStorage',
+            },
+            'staticfiles': {
+                'BACKEND': 'repair_shop.repair.staticfiles.'
+                           'CompressedManifestStaticFilesStorage',
+            },
+        }
+        overrides = override_settings(
+            STATIC_ROOT=cls.static_root, STORAGES=storages
+        )
+        overrides.enable()
+        cls.addClassCleanup(overrides.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+        manifest_path = os.path.join(cls.static_root, 'staticfiles.json')
+        with open(manifest_path) as file:
+            cls.manifest = json.load(file)['paths']
+
+    def read(self, name):
+        with open(os.path.join(self.static_root, name), 'rb') as file:
+            return file.read()
+
+    def test_collectstatic_writes_hashed_and_compressed(self):
+        """Хэшированный CSS получает сжатую копию, картинка - нет."""
+        css = self.manifest['css/bootstrap.min.css']
+        self.assertRegex(css, r'^css/bootstrap\.min\.[0-9a-f]{12}\.css$')
+        self.assertEqual(
+            gzip.decompress(self.read(css + '.gz')), self.read(css)
+        )
+        logo = self.manifest['img/logo.png']
+        self.assertFalse(
+            os.path.exists(os.path.join(self.static_root, logo + '.gz'))
+        )
+        self.assertIn(f'/static/{css}', self.client.get('/').content.decode())
+
+    def test_serve_precompressed_with_far_future_cache(self):
+        """Сжатая копия отдается по Accept-Encoding без сжатия на лету."""
+        css = self.manifest['css/bootstrap.min.css']
+        response = self.client.get(
+            f'/static/{css}', HTTP_ACCEPT_ENCODING='gzip'
+        )
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertEqual(response['Cache-Control'], IMMUTABLE)
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(
+            b''.join(response.streaming_content), self.read(css + '.gz')
+        )
+        response = self.client.get(f'/static/{css}')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(response.streaming_content), self.read(css))
+        response = self.client.get('/static/css/bootstrap.min.css')
+        self.assertEqual(response['Cache-Control'], SHORT_CACHE)
+        self.assertEqual(
+            self.client.get('/static/../manage.py').status_code, 404
+        )
+
+
+class MetricsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        customer = Customer.objects.create(name='Ivan', phone='123')
+        appliance_type = ApplianceType.objects.create(
+            title='Fridge', slug='fridge'
+        )
+        cls.status = RepairStatus.objects.create(name='В работе', order=1)
+        for completed_at in (None, None, timezone.now()):
+            RepairOrder.objects.create(
+                customer=customer,
+                appliance_type=appliance_type,
+                appliance_brand='Atlant',
+                description='Не морозит',
+                status=cls.status,
+                completed_at=completed_at,
+            )
+
+    def setUp(self):
+        metrics.registry.reset()
+        cache.clear()
+
+    def scrape(self, **extra):
+        response = self.client.get(reverse('metrics'), **extra)
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_views_queries_caches_and_open_orders(self):
+        """Метрики страниц, SQL, кэшей и гейдж открытых заказов."""
+        self.client.get(reverse('repair:index'))
+        self.client.get(reverse('repair:index'))
+        self.client.get(reverse('pages:about'))
+        self.client.get(reverse('api:orders'))
+        text = self.scrape()
+        self.assertIn(
+            'repairshop_http_requests_total{view="repair:index",'
+            'method="GET",status="200"} 2', text
+        )
+        self.assertIn(
+            'repairshop_http_request_duration_seconds_count'
+            '{view="pages:about"} 1', text
+        )
+        self.assertNotIn('api:', text)
+        self.assertIn(
+            'repairshop_db_queries_per_request_bucket'
+            '{view="pages:about",le="0.0"} 1', text
+        )
+        self.assertIn(
+            'repairshop_cache_requests_total'
+            '{cache="order_cards",result="hit"} 3', text
+        )
+        self.assertIn(
+            'repairshop_cache_requests_total'
+            '{cache="order_cards",result="miss"} 3', text
+        )
+        self.assertIn('repairshop_open_orders{status="В работе"} 2', text)
+        self.assertIn('# TYPE repairshop_open_orders gauge', text)
+
+    def test_access(self):
+        """Метрики видят localhost и сотрудники, остальные - нет."""
+        url = reverse('metrics')
+        remote = {'REMOTE_ADDR': '203.0.113.5'}
+        self.assertEqual(self.client.get(url, **remote).status_code, 403)
+        self.client.force_login(
+            User.objects.create_user('manager', is_staff=True)
+        )
+        self.assertEqual(self.client.get(url, **remote).status_code, 200)
+
+    def test_histogram_from_threads(self):
+        """Значения потоков суммируются, корзины накопительные."""
+        histogram = metrics.Histogram(
+            'test_seconds', 'Тест', ('view',), buckets=(0.1, 1)
+        )
+
+        def observe():
+            for value in (0.05, 0.5, 5):
+                histogram.observe(value, view='a')
+
+        threads = [threading.Thread(target=observe) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        samples = dict(histogram.samples(histogram.values()))
+        self.assertEqual(samples['test_seconds_bucket{view="a",le="0.1"}'], 4)
+        self.assertEqual(samples['test_seconds_bucket{view="a",le="1.0"}'], 8)
+        self.assertEqual(
+            samples['test_seconds_bucket{view="a",le="+Inf"}'], 12
+        )
+        self.assertEqual(samples['test_seconds_count{view="a"}'], 12)
+        self.assertAlmostEqual(samples['test_seconds_sum{view="a"}'], 22.2)
+
+    def test_finished_threads_are_folded(self):
+        """Словари завершенных потоков сливаются в один, значения целы."""
+        counter = metrics.Counter('test_total', 'Тест', ('view',))
+        counter.inc(view='main')
+
+        def increment():
+            counter.inc(2, view='a')
+
+        for _ in range(3):
+            threads = [threading.Thread(target=increment) for _ in range(5)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        gc.collect()
+        self.assertEqual(counter.values(), {('main',): 1, ('a',): 30})
+        # Общий словарь завершенных потоков и словарь этого потока
+        self.assertEqual(len(counter._shards), 2)
+        counter.inc(view='a')
+        self.assertEqual(counter.values()[('a',)], 31)
+
+    def test_multiprocess_directory(self):
+        """Файлы других процессов складываются со значениями текущего."""
+        with tempfile.TemporaryDirectory() as directory:
+            config = {
+                **settings.METRICS,
+                'MULTIPROCESS_DIR': directory,
+                'FLUSH_INTERVAL': 0,
+            }
+            with override_settings(METRICS=config):
+                self.client.get(reverse('pages:about'))
+                own = metrics.process_file(directory)
+                self.assertTrue(own.exists())
+                other = {
+                    'repairshop_http_requests_total': [
+                        [['pages:about', 'GET', '200'], 4]
+                    ],
+                }
+                with open(os.path.join(directory, 'other.json'), 'w') as f:
+                    json.dump(other, f)
+                text = self.scrape()
+        self.assertIn(
+            'repairshop_http_requests_total{view="pages:about",'
+            'method="GET",status="200"} 5', text
+        )
+
+
+class WarmCacheCommandTest(TransactionTestCase):
+    def setUp(self):
+        customer = Customer.objects.create(name='Ivan', phone='123')
+        self.appliance_type = ApplianceType.objects.create(
+            title='Fridge', slug='fridge'
+        )
+        ApplianceType.objects.create(
+            title='Hidden', slug='hidden', is_published=False
+        )
+        self.workshop = Workshop.objects.create(name='Центр')
+        self.orders = [
+            RepairOrder.objects.create(
+                customer=customer,
+                appliance_type=self.appliance_type,
+                workshop=self.workshop,
+                appliance_brand='Atlant',
+                description='Не морозит',
+            )
+            for _ in range(3)
+        ]
+        cache.clear()
+
+    def test_warms_lists_and_recent_orders(self):
+        """Прогреваются списки и последние заказы, карточки в кэше."""
+        output = StringIO()
+        call_command(
+            'warm_cache', orders=2, workers=2, stdout=output,
+            stderr=StringIO()
+        )
+        text = output.getvalue()
+        order_urls = [
+            reverse('repair:order_detail', kwargs={'order_id': order.pk})
+            for order in self.orders
+        ]
+        for url in (
+            reverse('repair:index'),
+            reverse('repair:appliance_type_orders',
+                    kwargs={'appliance_type_slug': 'fridge'}),
+            reverse('repair:workshop_orders',
+                    kwargs={'workshop_id': self.workshop.pk}),
+            order_urls[2],
+            order_urls[1],
+        ):
+            self.assertIn(f'  {url}\n', text)
+        self.assertNotIn('hidden', text)
+        self.assertNotIn(f'  {order_urls[0]}\n', text)
+        self.assertIn('Прогрето 5 из 5 страниц', text)
+        order = self.orders[0]
+        self.assertIsNotNone(
+            cache.get(card_cache.card_cache_key(order.pk, order.updated_at))
+        )
+
+    def test_budget(self):
+        """Страницы, не успевшие за отведенное время, пропускаются."""
+        output = StringIO()
+        call_command(
+            'warm_cache', budget=0, stdout=output, stderr=StringIO()
+        )
+        self.assertIn('Прогрето 0 из 6 страниц', output.getvalue())
+        self.assertIn('не успели: 6', output.getvalue())
+
+
+class SnapshotTest(TestCase):
+    def setUp(self):
+        self.master = User.objects.create_user('master', password='pass')
+        User.objects.create_user('admin', is_staff=True)
+        customer = Customer.objects.create(
+            name='Ivan', phone='+7 (999) 123-45-67'
+        )
+        appliance_type = ApplianceType.objects.create(
+            title='Fridge', slug='fridge'
+        )
+        done = RepairStatus.objects.create(name='Выдан', order=1)
+        self.order = RepairOrder.objects.create(
+            customer=customer,
+            appliance_type=appliance_type,
+            workshop=Workshop.objects.create(name='Центр'),
+            master=self.master,
+            status=done,
+            appliance_brand='Atlant',
+            description='Не морозит морозилка',
+            final_cost=Decimal('1500.00'),
+            completed_at=timezone.now(),
+        )
+
+    def dump(self):
+        output = StringIO()
+        snapshot.dump(output)
+        return output.getvalue()
+
+    def test_round_trip(self):
+        """Снимок восстанавливает данные вместе с индексом и статистикой."""
+        text = self.dump()
+        self.assertNotIn('"admin"', text)
+        before = RepairOrder.objects.values().get()
+        RepairOrder.objects.all().delete()
+        Customer.objects.all().delete()
+        master_id = self.master.pk
+        self.master.delete()
+
+        counts = snapshot.load(StringIO(text))
+        self.assertEqual(counts[RepairOrder], 1)
+        self.assertEqual(counts[User], 1)
+        self.assertEqual(RepairOrder.objects.values().get(), before)
+        self.assertTrue(
+            User.objects.get(pk=master_id).check_password('pass')
+        )
+        self.assertEqual(
+            Customer.objects.get().phone_normalized, '79991234567'
+        )
+        self.assertEqual(
+            search.search_order_ids('морозилка', 10), [self.order.pk]
+        )
+        self.assertEqual(
+            OrderStats.objects.get().revenue, Decimal('1500.00')
+        )
+
+    def test_reload_overwrites(self):
+        """Повторная загрузка перезаписывает строки, а не дублирует."""
+        text = self.dump()
+        RepairOrder.objects.update(appliance_brand='Bosch')
+        snapshot.load(StringIO(text), batch_size=1)
+        self.assertEqual(RepairOrder.objects.get().appliance_brand, 'Atlant')
+        self.assertEqual(Customer.objects.count(), 1)
+
+    def test_dependency_order(self):
+        """Команда отклоняет снимок, где заказ идет раньше клиента."""
+        lines = self.dump().splitlines()
+        lines.append(lines.pop(-2))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'repair.jsonl')
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write('\n'.join(lines))
+            with self.assertRaisesMessage(CommandError, 'порядке'):
+                call_command('load_repair', path, stdout=StringIO())
+
+    def test_foreign_users_are_rejected(self):
+        """Мастер снимка не перезаписывает другого пользователя."""
+        text = self.dump()
+        self.master.username = 'renamed'
+        self.master.save()
+        with self.assertRaisesMessage(snapshot.SnapshotError, 'renamed'):
+            snapshot.load(StringIO(text))
+        self.master.refresh_from_db()
+        self.assertTrue(self.master.check_password('pass'))
+
+        # То же имя под другим id
+        self.master.delete()
+        User.objects.create_user('master', password='other')
+        with self.assertRaisesMessage(snapshot.SnapshotError, 'master'):
+            snapshot.load(StringIO(text))
+        self.assertTrue(
+            User.objects.get(username='master').check_password('other')
+        )
+
+
+class SnapshotDumpTransactionTest(TransactionTestCase):
+    def test_dump_does_not_take_write_lock(self):
+        """Выгрузка читает в BEGIN DEFERRED, а не в BEGIN IMMEDIATE."""
+        RepairStatus.objects.create(name='Принят', order=1)
+        output = StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            counts = snapshot.dump(output)
+        self.assertEqual(counts[RepairStatus], 1)
+        statements = [query['sql'] for query in queries]
+        self.assertEqual(statements[0], 'BEGIN DEFERRED')
+        self.assertNotIn('BEGIN IMMEDIATE', statements)
+        self.assertFalse(connection.connection.in_transaction)
+
+
+class FailingSMSBackend:
+    def send_messages(self, notifications):
+        raise ConnectionError('шлюз недоступен')
+
+
+@override_settings(NOTIFICATIONS={
+    **settings.NOTIFICATIONS,
+    'BACKENDS': {
+        'email': 'repair_shop.repair.notifications.EmailBackend',
+        'sms': 'repair_shop.repair.notifications.MemorySMSBackend',
+    },
+})
+class OutboxTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.create(
+            name='Ivan', phone='8 (999) 123-45-67'
+        )
+        cls.appliance_type = ApplianceType.objects.create(
+            title='Fridge', slug='fridge'
+        )
+        cls.in_work = RepairStatus.objects.create(name='В работе', order=1)
+        cls.ready = RepairStatus.objects.create(name='Готов', order=2)
+
+    def setUp(self):
+        notifications.MemorySMSBackend.outbox.clear()
+        self.order = RepairOrder.objects.create(
+            customer=self.customer,
+            appliance_type=self.appliance_type,
+            appliance_brand='Atlant',
+            description='Не морозит',
+            status=self.in_work,
+        )
+
+    def make_ready(self):
+        order = RepairOrder.objects.get(pk=self.order.pk)
+        order.status = self.ready
+        order.save()
+        return order
+
+    def test_ready_status_enqueues_once(self):
+        """Переход в «Готов» ставит одно SMS, откат транзакции - ни одного."""
+        self.assertFalse(Notification.objects.exists())
+        try:
+            with transaction.atomic():
+                self.make_ready()
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertFalse(Notification.objects.exists())
+
+        order = self.make_ready()
+        key = notifications.notification_key(order)
+        order.appliance_model = 'MX-1'
+        order.save()
+        self.assertEqual(Notification.objects.get().key, key)
+
+        self.assertEqual(notifications.process_batch('w', 10), (1, 0))
+        self.assertEqual(list(notifications.MemorySMSBackend.outbox), [key])
+        notification = Notification.objects.get()
+        self.assertEqual(notification.channel, Notification.SMS)
+        self.assertEqual(notification.recipient, '79991234567')
+        self.assertIn(f'№{order.pk}', notification.body)
+
+    def test_worker_sends_email_with_key(self):
+        """Воркер отправляет письмо с ключом в Message-ID и отмечает его."""
+        Customer.objects.filter(pk=self.customer.pk).update(
+            email='ivan@example.com'
+        )
+        self.make_ready()
+        output = StringIO()
+        call_command('run_outbox_worker', once=True, stdout=output)
+        self.assertIn('Отправлено 1', output.getvalue())
+        notification = Notification.objects.get()
+        self.assertEqual(notification.state, Notification.SENT)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['ivan@example.com'])
+        self.assertIn(notification.key, mail.outbox[0].extra_headers[
+            'Message-ID'
+        ])
+
+    def test_retry_with_backoff(self):
+        """Ошибка шлюза откладывает отправку, после лимита - отказ."""
+        self.make_ready()
+        failing = {
+            **settings.NOTIFICATIONS,
+            'BACKENDS': {'sms': 'repair_shop.repair.tests.FailingSMSBackend'},
+            'MAX_ATTEMPTS': 2,
+        }
+        with override_settings(NOTIFICATIONS=failing):
+            before = timezone.now()
+            self.assertEqual(notifications.process_batch('w', 10), (0, 1))
+            notification = Notification.objects.get()
+            self.assertEqual(notification.attempts, 1)
+            self.assertIn('шлюз недоступен', notification.last_error)
+            self.assertGreaterEqual(
+                (notification.available_at - before).total_seconds(),
+                settings.NOTIFICATIONS['RETRY_DELAY'] / 2
+            )
+            # Пока пауза не прошла, воркер уведомление не берет
+            self.assertEqual(notifications.process_batch('w', 10), (0, 0))
+            Notification.objects.update(available_at=timezone.now())
+            notifications.process_batch('w', 10)
+        notification.refresh_from_db()
+        self.assertEqual(notification.state, Notification.FAILED)
+        self.assertEqual(notification.attempts, 2)
+
+    def test_claim_lease(self):
+        """Занятые строки другой воркер получает только после аренды."""
+        self.make_ready()
+        self.assertEqual(len(notifications.claim('first', 10)), 1)
+        self.assertEqual(notifications.claim('second', 10), [])
+        Notification.objects.update(claimed_until=timezone.now())
+        self.assertEqual(len(notifications.claim('second', 10)), 1)
+        self.assertEqual(Notification.objects.get().claimed_by, 'second')
+
+    def test_admin_changelist_queries_do_not_depend_on_rows(self):
+        """Уведомления в админке загружают заказы с клиентами сразу."""
+        url = reverse('admin:repair_notification_changelist')
+        self.client.force_login(User.objects.create_superuser('admin'))
+        self.make_ready()
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(url)
+        for number in range(3):
+            customer = Customer.objects.create(
+                name=f'Клиент {number}', phone=f'8999000000{number}'
+            )
+            self.order = RepairOrder.objects.create(
+                customer=customer, appliance_brand='Atlant',
+                description='Не морозит', status=self.in_work
+            )
+            self.make_ready()
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(url)
+        self.assertEqual(len(response.context['cl'].result_list), 4)
+        self.assertEqual(len(many), len(few))
+
+
+class TrackingPageTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.create(
+            name='Ivan Petrov', phone='+79991234567'
+        )
+        cls.workshop = Workshop.objects.create(name='Main Shop')
+        cls.in_work = RepairStatus.objects.create(name='В работе', order=1)
+        cls.ready = RepairStatus.objects.create(name='Готов', order=2)
+        cls.order = RepairOrder.objects.create(
+            customer=cls.customer,
+            workshop=cls.workshop,
+            status=cls.in_work,
+            appliance_brand='Atlant',
+            description='Не морозит',
+            estimated_cost=Decimal('1500.00'),
+            is_published=False,
+        )
+
+    def setUp(self):
+        cache.clear()
+        references()
+        self.url = self.order.get_tracking_url()
+
+    def test_page_shows_status_without_customer(self):
+        """Страница показывает статус и стоимость, но не данные клиента."""
+        response = self.client.get(self.url)
+        self.assertContains(response, 'В работе')
+        self.assertContains(response, 'Main Shop')
+        self.assertContains(response, '1500')
+        self.assertNotContains(response, 'Ivan Petrov')
+        self.assertNotContains(response, '9991234567')
+        self.assertNotContains(response, 'Не морозит')
+        response = self.client.get(
+            reverse('repair:track_order', args=['UNKNOWN123'])
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_cached_page_needs_no_queries(self):
+        """Повторный запрос, в том числе с кодом строчными, идет из кэша."""
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(self.url)
+        self.assertEqual(len(context), 1)
+        self.assertIn('"tracking_code" =', context.captured_queries[0]['sql'])
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                reverse('repair:track_order',
+                        args=[self.order.tracking_code.lower()])
+            )
+        self.assertContains(response, 'В работе')
+
+    def test_order_save_drops_cached_page(self):
+        """Смена статуса видна на странице сразу и после коммита."""
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            order = RepairOrder.objects.get(pk=self.order.pk)
+            order.status = self.ready
+            order.save()
+        self.assertContains(self.client.get(self.url), 'Готов')
+
+        order.delete()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_reference_edit_changes_page(self):
+        """Переименование статуса меняет ключ кэша страницы."""
+        self.client.get(self.url)
+        self.in_work.name = 'Диагностика'
+        self.in_work.save()
+        self.assertContains(self.client.get(self.url), 'Диагностика')
+
+    def test_staff_gets_own_variant(self):
+        """Сотрудник не получает страницу из кэша клиента и наоборот."""
+        self.client.get(self.url)
+        staff = Client()
+        staff.force_login(
+            User.objects.create_user('master', is_staff=True)
+        )
+        self.assertContains(staff.get(self.url), 'Статистика')
+        self.assertNotContains(self.client.get(self.url), 'Статистика')
+
+    def test_codes_are_unique_and_unambiguous(self):
+        """Коды разные и без символов, которые легко перепутать."""
+        orders = RepairOrder.objects.bulk_create([
+            RepairOrder(customer=self.customer, appliance_brand='LG',
+                        description='-')
+            for _ in range(50)
+        ])
+        codes = {order.tracking_code for order in orders}
+        self.assertEqual(len(codes), 50)
+        for code in codes:
+            self.assertEqual(len(code), 10)
+            self.assertTrue(set(code) <= set(TRACKING_ALPHABET))
+            self.assertFalse(set(code) & set('01OIL'))
+
+
+class StatusLogTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.accepted = RepairStatus.objects.create(name='Принят', order=1)
+        cls.in_work = RepairStatus.objects.create(name='В работе', order=2)
+        cls.ready = RepairStatus.objects.create(name='Готов', order=3)
+        cls.workshop = Workshop.objects.create(name='Центральная')
+        cls.master = User.objects.create_user(
+            'master', first_name='Петр', is_staff=True
+        )
+        cls.customer = Customer.objects.create(name='Клиент', phone='1')
+
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser('admin')
+
+    def create_order(self, **kwargs):
+        fields = {
+            'customer': self.customer,
+            'appliance_brand': 'Atlant',
+            'description': 'Не морозит',
+            'workshop': self.workshop,
+            'master': self.master,
+            'status': self.accepted,
+        }
+        return RepairOrder.objects.create(**{**fields, **kwargs})
+
+    def age_events(self, hours):
+        StatusEvent.objects.update(
+            created_at=F('created_at') - timedelta(hours=hours)
+        )
+
+    def assert_durations_consistent(self):
+        self.assertEqual(
+            stats.stats_drift(
+                status_log.current_durations(),
+                status_log.expected_durations()
+            ),
+            []
+        )
+
+    def test_save_logs_status_changes(self):
+        """Каждая смена статуса пишется в журнал со временем в прежнем."""
+        order = self.create_order()
+        event = StatusEvent.objects.get()
+        self.assertEqual(
+            (event.previous_status, event.status, event.previous_duration),
+            (None, self.accepted, None)
+        )
+        order.appliance_model = 'MX-1'
+        order.save()
+        self.assertEqual(StatusEvent.objects.count(), 1)
+
+        self.age_events(5)
+        order = RepairOrder.objects.only('status').get(pk=order.pk)
+        order.status = self.in_work
+        order.save()
+        event = StatusEvent.objects.latest('created_at')
+        self.assertEqual(event.previous_status, self.accepted)
+        self.assertEqual(event.previous_duration, timedelta(hours=5))
+        self.assertEqual(event.workshop, self.workshop)
+        row = StatusDurationStats.objects.get()
+        self.assertEqual(
+            (row.status, row.workshop, row.master, row.transitions,
+             row.seconds),
+            (self.accepted, self.workshop, self.master, 1, 5 * 3600)
+        )
+        self.assert_durations_consistent()
+
+    def test_admin_bulk_action_logs_and_invalidates(self):
+        """Массовая смена статуса в админке ведет себя как save()."""
+        orders = [self.create_order(), self.create_order(status=None)]
+        self.create_order(status=self.ready)
+        self.age_events(2)
+        tracking_url = orders[0].get_tracking_url()
+        self.client.get(tracking_url)
+        self.client.force_login(self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('admin:repair_repairorder_changelist'),
+                {
+                    'action': f'set_status_{self.ready.pk}',
+                    '_selected_action': [
+                        order.pk for order in RepairOrder.objects.all()
+                    ],
+                },
+                follow=True
+            )
+        self.assertContains(response, 'Заказов переведено в «Готов»: 2')
+        self.assertEqual(
+            RepairOrder.objects.filter(status=self.ready).count(), 3
+        )
+        events = StatusEvent.objects.filter(
+            status=self.ready, order__in=orders
+        )
+        self.assertEqual(
+            set(events.values_list('order_id', 'previous_status_id')),
+            {(orders[0].pk, self.accepted.pk), (orders[1].pk, None)}
+        )
+        self.assertEqual(
+            StatusDurationStats.objects.get(status=self.accepted).seconds,
+            2 * 3600
+        )
+        self.assertEqual(
+            Notification.objects.filter(order__in=orders).count(), 2
+        )
+        self.assert_durations_consistent()
+        self.assertEqual(
+            stats.stats_drift(stats.current_stats(), stats.expected_stats()),
+            []
+        )
+        self.client.logout()
+        self.assertContains(self.client.get(tracking_url), 'Готов')
+
+    def test_report_reads_only_aggregates(self):
+        """Отчет доступен сотрудникам и не читает заказы и журнал."""
+        order = self.create_order()
+        self.age_events(3)
+        order.status = self.in_work
+        order.save()
+        url = reverse('repair:turnaround')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(self.admin)
+        for group, label in (
+            ('workshop', 'Центральная'), ('master', 'Петр'),
+            ('appliance_type', 'не указано'),
+        ):
+            with self.subTest(group=group):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url, {'by': group})
+                self.assertContains(response, label)
+                self.assertContains(response, '3,0 ч')
+                for query in queries:
+                    self.assertNotIn('repair_repairorder', query['sql'])
+                    self.assertNotIn('repair_statusevent', query['sql'])
+
+    def test_deleted_references_and_reconcile(self):
+        """Удаление мастерской и мастера и пересборка сохраняют итоги."""
+        order = self.create_order()
+        self.age_events(1)
+        order.status = self.in_work
+        order.save()
+        self.workshop.delete()
+        self.master.delete()
+        self.assert_durations_consistent()
+        row = StatusDurationStats.objects.get()
+        self.assertEqual((row.workshop, row.master), (None, None))
+
+        StatusDurationStats.objects.update(seconds=1)
+        with self.assertRaises(CommandError):
+            call_command(
+                'reconcile_order_stats', check=True, stdout=StringIO()
+            )
+        output = StringIO()
+        call_command('reconcile_order_stats', stdout=output)
+        self.assertIn('Время в статусах: расхождений 1', output.getvalue())
+        self.assertEqual(StatusDurationStats.objects.get().seconds, 3600)
+
+    def test_admin_changelist_queries_do_not_depend_on_rows(self):
+        """Журнал в админке загружает заказы с клиентами одним запросом."""
+        url = reverse('admin:repair_statusevent_changelist')
+        self.client.force_login(self.admin)
+        self.create_order()
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(url)
+        for number in range(3):
+            self.create_order(customer=Customer.objects.create(
+                name=f'Клиент {number}', phone=str(number + 2)
+            ))
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(url)
+        self.assertEqual(len(response.context['cl'].result_list), 4)
+        self.assertEqual(len(many), len(few))
+
+
+def bench_report(p95_ms, queries, scale='1000', view='repair:index'):
+    return {'results': {scale: {view: {
+        'p95_ms': p95_ms, 'queries': queries
+    }}}}
+
+
+class BenchViewsCompareTest(TestCase):
+    def compare(self, baseline, report, threshold=0.2, min_delta_ms=0.5):
+        return BenchViewsCommand().compare(
+            baseline, report, threshold, min_delta_ms
+        )
+
+    def test_percentile(self):
+        """Перцентиль по ближайшему рангу, порядок значений не важен."""
+        values = [5, 1, 4, 2, 3]
+        self.assertEqual(percentile(values, 0), 1)
+        self.assertEqual(percentile(values, 50), 3)
+        self.assertEqual(percentile(values, 100), 5)
+        self.assertEqual(percentile(range(1, 101), 95), 95)
+        self.assertEqual(percentile([7], 99), 7)
+
+    def test_threshold_and_min_delta(self):
+        """Регрессия - рост p95 и больше порога, и больше min_delta_ms."""
+        baseline = bench_report(10.0, 2)
+        self.assertEqual(self.compare(baseline, bench_report(12.0, 2)), [])
+        regressions = self.compare(baseline, bench_report(12.1, 2))
+        self.assertEqual(len(regressions), 1)
+        self.assertIn('repair:index: p95 10.0 → 12.1 мс', regressions[0])
+        # На быстрой странице +50% - это 0,1 мс, в пределах шума
+        fast = bench_report(0.2, 2)
+        self.assertEqual(self.compare(fast, bench_report(0.3, 2)), [])
+        self.assertEqual(
+            len(self.compare(fast, bench_report(0.3, 2), min_delta_ms=0)),
+            1
+        )
+
+    def test_query_count_regression(self):
+        """Лишний SQL-запрос - регрессия даже при той же задержке."""
+        regressions = self.compare(bench_report(5.0, 2), bench_report(5.0, 3))
+        self.assertEqual(
+            regressions, ['1000 заказов, repair:index: запросов 2 → 3']
+        )
+        self.assertEqual(
+            self.compare(bench_report(5.0, 2), bench_report(4.0, 1)), []
+        )
+
+    def test_new_pages_and_scales_are_skipped(self):
+        """Страницы и объемы, которых нет в прошлом отчете, не сравниваются."""
+        report = bench_report(50.0, 9, scale='100000', view='api:orders')
+        self.assertEqual(self.compare(bench_report(1.0, 1), report), [])
+
+
+class BenchViewsCommandTest(TransactionTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.data_dir = Path(directory.name)
+        self.addCleanup(cache.clear)
+
+    def run_bench(self, **options):
+        call_command(
+            'bench_views', scales=[20], data_dir=self.data_dir, repeat=2,
+            warmup=0, seed=1, stderr=StringIO(), **options
+        )
+
+    def test_use_database_switches_and_restores(self):
+        """use_database направляет соединение в другой файл и возвращает."""
+        original = connection.settings_dict['NAME']
+        path = self.data_dir / 'other.sqlite3'
+        with use_database(path) as other:
+            self.assertEqual(other.settings_dict['NAME'], str(path))
+            with other.cursor() as cursor:
+                cursor.execute('CREATE TABLE marker (id integer)')
+        self.assertEqual(connection.settings_dict['NAME'], original)
+        self.assertTrue(path.exists())
+        self.assertNotIn('marker', connection.introspection.table_names())
+
+    def test_smoke_run_and_regression_exit(self):
+        """Прогон на маленькой базе дает отчет, а регрессия - ошибку."""
+        report_path = self.data_dir / 'run.json'
+        self.run_bench(output=report_path)
+        self.assertTrue((self.data_dir / 'orders_20.sqlite3').exists())
+        report = json.loads(report_path.read_text(encoding='utf-8'))
+        pages = report['results']['20']
+        self.assertIn('repair:index', pages)
+        self.assertIn('repair:track_order', pages)
+        for result in pages.values():
+            self.assertGreater(result['p95_ms'], 0)
+            self.assertGreater(result['content_bytes'], 0)
+
+        for result in pages.values():
+            result['p95_ms'] = 0.001
+            result['queries'] = 0
+        report_path.write_text(json.dumps(report), encoding='utf-8')
+        with self.assertRaisesMessage(
+            CommandError, 'Регрессии производительности'
+        ):
+            self.run_bench(
+                output=self.data_dir / 'new.json', baseline=report_path,
+                min_delta_ms=0
+            )
+
+    def test_rebuild_recreates_database(self):
+        """--rebuild создает базу заново, без строк прошлого набора."""
+        path = self.data_dir / 'orders_20.sqlite3'
+        self.run_bench(output=self.data_dir / 'first.json')
+        with use_database(path):
+            Customer.objects.create(name='Лишний', phone='0')
+            customers = Customer.objects.count()
+        self.run_bench(output=self.data_dir / 'second.json', rebuild=True)
+        with use_database(path):
+            self.assertFalse(Customer.objects.filter(name='Лишний').exists())
+            self.assertEqual(Customer.objects.count(), customers - 1)
+            self.assertEqual(RepairOrder.objects.count(), 20)
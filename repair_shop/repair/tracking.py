@@ -0,0 +1,85 @@
+"""Публичная страница отслеживания заказа /track/<код>/ и ее кэш.
+
+Страница целиком берется из кэша по коду, без запросов к базе.
+Сохранение или удаление заказа удаляет ее (см. signals.py), а правка
+справочников меняет их версию, которая входит в ключ: переименованный
+статус или мастерская появятся на странице сразу. Удаление видно
+другим воркерам только в общем кэше, поэтому LocMemCache для
+нескольких процессов не годится (см. checks.py). Изменения в обход
+модели (QuerySet.update) страница увидит не позже чем через
+TRACKING_CACHE_TIMEOUT секунд.
+
+Данных клиента на странице нет: код знает только он сам, но ссылку
+могут переслать или подобрать.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.shortcuts import get_object_or_404
+from django.template.loader import render_to_string
+
+from .metrics import record_cache
+from .models import RepairOrder
+from .references import attach_references, current_version
+
+TRACK_TEMPLATE = 'repair/track.html'
+KEY_PREFIX = 'track'
+
+# Все, что показывает страница; описание неисправности и клиент
+# в нее не входят
+TRACK_FIELDS = (
+    'tracking_code', 'appliance_type', 'appliance_brand', 'appliance_model',
+    'workshop', 'status', 'estimated_cost', 'final_cost', 'created_at',
+    'accepted_at', 'completed_at',
+)
+
+
+def tracking_cache_key(code, staff, version=None):
+    # Для сотрудников шапка сайта содержит служебные ссылки
+    if version is None:
+        version = current_version()
+    return f'{KEY_PREFIX}:{code}:{version}:{int(staff)}'
+
+
+def get_tracked_order(code):
+    """Заказ по коду одним запросом по уникальному индексу; иначе 404"""
+    order = get_object_or_404(
+        RepairOrder.objects.only(*TRACK_FIELDS), tracking_code=code
+    )
+    attach_references([order])
+    return order
+
+
+def render_tracking_page(request, code):
+    """HTML страницы отслеживания; рендерится при промахе кэша"""
+    key = tracking_cache_key(code, request.user.is_staff)
+    html = cache.get(key)
+    if html is not None:
+        record_cache('tracking', hits=1, misses=0)
+        return html
+    record_cache('tracking', hits=0, misses=1)
+    html = render_to_string(
+        TRACK_TEMPLATE, {'order': get_tracked_order(code)}, request
+    )
+    cache.set(key, html, settings.TRACKING_CACHE_TIMEOUT)
+    return html
+
+
+def drop_tracking_pages(codes):
+    version = current_version()
+    cache.delete_many([
+        tracking_cache_key(code, staff, version)
+        for code in codes
+        for staff in (False, True)
+    ])
+
+
+def invalidate_tracking_pages(codes):
+    """Удаляет страницы заказов сразу и еще раз после коммита.
+
+    Запрос, пришедший до коммита, закэширует страницу со старыми
+    данными; повтор после коммита ее удалит.
+    """
+    codes = list(codes)
+    drop_tracking_pages(codes)
+    transaction.on_commit(lambda: drop_tracking_pages(codes))
@@ -6,7 +6,15 @@ app_name = 'repair'
 
 urlpatterns = [
     path('', views.index, name='index'),
+    path('search/', views.search, name='search'),
+    path('stats/', views.stats_dashboard, name='stats'),
+    path('stats/turnaround/', views.turnaround_report, name='turnaround'),
+    path('export/orders/', views.export_orders, name='export_orders'),
+    path('customers/', views.customer_lookup, name='customer_lookup'),
+    path('customers/<int:customer_id>/',
+         views.customer_detail, name='customer_detail'),
     path('orders/<int:order_id>/', views.order_detail, name='order_detail'),
+    path('track/<str:code>/', views.track_order, name='track_order'),
     path('appliance-type/<slug:appliance_type_slug>/',
          views.appliance_type_orders, name='appliance_type_orders'),
     path('workshop/<int:workshop_id>/',
@@ -0,0 +1,108 @@
+import re
+import secrets
+from contextlib import contextmanager
+
+# Цифры и то, чем их разделяют при записи номера
+PHONE_QUERY = re.compile(r'[\d\s()+-]+')
+
+# Без 0/O, 1/I/L: код диктуют по телефону и переписывают с квитанции
+TRACKING_ALPHABET = '23456789ABCDEFGHJKMNPQRSTUVWXYZ'
+TRACKING_CODE_LENGTH = 10
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Отключает auto_now/auto_now_add у полей дат перечисленных моделей.
+
+    Нужно для массовой загрузки, когда даты создания и изменения берутся
+    из источника, а не из текущего времени. Меняет поля на уровне класса,
+    поэтому годится только для management-команд, а не для веб-процесса.
+    """
+    patched = []
+    for model in models:
+        for field in model._meta.concrete_fields:
+            if getattr(field, 'auto_now', False) or getattr(
+                field, 'auto_now_add', False
+            ):
+                patched.append((field, field.auto_now, field.auto_now_add))
+                field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in patched:
+            field.auto_now = auto_now
+            field.auto_now_add = auto_now_add
+
+
+def normalize_phone(phone):
+    """Телефон для сравнения: только цифры, российские номера с 7.
+
+    «8 (999) 111-22-33», «+7 999 1112233» и «9991112233» дают один
+    и тот же результат 79991112233.
+    """
+    digits = re.sub(r'\D', '', phone or '')
+    if len(digits) == 11 and digits[0] in '78':
+        return '7' + digits[1:]
+    if len(digits) == 10:
+        return '7' + digits
+    return digits
+
+
+# Случайный байт переводится в символ алфавита; байты от 248 (8 * 31)
+# отбрасываются, иначе первые символы алфавита выпадали бы чаще
+_ACCEPTED_BYTES = 256 - 256 % len(TRACKING_ALPHABET)
+_BYTES_TO_ALPHABET = bytes.maketrans(
+    bytes(range(_ACCEPTED_BYTES)),
+    TRACKING_ALPHABET.encode() * (_ACCEPTED_BYTES // len(TRACKING_ALPHABET))
+)
+_REJECTED_BYTES = bytes(range(_ACCEPTED_BYTES, 256))
+
+
+def generate_tracking_codes(count, rng=None):
+    """Список из count случайных кодов отслеживания заказа.
+
+    Коды режутся из одной строки случайных байтов: при загрузке сотен
+    тысяч заказов это в десятки раз быстрее, чем по символу. rng -
+    random.Random для воспроизводимых тестовых данных; без него байты
+    берутся из secrets.
+    """
+    needed = count * TRACKING_CODE_LENGTH
+    symbols = b''
+    while len(symbols) < needed:
+        size = needed - len(symbols) + 16
+        if rng is None:
+            chunk = secrets.token_bytes(size)
+        else:
+            chunk = rng.getrandbits(8 * size).to_bytes(size, 'little')
+        symbols += chunk.translate(_BYTES_TO_ALPHABET, _REJECTED_BYTES)
+    symbols = symbols[:needed].decode()
+    return [
+        symbols[start:start + TRACKING_CODE_LENGTH]
+        for start in range(0, needed, TRACKING_CODE_LENGTH)
+    ]
+
+
+def generate_tracking_code(rng=None):
+    """Случайный код отслеживания заказа; 31^10 вариантов не перебрать"""
+    return generate_tracking_codes(1, rng)[0]
+
+
+def phone_search_key(query):
+    """Нормализованный номер, если строка запроса - полный телефон.
+
+    Для всего остального (имя, часть номера) возвращает None.
+    """
+    if not PHONE_QUERY.fullmatch(query.strip()):
+        return None
+    phone = normalize_phone(query)
+    return phone if len(phone) == 11 else None
+
+
+def accepted_encodings(request):
+    """Кодировки из Accept-Encoding, кроме явно запрещенных q=0"""
+    encodings = set()
+    for item in request.headers.get('Accept-Encoding', '').split(','):
+        coding, _, params = item.strip().partition(';')
+        if not re.fullmatch(r'\s*q\s*=\s*0(\.0*)?\s*', params):
+            encodings.add(coding.strip().lower())
+    return encodings
@@ -1,67 +1,320 @@
-from django.shortcuts import get_object_or_404, render
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import PermissionDenied
+from django.db.models import (
+    Avg, Count, DurationField, ExpressionWrapper, F, Q, Sum
+)
+from django.db.models.functions import Coalesce
+from django.http import (
+    Http404, HttpResponse, HttpResponseBadRequest, StreamingHttpResponse
+)
+from django.shortcuts import get_object_or_404, redirect, render
 
-from .models import ApplianceType, RepairOrder, Workshop
+from . import metrics
+from .conditional import conditional_orders
+from .export import (
+    CONTENT_TYPES, export_chunks, export_filename, export_rows
+)
+from .forms import OrderExportForm
+from .models import Customer, OrderStats, RepairOrder
+from .pagination import ORDERS_PER_PAGE, get_page_or_404, get_window_or_404
+from .references import attach_references, get_appliance_type, get_workshop
+from .search import MAX_SEARCH_PAGE, search_orders
+from .status_log import duration_report
+from .tracking import render_tracking_page
+from .utils import normalize_phone
 
 
+def published_orders():
+    return RepairOrder.objects.published()
+
+
+def appliance_type_published_orders(appliance_type_slug):
+    return RepairOrder.objects.filter(
+        appliance_type__slug=appliance_type_slug,
+        appliance_type__is_published=True,
+        is_published=True
+    )
+
+
+def workshop_published_orders(workshop_id):
+    return published_orders().filter(
+        workshop_id=workshop_id,
+        workshop__is_published=True
+    )
+
+
+@conditional_orders(
+    lambda request: get_window_or_404(request, published_orders())
+)
 def index(request):
     """Главная страница - список заказов на ремонт"""
-    order_list = RepairOrder.objects.select_related(
-        'customer', 'appliance_type', 'workshop', 'master', 'status'
-    ).filter(
-        is_published=True,
-        appliance_type__is_published=True
-    ).order_by('-created_at')[:10]
-    return render(request, 'repair/index.html', {'order_list': order_list})
+    page_obj = get_page_or_404(request, published_orders().cards())
+    attach_references(page_obj.object_list)
+    return render(
+        request,
+        'repair/index.html',
+        {'order_list': page_obj.object_list, 'page_obj': page_obj}
+    )
 
 
+@conditional_orders(
+    lambda request, order_id: published_orders().filter(pk=order_id)
+)
 def order_detail(request, order_id):
     """Детальная информация о заказе на ремонт"""
     order = get_object_or_404(
-        RepairOrder.objects.select_related(
-            'customer', 'appliance_type', 'workshop', 'master', 'status'
-        ),
-        pk=order_id,
-        is_published=True,
-        appliance_type__is_published=True
+        published_orders().select_related('customer', 'master'),
+        pk=order_id
     )
+    attach_references([order])
     return render(request, 'repair/detail.html', {'order': order})
 
 
+@conditional_orders(
+    lambda request, appliance_type_slug: get_window_or_404(
+        request, appliance_type_published_orders(appliance_type_slug)
+    )
+)
 def appliance_type_orders(request, appliance_type_slug):
     """Заказы по типу техники"""
-    appliance_type = get_object_or_404(
-        ApplianceType,
-        slug=appliance_type_slug,
-        is_published=True
+    appliance_type = get_appliance_type(appliance_type_slug)
+    if appliance_type is None or not appliance_type.is_published:
+        raise Http404('Тип техники не найден')
+    page_obj = get_page_or_404(
+        request,
+        appliance_type.orders.cards().filter(is_published=True)
     )
-    order_list = appliance_type.orders.select_related(
-        'customer', 'workshop', 'master', 'status'
-    ).filter(
-        is_published=True
-    ).order_by('-created_at')
+    attach_references(page_obj.object_list)
     return render(
         request,
         'repair/category.html',
-        {'appliance_type': appliance_type, 'order_list': order_list}
+        {
+            'appliance_type': appliance_type,
+            'order_list': page_obj.object_list,
+            'page_obj': page_obj,
+        }
     )
 
 
+@conditional_orders(
+    lambda request, workshop_id: get_window_or_404(
+        request, workshop_published_orders(workshop_id)
+    )
+)
 def workshop_orders(request, workshop_id):
     """Заказы по мастерской"""
-    workshop = get_object_or_404(
-        Workshop,
-        pk=workshop_id,
-        is_published=True
+    workshop = get_workshop(workshop_id)
+    if workshop is None or not workshop.is_published:
+        raise Http404('Мастерская не найдена')
+    page_obj = get_page_or_404(
+        request,
+        published_orders().cards().filter(workshop_id=workshop.pk)
     )
-    order_list = RepairOrder.objects.select_related(
-        'customer', 'appliance_type', 'master', 'status'
-    ).filter(
-        workshop=workshop,
-        is_published=True,
-        appliance_type__is_published=True
-    ).order_by('-created_at')
+    attach_references(page_obj.object_list)
     return render(
         request,
         'repair/workshop.html',
-        {'workshop': workshop, 'order_list': order_list}
+        {
+            'workshop': workshop,
+            'order_list': page_obj.object_list,
+            'page_obj': page_obj,
+        }
+    )
+
+
+def track_order(request, code):
+    """Публичная страница отслеживания заказа по коду"""
+    # Код диктуют по телефону и набирают как попало
+    return HttpResponse(render_tracking_page(request, code.upper()))
+
+
+def search(request):
+    """Поиск заказов по описанию, технике и клиенту"""
+    query = request.GET.get('q', '').strip()
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+    if page > MAX_SEARCH_PAGE:
+        raise Http404('Страница не найдена')
+    order_list = []
+    if query:
+        order_list = search_orders(
+            query, ORDERS_PER_PAGE + 1, (page - 1) * ORDERS_PER_PAGE
+        )
+    return render(
+        request,
+        'repair/search.html',
+        {
+            'query': query,
+            'order_list': order_list[:ORDERS_PER_PAGE],
+            'page': page,
+            'has_next': (
+                len(order_list) > ORDERS_PER_PAGE and page < MAX_SEARCH_PAGE
+            ),
+        }
+    )
+
+
+def stats_breakdown(stats, label, ordering):
+    return stats.values(label=F(label)).annotate(
+        total_orders=Sum('orders'),
+        total_revenue=Sum('revenue')
+    ).order_by(ordering)
+
+
+@staff_member_required
+def stats_dashboard(request):
+    """Сводка по заказам и выручке для сотрудников"""
+    stats = OrderStats.objects.all()
+    years = [day.year for day in stats.dates('month', 'year')]
+    year = request.GET.get('year')
+    if year and year.isdigit() and int(year) in years:
+        year = int(year)
+        stats = stats.filter(month__year=year)
+    else:
+        year = None
+    return render(
+        request,
+        'repair/stats.html',
+        {
+            'years': years,
+            'year': year,
+            'totals': stats.aggregate(
+                total_orders=Sum('orders'),
+                total_revenue=Sum('revenue')
+            ),
+            'by_month': stats_breakdown(stats, 'month', '-month'),
+            'by_workshop': stats_breakdown(
+                stats, 'workshop__name', '-total_orders'
+            ),
+            'by_status': stats_breakdown(
+                stats, 'status__name', 'status__order'
+            ),
+            'by_appliance_type': stats_breakdown(
+                stats, 'appliance_type__title', '-total_orders'
+            ),
+        }
+    )
+
+
+TURNAROUND_GROUPS = {
+    'workshop': 'Мастерская',
+    'master': 'Мастер',
+    'appliance_type': 'Тип техники',
+}
+
+
+@staff_member_required
+def turnaround_report(request):
+    """Среднее время заказов в каждом статусе для сотрудников"""
+    group = request.GET.get('by')
+    if group not in TURNAROUND_GROUPS:
+        group = 'workshop'
+    statuses, rows = duration_report(group)
+    return render(
+        request,
+        'repair/turnaround.html',
+        {
+            'groups': TURNAROUND_GROUPS,
+            'group': group,
+            'group_title': TURNAROUND_GROUPS[group],
+            'statuses': statuses,
+            'rows': rows,
+        }
+    )
+
+
+def order_totals(orders):
+    """Число заказов, сумма и средний срок ремонта одним запросом"""
+    return orders.aggregate(
+        total_orders=Count('pk'),
+        total_cost=Sum('final_cost'),
+        average_turnaround=Avg(
+            ExpressionWrapper(
+                F('completed_at') - Coalesce('accepted_at', 'created_at'),
+                output_field=DurationField()
+            ),
+            filter=Q(completed_at__isnull=False)
+        )
+    )
+
+
+@staff_member_required
+def customer_lookup(request):
+    """Поиск клиента по телефону"""
+    phone = request.GET.get('phone', '').strip()
+    customers = []
+    if phone:
+        customers = list(
+            Customer.objects.filter(
+                phone_normalized=normalize_phone(phone)
+            ).order_by('pk')
+        )
+        if len(customers) == 1:
+            return redirect(customers[0])
+    return render(
+        request,
+        'repair/customer_lookup.html',
+        {'phone': phone, 'customers': customers}
+    )
+
+
+@staff_member_required
+def customer_detail(request, customer_id):
+    """История заказов клиента с итогами для сотрудников"""
+    customer = get_object_or_404(Customer, pk=customer_id)
+    page_obj = get_page_or_404(request, customer.orders.cards())
+    attach_references(page_obj.object_list)
+    totals = order_totals(customer.orders.all())
+    turnaround = totals['average_turnaround']
+    return render(
+        request,
+        'repair/customer.html',
+        {
+            'customer': customer,
+            'totals': totals,
+            'turnaround_days': (
+                turnaround.total_seconds() / 86400 if turnaround else None
+            ),
+            'order_list': page_obj.object_list,
+            'page_obj': page_obj,
+        }
+    )
+
+
+@staff_member_required
+def export_orders(request):
+    """Потоковая выгрузка заказов в CSV или JSON Lines"""
+    form = OrderExportForm(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest(
+            form.errors.as_text(), content_type='text/plain; charset=utf-8'
+        )
+    options = form.cleaned_data
+    export_format = options.pop('format')
+    compress = options.pop('gzip')
+    response = StreamingHttpResponse(
+        export_chunks(export_rows(**options), export_format, compress),
+        content_type=(
+            'application/gzip' if compress else CONTENT_TYPES[export_format]
+        )
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="{export_filename(export_format, compress)}"'
+    )
+    return response
+
+
+def prometheus_metrics(request):
+    """Метрики процесса в формате Prometheus для сотрудников и localhost"""
+    if not settings.METRICS['ENABLED']:
+        raise Http404('Метрики выключены')
+    if not (request.user.is_staff or request.META.get('REMOTE_ADDR')
+            in settings.METRICS['ALLOWED_IPS']):
+        raise PermissionDenied
+    return HttpResponse(
+        metrics.exposition(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
     )
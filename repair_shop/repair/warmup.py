@@ -0,0 +1,75 @@
+"""Прогрев кэшей после деплоя.
+
+Самые посещаемые страницы запрашиваются через WSGI-приложение в этом
+процессе, как обычные запросы: рендер кладет карточки заказов в общий
+кэш, а файлы базы попадают в кэш ОС. Запросы только читают, ключи
+карточек версионируются по updated_at, поэтому прогрев можно повторять
+сколько угодно раз.
+"""
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
+
+from django.db import connections
+from django.urls import reverse
+
+from .benchmarks import wsgi_get
+from .models import ApplianceType, RepairOrder, Workshop
+
+
+# status=None - страница не запрошена: время прогрева вышло
+WarmResult = namedtuple('WarmResult', ['url', 'status', 'duration'])
+
+
+def warm_urls(recent_orders):
+    """Адреса списков и recent_orders последних заказов"""
+    urls = [reverse('repair:index')]
+    urls += [
+        reverse('repair:appliance_type_orders',
+                kwargs={'appliance_type_slug': slug})
+        for slug in ApplianceType.objects.filter(
+            is_published=True
+        ).order_by('pk').values_list('slug', flat=True)
+    ]
+    urls += [
+        reverse('repair:workshop_orders', kwargs={'workshop_id': pk})
+        for pk in Workshop.objects.filter(
+            is_published=True
+        ).order_by('pk').values_list('pk', flat=True)
+    ]
+    urls += [
+        reverse('repair:order_detail', kwargs={'order_id': pk})
+        for pk in RepairOrder.objects.published().order_by(
+            '-created_at', '-pk'
+        ).values_list('pk', flat=True)[:recent_orders]
+    ]
+    return urls
+
+
+def warm(application, urls, workers, budget):
+    """Запрашивает urls в workers потоков; отдает WarmResult по готовности.
+
+    Страницы, до которых очередь не дошла за budget секунд, не
+    запрашиваются: начатые запросы дорабатывают, а остальные
+    возвращаются со status=None.
+    """
+    deadline = time.monotonic() + budget
+
+    def render(url):
+        if time.monotonic() >= deadline:
+            return WarmResult(url, None, 0.0)
+        parts = urlsplit(url)
+        started = time.perf_counter()
+        try:
+            status, _, _ = wsgi_get(application, parts.path, parts.query)
+        finally:
+            # Поток пула живет дольше запроса: его соединения с
+            # CONN_MAX_AGE иначе остались бы открытыми после команды
+            connections.close_all()
+        return WarmResult(url, status, time.perf_counter() - started)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(render, url) for url in urls]
+        for future in as_completed(futures):
+            yield future.result()
@@ -42,11 +42,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'repair_shop.repair.middleware.RequestProfilingMiddleware',
+    'repair_shop.repair.middleware.MetricsMiddleware',
+    'repair_shop.repair.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'repair_shop.repair.middleware.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -75,11 +79,163 @@ WSGI_APPLICATION = 'repair_shop.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+# Соединение живет CONN_MAX_AGE секунд и переиспользуется следующими
+# запросами того же воркера; перед повторным использованием Django
+# проверяет, что оно исправно (CONN_HEALTH_CHECKS). Транзакции
+# начинаются с BEGIN IMMEDIATE (repair_shop/backends/sqlite3): так
+# конкурирующие писатели ждут друг друга, а не получают ошибку.
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'repair_shop.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+        },
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+    }
+}
+
+# Реплики только для чтения: алиасы из DATABASES с копией основной
+# базы. На них уходят чтения публичных страниц (repair/routers.py);
+# пустой список - все запросы идут в default. После записи чтения
+# пользователя REPLICA_STICKY_SECONDS секунд идут в основную базу,
+# поэтому отставание реплик должно быть меньше этого окна.
+
+DATABASE_ROUTERS = ['repair_shop.repair.routers.ReplicaRouter']
+DATABASE_REPLICAS = []
+REPLICA_STICKY_SECONDS = 10
+
+# PRAGMA для каждого нового соединения SQLite (repair/sqlite.py).
+# WAL позволяет читать во время записи; synchronous = NORMAL в режиме
+# WAL не теряет целостность базы, но последние транзакции могут
+# пропасть при отключении питания. busy_timeout - сколько миллисекунд
+# ждать занятую базу вместо немедленной ошибки «database is locked».
+# cache_size в отрицательном виде задается в КиБ на соединение.
+
+SQLITE_PRAGMAS = {
+    'busy_timeout': 5000,
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'cache_size': -20000,
+    'mmap_size': 128 * 1024 * 1024,
+    'temp_store': 'memory',
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# Версию справочников все воркеры читают из кэша, поэтому при
+# нескольких процессах он должен быть общим: REDIS_URL (нужен пакет
+# redis). LocMemCache живет в памяти одного процесса и годится только
+# для runserver и тестов; manage.py check --deploy его не пропустит.
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
     }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'repair-shop',
+        }
+    }
+
+# Карточки заказов версионируются по updated_at и версии справочников,
+# поэтому их можно хранить долго: устаревшая версия просто перестает
+# запрашиваться.
+ORDER_CARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Справочники (статусы, типы техники, мастерские) каждый процесс держит
+# в памяти и перечитывает при смене их версии в кэше, но не реже этого.
+REFERENCE_CACHE_TIMEOUT = 60 * 5
+
+# Страница отслеживания заказа удаляется из кэша при сохранении заказа;
+# срок нужен только для изменений в обход модели (QuerySet.update).
+TRACKING_CACHE_TIMEOUT = 60 * 60
+
+# Админка: число строк списка с фильтрами и варианты фильтров по
+# связанным моделям кэшируются, чтобы не считать их на каждой странице.
+ADMIN_COUNT_CACHE_TIMEOUT = 60 * 5
+ADMIN_FACET_CACHE_TIMEOUT = 60 * 60
+
+
+# Профилирование запросов: число и время SQL, время шаблонов, заголовок
+# Server-Timing и запись медленных запросов в лог. SAMPLE_RATE - доля
+# профилируемых запросов; при ENABLED = False middleware не подключается.
+
+REQUEST_PROFILING = {
+    'ENABLED': DEBUG,
+    'SAMPLE_RATE': 1.0,
+    'SLOW_REQUEST_MS': 500,
+    'WORST_QUERIES': 3,
+}
+
+# Метрики для Prometheus на /metrics (доступны сотрудникам и адресам
+# из ALLOWED_IPS). При нескольких процессах-воркерах задайте общий
+# каталог MULTIPROCESS_DIR (переменная METRICS_MULTIPROCESS_DIR): каждый
+# процесс раз в FLUSH_INTERVAL секунд пишет туда свои значения, а
+# /metrics их складывает. Каталог очищают перед запуском воркеров.
+
+METRICS = {
+    'ENABLED': True,
+    'ALLOWED_IPS': ['127.0.0.1', '::1'],
+    'MULTIPROCESS_DIR': os.environ.get('METRICS_MULTIPROCESS_DIR'),
+    'FLUSH_INTERVAL': 1.0,
+}
+
+# Уведомления клиентов о готовности заказа (outbox, см.
+# repair/notifications.py). Отправляет их команда run_outbox_worker
+# через BACKENDS по каналам; письма уходят через EMAIL_BACKEND.
+
+NOTIFICATIONS = {
+    'READY_STATUS': 'Готов',
+    'BACKENDS': {
+        'email': 'repair_shop.repair.notifications.EmailBackend',
+        'sms': 'repair_shop.repair.notifications.FileSMSBackend',
+    },
+    'SMS_FILE_PATH': BASE_DIR / 'sent_sms' / 'messages.jsonl',
+    'BATCH_SIZE': 500,
+    'LEASE_SECONDS': 60,
+    'MAX_ATTEMPTS': 8,
+    'RETRY_DELAY': 30,
+    'RETRY_MAX_DELAY': 60 * 60,
+}
+
+# Локально письма складываются файлами в EMAIL_FILE_PATH; на сервере
+# здесь указывается SMTP
+EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
+EMAIL_FILE_PATH = BASE_DIR / 'sent_emails'
+DEFAULT_FROM_EMAIL = 'noreply@repair-shop.local'
+
+# Сжатие ответов gzip (CompressionMiddleware): ответы меньше MIN_SIZE
+# байт отдаются как есть, STREAMING_LEVEL - уровень для потоковых,
+# где куски уходят клиенту сразу. Обычные ответы сжимает
+# GZipMiddleware со своим уровнем.
+RESPONSE_COMPRESSION = {
+    'MIN_SIZE': 1024,
+    'STREAMING_LEVEL': 1,
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'repair_shop': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
 }
 
 
@@ -111,8 +267,6 @@ TIME_ZONE = 'UTC'
 
 USE_I18N = True
 
-USE_L10N = True
-
 USE_TZ = True
 
 
@@ -121,6 +275,25 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
+# collectstatic собирает сюда файлы с хэшем содержимого в имени и их
+# сжатые копии .gz/.br. В разработке (DEBUG) статика отдается
+# из STATICFILES_DIRS как есть.
+STATIC_ROOT = os.path.join(BASE_DIR, 'static_root')
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': (
+            'django.contrib.staticfiles.storage.StaticFilesStorage'
+            if DEBUG else
+            'repair_shop.repair.staticfiles.'
+            'CompressedManifestStaticFilesStorage'
+        ),
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
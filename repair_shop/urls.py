@@ -13,11 +13,20 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('repair/', include('repair.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 
+from repair_shop.repair.staticfiles import serve_static
+from repair_shop.repair.views import prometheus_metrics
+
 urlpatterns = [
+    # Без отдельного веб-сервера статику из STATIC_ROOT отдает Django;
+    # в разработке ее перехватывает runserver
+    path(f'{settings.STATIC_URL.strip("/")}/<path:path>', serve_static),
     path('admin/', admin.site.urls),
+    path('metrics', prometheus_metrics, name='metrics'),
     path('pages/', include('repair_shop.pages.urls')),
+    path('api/', include('repair_shop.repair.api_urls')),
     path('', include('repair_shop.repair.urls')),
 ]